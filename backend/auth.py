@@ -1,14 +1,34 @@
 # backend/auth.py
+"""
+Clerk session token verification.
+
+Tokens are verified locally (RS256 signature, exp/nbf with clock skew, azp
+against our origins) with public keys from a cached JWKS, so authenticating a
+request needs no network hop. The JWKS is refreshed in the background and on
+demand when a token carries an unknown kid (key rotation), at most once per
+JWKS_MIN_REFRESH_SECONDS. Verified tokens are remembered until they expire,
+so repeated requests with the same token skip the signature check entirely.
+"""
+import asyncio
+import hashlib
+import logging
 import os
+import time
+from typing import Dict, Optional
+
+import httpx
+import jwt
+from cachetools import LRUCache
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer
-import httpx
-from clerk_backend_api import Clerk
-from clerk_backend_api.jwks_helpers import AuthenticateRequestOptions
 from dotenv import load_dotenv
 
+from .metrics import metrics
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Get Clerk secret key from environment variables
 CLERK_SECRET_KEY = os.getenv("CLERK_SECRET_KEY")
 
@@ -19,18 +39,152 @@ origins = [
     "http://localhost:3000",
 ]
 
-# Initialize Clerk SDK
-clerk_sdk = Clerk(bearer_auth=CLERK_SECRET_KEY)
 
-def get_clerk_request(request: httpx.Request):
+class AuthConfig:
+    """Configuration for local session token verification."""
+
+    def __init__(self):
+        # Backend API JWKS (authenticated with the secret key) unless a public JWKS URL is given
+        self.jwks_url = os.getenv("CLERK_JWKS_URL", "https://api.clerk.com/v1/jwks")
+        # PEM public key for fully networkless verification (takes precedence over the JWKS)
+        self.jwt_key = os.getenv("CLERK_JWT_KEY")
+        self.refresh_interval_seconds = float(os.getenv("JWKS_REFRESH_SECONDS", "3600"))
+        self.min_refresh_interval_seconds = float(os.getenv("JWKS_MIN_REFRESH_SECONDS", "30"))
+        self.clock_skew_seconds = float(os.getenv("AUTH_CLOCK_SKEW_SECONDS", "5"))
+        self.token_cache_size = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+
+
+class TokenVerificationError(Exception):
+    """Raised when a session token cannot be verified."""
+
+
+class JWKSCache:
+    """Clerk signing keys by kid, refreshed periodically and on unknown kids."""
+
+    def __init__(self, config: AuthConfig, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.config = config
+        # Overridable HTTP transport (e.g. the fake issuer's JWKS endpoint)
+        self.transport = transport
+        self._keys: Dict[str, object] = {}
+        # Start of the last fetch, successful or not (rate limits on-demand refreshes)
+        self._attempted_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        if config.jwt_key:
+            self._keys[None] = _load_pem_public_key(config.jwt_key)
+
+    def set_jwks(self, jwks: dict) -> None:
+        """Replace the cached keys with the keys of a JWKS document."""
+        keys = {}
+        for key in jwks.get("keys", []):
+            if key.get("kty") == "RSA" and key.get("use", "sig") == "sig":
+                keys[key.get("kid")] = jwt.algorithms.RSAAlgorithm.from_jwk(key)
+        if not keys:
+            raise TokenVerificationError("JWKS did not contain any signing keys")
+        self._keys = keys
+
+    async def refresh(self) -> None:
+        # Recorded before fetching so a failing JWKS endpoint is not hit by every unknown kid
+        self._attempted_at = time.monotonic()
+        headers = {"Accept": "application/json"}
+        if CLERK_SECRET_KEY and self.config.jwks_url.startswith("https://api.clerk.com"):
+            headers["Authorization"] = f"Bearer {CLERK_SECRET_KEY}"
+        async with httpx.AsyncClient(timeout=10, transport=self.transport) as client:
+            response = await client.get(self.config.jwks_url, headers=headers)
+        if response.status_code != 200:
+            raise TokenVerificationError(f"Failed to load JWKS: HTTP {response.status_code}")
+        self.set_jwks(response.json())
+        metrics.inc("auth.jwks_refreshes")
+        logger.info(f"Loaded JWKS keys={len(self._keys)}")
+
+    async def get_key(self, kid: Optional[str]):
+        if self.config.jwt_key:
+            return self._keys[None]
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+        # Unknown kid: keys may have rotated. Refresh once (single flight, rate limited).
+        async with self._lock:
+            key = self._keys.get(kid)
+            if key is None and time.monotonic() - self._attempted_at >= self.config.min_refresh_interval_seconds:
+                await self.refresh()
+                key = self._keys.get(kid)
+        if key is None:
+            raise TokenVerificationError(f"No signing key matches kid={kid}")
+        return key
+
+    def start(self) -> None:
+        """Start the background refresh loop (no-op with a static CLERK_JWT_KEY)."""
+        if not self.config.jwt_key:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+            self._refresh_task = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            try:
+                async with self._lock:
+                    await self.refresh()
+            except Exception as e:
+                # Keep serving with the keys we have; retry on the next tick or unknown kid
+                logger.error(f"JWKS refresh failed: {e}")
+            await asyncio.sleep(self.config.refresh_interval_seconds)
+
+
+def _load_pem_public_key(pem: str):
+    from cryptography.hazmat.primitives import serialization
+    return serialization.load_pem_public_key(pem.replace("\\n", "\n").encode())
+
+
+class SessionVerifier:
+    """Verifies Clerk session tokens and remembers verified ones until they expire."""
+
+    def __init__(self, config: Optional[AuthConfig] = None):
+        self.config = config or AuthConfig()
+        self.jwks = JWKSCache(self.config)
+        # token digest -> (sub, exp)
+        self._verified: LRUCache = LRUCache(maxsize=self.config.token_cache_size)
+
+    async def verify(self, token: str) -> str:
+        """Return the user id (sub) of a valid session token."""
+        digest = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        cached = self._verified.get(digest)
+        if cached is not None:
+            sub, exp = cached
+            if time.time() < exp + self.config.clock_skew_seconds:
+                metrics.inc("auth.token_cache_hits")
+                return sub
+            del self._verified[digest]
+
+        metrics.inc("auth.token_cache_misses")
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+            key = await self.jwks.get_key(kid)
+            payload = jwt.decode(
+                token,
+                key,
+                algorithms=["RS256"],
+                options={"verify_iss": False, "verify_aud": False, "require": ["exp", "sub"]},
+                leeway=self.config.clock_skew_seconds,
+            )
+        except jwt.InvalidTokenError as e:
+            raise TokenVerificationError(str(e)) from e
+
+        azp = payload.get("azp")
+        if azp is None or azp not in origins:
+            raise TokenVerificationError(f"Authorized party {azp} is not allowed")
+
+        self._verified[digest] = (payload["sub"], payload["exp"])
+        return payload["sub"]
+
+
+# Singleton instance
+session_verifier = SessionVerifier()
 
-    request_state = clerk_sdk.authenticate_request(
-    request,
-        AuthenticateRequestOptions(
-        authorized_parties=origins,
-    )
-    )
-    return request_state
 
 async def get_current_user(request: Request):
     auth_header = request.headers.get('Authorization')
@@ -38,18 +192,11 @@ async def get_current_user(request: Request):
         raise HTTPException(status_code=401, detail="Not authenticated")
 
     try:
-        request_state = get_clerk_request(request)
-
-        if request_state.is_signed_in:
-            # print(request_state.payload['sub'])
-            return request_state.payload['sub']
-        else:
-            raise HTTPException(status_code=401, detail="Invalid token")
-
+        return await session_verifier.verify(auth_header.replace('Bearer ', '', 1))
     except Exception as e:
-        print(f"Authentication error: {e}") #log errors
+        logger.warning(f"Authentication error: {e}") #log errors
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
-        )
\ No newline at end of file
+        )
@@ -0,0 +1,67 @@
+# backend/benchmarks/auth_throughput.py
+"""
+Throughput of the auth dependency (get_current_user).
+
+Tokens come from the fake Clerk issuer in backend/tests, whose JWKS is served
+by an in-process transport, so no network or Clerk account is involved:
+
+  cold     every request carries a new token (RS256 signature check each time)
+  cached   requests repeat --distinct tokens (verified-token cache hits)
+
+Usage:
+    python -m backend.benchmarks.auth_throughput --requests 5000
+"""
+
+import argparse
+import asyncio
+import time
+from types import SimpleNamespace
+
+from .. import auth
+from ..tests.fake_issuer import FakeClerkIssuer
+
+
+def _request(token: str) -> SimpleNamespace:
+    return SimpleNamespace(headers={"Authorization": f"Bearer {token}"})
+
+
+async def _measure(requests: list) -> float:
+    """Seconds per get_current_user call, run sequentially on one event loop."""
+    started = time.perf_counter()
+    for request in requests:
+        await auth.get_current_user(request)
+    return (time.perf_counter() - started) / len(requests)
+
+
+async def _run(count: int, distinct: int) -> None:
+    issuer = FakeClerkIssuer()
+    config = auth.AuthConfig()
+    config.jwt_key = None
+    # get_current_user looks the verifier up at call time
+    auth.session_verifier = auth.SessionVerifier(config)
+    issuer.install(auth.session_verifier)
+
+    cold_tokens = [issuer.issue(f"user_{i}") for i in range(count)]
+    # Fetch the JWKS outside the timed loop
+    await auth.get_current_user(_request(issuer.issue("warmup")))
+    cold = await _measure([_request(token) for token in cold_tokens])
+
+    hot_tokens = [issuer.issue(f"user_{i}") for i in range(distinct)]
+    await _measure([_request(token) for token in hot_tokens])
+    cached = await _measure([_request(hot_tokens[i % distinct]) for i in range(count)])
+
+    print(f"{'mode':>7} {'per call':>10} {'calls/s':>10}")
+    for mode, seconds in (("cold", cold), ("cached", cached)):
+        print(f"{mode:>7} {seconds * 1e6:>8.1f}us {1 / seconds:>10.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--distinct", type=int, default=100, help="tokens cycled through in the cached run")
+    args = parser.parse_args()
+    asyncio.run(_run(args.requests, args.distinct))
+
+
+if __name__ == "__main__":
+    main()
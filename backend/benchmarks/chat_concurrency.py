@@ -0,0 +1,183 @@
+# backend/benchmarks/chat_concurrency.py
+"""
+Concurrent /chat streams on one worker: time to first token and throughput.
+
+Starts the app under uvicorn in a background thread with MODEL_BACKEND=stub
+and drives N simultaneous POST /chat streams at it over HTTP, each on its own
+chat. Reports time to first streamed chunk (p50/p95), stream duration, and
+aggregate throughput, for two model backends:
+
+  async     the StubBackend as configured (awaits between chunks)
+  blocking  the same latency profile, but each chunk wait blocks the event
+            loop, as iterating the synchronous generate_content_stream did
+            (streams then run one after another, so large N takes minutes)
+
+Authentication is bypassed with a dependency override; messages go to the
+database at DATABASE_URL (migrated to head). The benchmark user, its chats
+and their messages are removed afterwards.
+
+Usage:
+    MODEL_BACKEND=stub DATABASE_URL=postgresql://... \\
+        python -m backend.benchmarks.chat_concurrency --streams 1 10 50 200
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import statistics
+import threading
+import time
+import uuid
+
+os.environ.setdefault("MODEL_BACKEND", "stub")
+
+import asyncpg
+import httpx
+import uvicorn
+
+from ..auth import get_current_user
+from ..main import app
+from ..services import chat_service
+from ..services.model_backend import StubBackend
+
+USER_ID = "bench-chat-concurrency"
+
+
+class BlockingStubBackend(StubBackend):
+    """StubBackend whose chunk waits block the event loop (the old synchronous stream)."""
+
+    name = "stub-blocking"
+
+    async def stream(self, *, model, contents, system_instruction=None, temperature=None, max_output_tokens=None,
+                     cached_content=None):
+        contents = self._with_cached_prefix(contents, cached_content)
+        time.sleep(self.config.time_to_first_token_ms / 1000)
+        words = self._response_words(contents, max_output_tokens)
+        per_chunk = max(1, self.config.tokens_per_chunk)
+        chunk_delay = per_chunk / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0
+        for index in range(0, len(words), per_chunk):
+            if index > 0:
+                time.sleep(chunk_delay)
+            yield " ".join(words[index:index + per_chunk]) + " "
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(port: int) -> uvicorn.Server:
+    app.dependency_overrides[get_current_user] = lambda: USER_ID
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def _create_chats(db: asyncpg.Connection, count: int) -> list:
+    await db.execute(
+        "INSERT INTO users (id, email) VALUES ($1, $2) ON CONFLICT DO NOTHING", USER_ID, f"{USER_ID}@example.com"
+    )
+    chat_ids = [f"bench-{uuid.uuid4()}" for _ in range(count)]
+    await db.executemany(
+        "INSERT INTO raven_chats (id, user_id, title, created_at) VALUES ($1, $2, 'benchmark', NOW())",
+        [(chat_id, USER_ID) for chat_id in chat_ids],
+    )
+    return chat_ids
+
+
+async def _cleanup(db: asyncpg.Connection) -> None:
+    chats = "(SELECT id FROM raven_chats WHERE user_id = $1)"
+    for table in ("raven_messages", "chat_summaries", "summary_jobs"):
+        await db.execute(f"DELETE FROM {table} WHERE chat_id IN {chats}", USER_ID)
+    await db.execute("DELETE FROM raven_chats WHERE user_id = $1", USER_ID)
+    await db.execute("DELETE FROM users WHERE id = $1", USER_ID)
+
+
+async def _stream(client: httpx.AsyncClient, chat_id: str) -> tuple:
+    """One /chat turn. Returns (seconds to first chunk, seconds to end, chunks)."""
+    body = {"chatId": chat_id, "messages": [{"role": "user", "parts": [{"type": "text", "text": "Tell me a story"}]}]}
+    started = time.perf_counter()
+    first = None
+    chunks = 0
+    async with client.stream("POST", "/chat", json=body) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            if '"error"' in line:
+                raise RuntimeError(line)
+            if first is None:
+                first = time.perf_counter() - started
+            chunks += 1
+    return first, time.perf_counter() - started, chunks
+
+
+def _percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def _round(base_url: str, chat_ids: list) -> None:
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        started = time.perf_counter()
+        results = await asyncio.gather(*[_stream(client, chat_id) for chat_id in chat_ids])
+        wall = time.perf_counter() - started
+    ttft = [first for first, _, _ in results]
+    total = [seconds for _, seconds, _ in results]
+    chunks = sum(count for _, _, count in results)
+    print(
+        f"{len(chat_ids):>7} {statistics.median(ttft) * 1000:>9.0f}ms {_percentile(ttft, 0.95) * 1000:>9.0f}ms "
+        f"{statistics.median(total) * 1000:>9.0f}ms {len(chat_ids) / wall:>10.1f} {chunks / wall:>10.1f}"
+    )
+
+
+async def _run(database_url: str, port: int, streams: list, backends: list) -> None:
+    db = await asyncpg.connect(database_url)
+    try:
+        await _cleanup(db)
+        for name in backends:
+            chat_service.model_backend = BlockingStubBackend() if name == "blocking" else StubBackend()
+            print(f"\n{name} backend")
+            print(f"{'streams':>7} {'ttft p50':>11} {'ttft p95':>11} {'total p50':>11} {'streams/s':>10} {'chunks/s':>10}")
+            for n in streams:
+                chat_ids = await _create_chats(db, n)
+                # Runs in this thread's loop; the server has its own loop in the uvicorn thread
+                await _round(f"http://127.0.0.1:{port}", chat_ids)
+    finally:
+        await _cleanup(db)
+        await db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--backend", choices=["async", "blocking"], nargs="+", default=["blocking", "async"])
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="stub time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80.0, help="stub generation speed per stream")
+    parser.add_argument("--response-tokens", type=int, default=120)
+    args = parser.parse_args()
+
+    # StubBackendConfig reads these when each backend is built
+    os.environ["STUB_TTFT_MS"] = str(args.ttft_ms)
+    os.environ["STUB_TOKENS_PER_SECOND"] = str(args.tokens_per_second)
+    os.environ["STUB_RESPONSE_TOKENS"] = str(args.response_tokens)
+
+    # One line per request otherwise
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    port = _free_port()
+    server = _start_server(port)
+    try:
+        asyncio.run(_run(os.environ["DATABASE_URL"], port, args.streams, args.backend))
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# backend/benchmarks/history_signing.py
+"""
+History-load signing time vs. number of media rows.
+
+Times SigningService.sign_media_urls, the signing step of one
+GET /api/chats/{chat_id} page, for pages with N media rows: with an empty URL
+cache (every blob signed) and a warm one. The "serial" column is the previous
+behaviour, one credential setup plus one signature per row on the request path.
+
+Cloud Storage is replaced by an in-process signer that sleeps --sign-ms per
+signature (an IAM signBlob round trip) and --credential-ms per credential
+setup, so the numbers are reproducible without GCP credentials.
+
+Usage:
+    python -m backend.benchmarks.history_signing --rows 0 10 50 200
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+
+from ..services.signing_service import SigningConfig, SigningService
+
+
+class _FakeBlob:
+    def __init__(self, name: str, sign_seconds: float):
+        self.name = name
+        self._sign_seconds = sign_seconds
+
+    def generate_signed_url(self, **kwargs) -> str:
+        time.sleep(self._sign_seconds)
+        return f"https://storage.example/{self.name}?X-Goog-Signature=fake"
+
+
+def _service(sign_seconds: float, credential_seconds: float) -> SigningService:
+    service = SigningService(SigningConfig())
+    service._blob = lambda bucket_name, blob_name: _FakeBlob(blob_name, sign_seconds)
+
+    # Built once and shared, like the real credential
+    lock = threading.Lock()
+    credentials = {}
+
+    def get_credentials():
+        with lock:
+            if "shared" not in credentials:
+                time.sleep(credential_seconds)
+                credentials["shared"] = object()
+            return credentials["shared"]
+
+    service.get_credentials = get_credentials
+    return service
+
+
+def _serial(service: SigningService, media_urls, credential_seconds: float) -> None:
+    for media_url in media_urls:
+        time.sleep(credential_seconds)
+        service._blob("bucket", media_url).generate_signed_url()
+
+
+async def _run(rows: list, sign_ms: float, credential_ms: float) -> None:
+    print(f"{'rows':>6} {'serial':>10} {'cold cache':>11} {'warm cache':>11}")
+    for n in rows:
+        media_urls = [f"gs://bucket/uploads/{n}-{i}.png" for i in range(n)]
+        service = _service(sign_ms / 1000, credential_ms / 1000)
+
+        started = time.perf_counter()
+        _serial(service, media_urls, credential_ms / 1000)
+        serial = time.perf_counter() - started
+
+        started = time.perf_counter()
+        await service.sign_media_urls(media_urls)
+        cold = time.perf_counter() - started
+
+        started = time.perf_counter()
+        await service.sign_media_urls(media_urls)
+        warm = time.perf_counter() - started
+        print(f"{n:>6} {serial * 1000:>8.1f}ms {cold * 1000:>9.1f}ms {warm * 1000:>9.2f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[0, 10, 50, 200])
+    parser.add_argument("--sign-ms", type=float, default=30.0)
+    parser.add_argument("--credential-ms", type=float, default=50.0)
+    args = parser.parse_args()
+    asyncio.run(_run(args.rows, args.sign_ms, args.credential_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# backend/benchmarks/partitioned_messages.py
+"""
+Hot message queries on the hash-partitioned raven_messages vs. one table.
+
+Seeds --chats synthetic chats of --messages-per-chat messages (2M rows by
+default) into raven_messages, then copies the whole table into an
+unpartitioned one with the same primary key and (chat_id, timestamp, id)
+index. Then times the per-turn queries for random seeded chats against both:
+
+  context       MessageHistoryService.CONTEXT_QUERY
+  token window  MessageHistoryService.TOKEN_WINDOW_QUERY
+  history page  GET /api/chats/{chat_id} first page
+
+and prints how many partitions a generic (prepared, parameterized) plan of
+each query actually scans. Seeded rows and the copy are removed afterwards
+unless --keep is given.
+
+Usage:
+    DATABASE_URL=postgresql://... python -m backend.benchmarks.partitioned_messages --chats 10000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import time
+
+import asyncpg
+
+from ..routers.raven import MESSAGE_PAGE_SQL
+from ..services.message_service import MessageHistoryService
+
+USER_ID = "bench-partitions"
+CHAT_PREFIX = "bench-part-"
+FLAT_TABLE = "bench_raven_messages_flat"
+
+SEED_CHATS_SQL = """
+    INSERT INTO raven_chats (id, user_id, title, created_at, message_count)
+    SELECT $1 || g, $2, 'benchmark', NOW(), $4 FROM generate_series($3::int, $5::int) g
+"""
+
+SEED_MESSAGES_SQL = """
+    INSERT INTO raven_messages (id, chat_id, user_id, role, content, timestamp, token_count)
+    SELECT c || '-' || m, c, $2, CASE WHEN m % 2 = 0 THEN 'user' ELSE 'model' END,
+           repeat('word ', 20 + m % 80), NOW() - m * INTERVAL '1 second', 40 + m % 120
+    FROM generate_series($3::int, $5::int) g, LATERAL (SELECT $1 || g AS c) chat,
+         generate_series(1, $4::int) m
+"""
+
+CREATE_FLAT_SQL = f"""
+    CREATE TABLE {FLAT_TABLE} (LIKE raven_messages INCLUDING DEFAULTS);
+    ALTER TABLE {FLAT_TABLE} ADD PRIMARY KEY (chat_id, id);
+    CREATE INDEX ON {FLAT_TABLE} (chat_id, timestamp, id);
+"""
+
+QUERIES = [
+    ("context", MessageHistoryService.CONTEXT_QUERY,
+     lambda chat_id: (chat_id, USER_ID, 6000, MessageHistoryService.MAX_SCAN_ROWS)),
+    ("token window", MessageHistoryService.TOKEN_WINDOW_QUERY,
+     lambda chat_id: (chat_id, 0, MessageHistoryService.MAX_SCAN_ROWS, 6000)),
+    ("history page", MESSAGE_PAGE_SQL, lambda chat_id: (chat_id, 101)),
+]
+
+
+def _on_flat_table(query: str) -> str:
+    return re.sub(r"\braven_messages\b", FLAT_TABLE, query)
+
+
+async def _seed(db: asyncpg.Connection, chats: int, per_chat: int, batch: int) -> None:
+    await db.execute("INSERT INTO users (id) VALUES ($1) ON CONFLICT DO NOTHING", USER_ID)
+    await db.execute(CREATE_FLAT_SQL)
+    started = time.perf_counter()
+    for first in range(0, chats, batch):
+        last = min(first + batch, chats) - 1
+        await db.execute(SEED_CHATS_SQL, CHAT_PREFIX, USER_ID, first, per_chat, last)
+        await db.execute(SEED_MESSAGES_SQL, CHAT_PREFIX, USER_ID, first, per_chat, last)
+    # Same rows on both sides, including whatever the database already held
+    await db.execute(f"INSERT INTO {FLAT_TABLE} SELECT * FROM raven_messages")
+    await db.execute(f"ANALYZE raven_messages; ANALYZE {FLAT_TABLE}")
+    total = await db.fetchval(f"SELECT COUNT(*) FROM {FLAT_TABLE}")
+    print(f"Seeded {chats * per_chat} messages in {chats} chats, {total} in total ({time.perf_counter() - started:.0f}s)")
+
+
+async def _cleanup(db: asyncpg.Connection) -> None:
+    await db.execute(f"DROP TABLE IF EXISTS {FLAT_TABLE}")
+    await db.execute("DELETE FROM raven_messages WHERE user_id = $1", USER_ID)
+    await db.execute("DELETE FROM raven_chats WHERE user_id = $1", USER_ID)
+    await db.execute("DELETE FROM users WHERE id = $1", USER_ID)
+
+
+async def _latency(db: asyncpg.Connection, query: str, args, chat_ids: list) -> tuple:
+    statement = await db.prepare(query)
+    latencies = []
+    for chat_id in chat_ids:
+        started = time.perf_counter()
+        await statement.fetch(*args(chat_id))
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+
+
+async def _partitions_scanned(db: asyncpg.Connection, query: str, args: tuple) -> int:
+    """Partitions a generic plan of the query reads when executed (runtime pruning included)."""
+    await db.execute("SET plan_cache_mode = force_generic_plan")
+    try:
+        await db.execute(f"PREPARE bench_generic AS {query}")
+        literals = ", ".join("NULL" if arg is None else f"'{arg}'" for arg in args)
+        plan = await db.fetch(f"EXPLAIN (ANALYZE, COSTS OFF, TIMING OFF, SUMMARY OFF) EXECUTE bench_generic({literals})")
+    finally:
+        await db.execute("DEALLOCATE bench_generic")
+        await db.execute("RESET plan_cache_mode")
+    return len({
+        match.group(0) for row in plan for match in [re.search(r"raven_messages_p\d+", row[0])]
+        if match and "never executed" not in row[0]
+    })
+
+
+async def _run(database_url: str, chats: int, per_chat: int, samples: int, batch: int, keep: bool) -> None:
+    db = await asyncpg.connect(database_url, command_timeout=None)
+    try:
+        await _cleanup(db)
+        await _seed(db, chats, per_chat, batch)
+        rng = random.Random(0)
+        chat_ids = [f"{CHAT_PREFIX}{rng.randrange(chats)}" for _ in range(samples)]
+
+        print(f"{'query':>13} {'partitioned p50':>16} {'p95':>9} {'one table p50':>14} {'p95':>9} {'partitions':>11}")
+        for name, query, args in QUERIES:
+            part_p50, part_p95 = await _latency(db, query, args, chat_ids)
+            flat_p50, flat_p95 = await _latency(db, _on_flat_table(query), args, chat_ids)
+            scanned = await _partitions_scanned(db, query, args(chat_ids[0]))
+            print(
+                f"{name:>13} {part_p50 * 1000:>14.2f}ms {part_p95 * 1000:>7.2f}ms "
+                f"{flat_p50 * 1000:>12.2f}ms {flat_p95 * 1000:>7.2f}ms {scanned:>11}"
+            )
+    finally:
+        if not keep:
+            await _cleanup(db)
+        await db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=10000)
+    parser.add_argument("--messages-per-chat", type=int, default=200)
+    parser.add_argument("--samples", type=int, default=1000, help="random chats queried per measurement")
+    parser.add_argument("--batch", type=int, default=500, help="chats seeded per statement")
+    parser.add_argument("--keep", action="store_true", help="leave the seeded data and the copy in place")
+    args = parser.parse_args()
+    asyncio.run(_run(
+        os.environ["DATABASE_URL"], args.chats, args.messages_per_chat, args.samples, args.batch, args.keep
+    ))
+
+
+if __name__ == "__main__":
+    main()
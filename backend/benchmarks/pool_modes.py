@@ -0,0 +1,112 @@
+# backend/benchmarks/pool_modes.py
+"""
+Context query latency per DB_POOL_MODE.
+
+Builds the app's pool (database.get_db_pool, with the same connection warm-up)
+in each requested mode and runs MessageHistoryService.CONTEXT_QUERY, the
+per-turn history fetch, for random existing chats from --concurrency workers.
+Reports latency p50/p95/p99 (acquire included) and queries per second.
+
+  direct              named prepared statements cached per connection
+  pgbouncer           unnamed statements: parsed and planned on every call
+  pgbouncer_prepared  statement cache on, for pgbouncer >= 1.21 with
+                      max_prepared_statements > 0
+
+Point DATABASE_URL at Postgres for direct, and at pgbouncer (transaction
+pooling) for the pgbouncer modes; against Postgres directly the pgbouncer
+mode still shows the cost of re-planning every query.
+
+Usage:
+    DATABASE_URL=postgresql://... python -m backend.benchmarks.pool_modes --mode direct pgbouncer
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+
+from .. import database
+from ..services.message_service import MessageHistoryService
+
+SAMPLE_CHATS_SQL = """
+    SELECT id, user_id FROM raven_chats
+    WHERE deleted_at IS NULL AND archived_at IS NULL AND message_count > 0
+    ORDER BY random()
+    LIMIT $1
+"""
+
+
+def _percentile(values: list, fraction: float) -> float:
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def _bench(mode: str, chats: list, queries: int, concurrency: int, max_tokens: int) -> None:
+    config = database.DatabasePoolConfig()
+    config.mode = mode
+    config.min_size = config.max_size = concurrency
+    pool = await database.get_db_pool(config)
+    latencies = []
+
+    async def worker(seed: int) -> None:
+        rng = random.Random(seed)
+        for _ in range(queries // concurrency):
+            chat = rng.choice(chats)
+            started = time.perf_counter()
+            async with pool.acquire() as db:
+                await db.fetchrow(
+                    MessageHistoryService.CONTEXT_QUERY,
+                    chat['id'], chat['user_id'], max_tokens, MessageHistoryService.MAX_SCAN_ROWS,
+                )
+            latencies.append(time.perf_counter() - started)
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*[worker(seed) for seed in range(concurrency)])
+        wall = time.perf_counter() - started
+    finally:
+        await pool.close()
+
+    latencies.sort()
+    print(
+        f"{mode:>19} {statistics.median(latencies) * 1000:>8.2f}ms {_percentile(latencies, 0.95) * 1000:>8.2f}ms "
+        f"{_percentile(latencies, 0.99) * 1000:>8.2f}ms {len(latencies) / wall:>8.0f}"
+    )
+
+
+async def _run(modes: list, queries: int, concurrency: int, chat_sample: int, max_tokens: int) -> None:
+    # Same warm-up the app registers at startup
+    database.register_warmup_query(
+        MessageHistoryService.CONTEXT_QUERY, "", "", 0, MessageHistoryService.MAX_SCAN_ROWS
+    )
+    config = database.DatabasePoolConfig()
+    config.mode = "pgbouncer"
+    config.min_size = config.max_size = 1
+    pool = await database.get_db_pool(config)
+    async with pool.acquire() as db:
+        chats = await db.fetch(SAMPLE_CHATS_SQL, chat_sample)
+    await pool.close()
+    if not chats:
+        raise SystemExit("No chats with messages in the database")
+
+    print(f"{len(chats)} chats, {queries} queries, concurrency {concurrency}")
+    print(f"{'mode':>19} {'p50':>10} {'p95':>10} {'p99':>10} {'qps':>8}")
+    for mode in modes:
+        await _bench(mode, chats, queries, concurrency, max_tokens)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=database.DatabasePoolConfig.MODES, nargs="+",
+                        default=[os.getenv("DB_POOL_MODE", "pgbouncer")])
+    parser.add_argument("--queries", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=4, help="workers, and pool size")
+    parser.add_argument("--chats", type=int, default=2000, help="existing chats sampled for the queries")
+    parser.add_argument("--max-tokens", type=int, default=6000)
+    args = parser.parse_args()
+    asyncio.run(_run(args.mode, args.queries, args.concurrency, args.chats, args.max_tokens))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# backend/benchmarks/token_window.py
+"""
+Token-budget window: SQL-side cut vs. fetching the whole chat.
+
+Creates synthetic chats of --sizes messages (inside a transaction that is
+rolled back at the end, so the database is left as it was) and times
+fetching the newest messages that fit --max-tokens:
+
+  python  the previous behaviour: every message of the chat, newest first,
+          shipped to Python and cut at the budget there
+  sql     MessageHistoryService.TOKEN_WINDOW_QUERY: bounded index scan with a
+          cumulative SUM, only rows within budget returned
+
+Both must select the same rows; the benchmark checks that.
+
+Usage:
+    DATABASE_URL=postgresql://... python -m backend.benchmarks.token_window --sizes 100 10000 100000
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+import asyncpg
+
+from ..services.message_service import MessageHistoryService
+from ..services.token_accounting import PENDING_TOKEN_COUNT_SQL
+
+USER_ID = "bench-token-window"
+
+# The query get_recent_messages_by_tokens ran before the budget cut moved into Postgres
+FULL_HISTORY_SQL = f"""
+    SELECT id, role, content, media_type, media_url,
+           {PENDING_TOKEN_COUNT_SQL} AS token_count,
+           EXTRACT(EPOCH FROM timestamp) AS timestamp
+    FROM raven_messages
+    WHERE chat_id = $1
+    ORDER BY timestamp DESC, id DESC
+    OFFSET $2
+"""
+
+# Every 5th message has a pending (NULL) count, estimated from its length like the real pipeline
+SEED_MESSAGES_SQL = """
+    INSERT INTO raven_messages (id, chat_id, user_id, role, content, timestamp, token_count)
+    SELECT $1 || '-' || g, $1, $2, CASE WHEN g % 2 = 0 THEN 'user' ELSE 'model' END,
+           repeat('word ', 50 + g % 100), NOW() - g * INTERVAL '1 second',
+           CASE WHEN g % 5 = 0 THEN NULL ELSE 100 + g % 200 END
+    FROM generate_series(1, $3) g
+"""
+
+
+async def _python_window(db: asyncpg.Connection, chat_id: str, max_tokens: int) -> tuple:
+    rows = await db.fetch(FULL_HISTORY_SQL, chat_id, 0)
+    selected = []
+    tokens = 0
+    for row in rows:
+        message_tokens = int(row['token_count'] or 0)
+        if tokens + message_tokens > max_tokens:
+            break
+        selected.append(row['id'])
+        tokens += message_tokens
+    return list(reversed(selected)), len(rows)
+
+
+async def _sql_window(db: asyncpg.Connection, chat_id: str, max_tokens: int) -> tuple:
+    rows = await db.fetch(
+        MessageHistoryService.TOKEN_WINDOW_QUERY, chat_id, 0, MessageHistoryService.MAX_SCAN_ROWS, max_tokens
+    )
+    return [row['id'] for row in rows], len(rows)
+
+
+async def _time(fn, repeat: int) -> tuple:
+    result = await fn()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await fn()
+    return (time.perf_counter() - started) / repeat, result
+
+
+async def _run(database_url: str, sizes: list, max_tokens: int, repeat: int) -> None:
+    db = await asyncpg.connect(database_url)
+    transaction = db.transaction()
+    await transaction.start()
+    try:
+        await db.execute("INSERT INTO users (id) VALUES ($1) ON CONFLICT DO NOTHING", USER_ID)
+        print(f"{'messages':>9} {'python':>10} {'rows':>7} {'sql':>9} {'rows':>5} {'speedup':>8}")
+        for size in sizes:
+            chat_id = f"bench-{uuid.uuid4()}"
+            await db.execute(
+                "INSERT INTO raven_chats (id, user_id, title, created_at) VALUES ($1, $2, 'benchmark', NOW())",
+                chat_id, USER_ID,
+            )
+            await db.execute(SEED_MESSAGES_SQL, chat_id, USER_ID, size)
+
+            python_seconds, (python_ids, python_rows) = await _time(
+                lambda: _python_window(db, chat_id, max_tokens), repeat
+            )
+            sql_seconds, (sql_ids, sql_rows) = await _time(lambda: _sql_window(db, chat_id, max_tokens), repeat)
+            if python_ids != sql_ids:
+                raise SystemExit(f"{size} messages: windows differ ({len(python_ids)} vs {len(sql_ids)} rows)")
+            print(
+                f"{size:>9} {python_seconds * 1000:>8.2f}ms {python_rows:>7} {sql_seconds * 1000:>7.2f}ms "
+                f"{sql_rows:>5} {python_seconds / sql_seconds:>7.0f}x"
+            )
+    finally:
+        await transaction.rollback()
+        await db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 10000, 100000])
+    parser.add_argument("--max-tokens", type=int, default=6000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(_run(os.environ["DATABASE_URL"], args.sizes, args.max_tokens, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
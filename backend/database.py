@@ -1,5 +1,8 @@
 # backend/database.py
 import os
+import random
+import time
+from typing import List, Optional, Tuple
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
@@ -7,6 +10,8 @@ from dotenv import load_dotenv
 import asyncpg
 from fastapi import Depends, Request
 
+from .db_pool import InstrumentedPool
+
 load_dotenv()
 
 DATABASE_URL = os.environ["DATABASE_URL"]
@@ -16,15 +21,105 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine) # Al
 
 Base = declarative_base() #for models
 
-async def get_db_pool():
+class DatabasePoolConfig:
+    """Configuration for the asyncpg pool (sized per worker process)."""
+
+    MODES = ("direct", "pgbouncer", "pgbouncer_prepared")
+
+    def __init__(self):
+        # direct: straight to Postgres, named prepared statements cached per connection
+        # pgbouncer: transaction pooling, unnamed statements only (no statement cache)
+        # pgbouncer_prepared: pgbouncer >= 1.21 with max_prepared_statements > 0, which
+        #   tracks protocol-level prepared statements across server connections
+        self.mode = os.getenv("DB_POOL_MODE", "pgbouncer").lower()
+        if self.mode not in self.MODES:
+            raise ValueError(f"Unknown DB_POOL_MODE: {self.mode}")
+        self.min_size = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+        self.max_size = int(os.getenv("DB_POOL_MAX_SIZE", str(self._default_max_size())))
+        self.statement_cache_size = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "256"))
+        self.max_queries = int(os.getenv("DB_POOL_MAX_QUERIES", "50000"))
+        self.max_inactive_seconds = float(os.getenv("DB_POOL_MAX_INACTIVE_SECONDS", "300"))
+        # Connections older than this are closed when released (0 disables)
+        self.max_lifetime_seconds = float(os.getenv("DB_POOL_MAX_LIFETIME_SECONDS", "1800"))
+        self.command_timeout = float(os.getenv("DB_COMMAND_TIMEOUT_SECONDS", "30"))
+
+    @staticmethod
+    def _default_max_size() -> int:
+        # Split a connection budget across worker processes when one is given
+        max_connections = os.getenv("DB_MAX_CONNECTIONS")
+        if max_connections:
+            workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+            return max(1, int(max_connections) // max(1, workers))
+        return 10
+
+    @property
+    def statement_cache_enabled(self) -> bool:
+        return self.mode != "pgbouncer"
+
+
+# Read-only hot queries prepared on every new connection so the first request
+# on it doesn't pay for parse/plan (only when statements are cached).
+_warmup_queries: List[Tuple[str, tuple]] = []
+
+
+def register_warmup_query(query: str, *args) -> None:
+    """Register a side-effect free query (with harmless args) to run on new pool connections."""
+    _warmup_queries.append((query, args))
+
+
+class RecyclingConnection(asyncpg.Connection):
+    """Connection that remembers when it was opened, for max-lifetime recycling."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opened_at = time.monotonic()
+        # Small per-connection jitter so connections opened together don't all recycle at once
+        self.lifetime_jitter = random.uniform(0.9, 1.0)
+
+
+def _connection_init(config: DatabasePoolConfig):
+    async def init(conn: asyncpg.Connection) -> None:
+        if not config.statement_cache_enabled:
+            return
+        for query, args in _warmup_queries:
+            try:
+                await conn.fetch(query, *args)
+            except Exception as e:
+                print(f"Connection warm-up query failed: {e}")
+    return init
+
+
+def _connection_reset(config: DatabasePoolConfig):
+    async def reset(conn: RecyclingConnection) -> None:
+        age = time.monotonic() - conn.opened_at
+        if config.max_lifetime_seconds and age > config.max_lifetime_seconds * conn.lifetime_jitter:
+            # Closing here makes the pool drop the connection and open a new one on the next acquire
+            conn.terminate()
+            return
+        # asyncpg's default reset (the pool has already rolled back any open transaction)
+        reset_query = conn.get_reset_query()
+        if reset_query:
+            await conn.execute(reset_query)
+    return reset
+
+
+async def get_db_pool(config: Optional[DatabasePoolConfig] = None):
+    config = config or DatabasePoolConfig()
     try:
-        # Setting statement_cache_size=0 to fix the pgbouncer prepared statement issue
         pool = await asyncpg.create_pool(
-            DATABASE_URL, 
-            min_size=1, 
-            max_size=10,
-            statement_cache_size=0  # This prevents the "prepared statement already exists" error
+            DATABASE_URL,
+            min_size=min(config.min_size, config.max_size),
+            max_size=config.max_size,
+            max_queries=config.max_queries,
+            max_inactive_connection_lifetime=config.max_inactive_seconds,
+            command_timeout=config.command_timeout,
+            # pgbouncer (transaction mode) can't keep named statements; 0 makes asyncpg use unnamed ones
+            statement_cache_size=config.statement_cache_size if config.statement_cache_enabled else 0,
+            connection_class=RecyclingConnection,
+            init=_connection_init(config),
+            reset=_connection_reset(config),
         )
+        print(f"Connection pool mode={config.mode} size={config.min_size}-{config.max_size}")
         return pool
     except Exception as e:
         print(f"Failed to create connection pool: {e}")
@@ -32,7 +127,8 @@ async def get_db_pool():
 
 async def init_db(app): #pass app
     try:
-        app.state.db_pool = await get_db_pool()
+        app.state.db_pool = InstrumentedPool(await get_db_pool())
+        app.state.db_pool.start_watchdog()
         print("Connection pool initialized successfully")
     except Exception as e:
         print(f"Failed to initialize database: {e}")
@@ -43,14 +139,17 @@ async def close_db(app): #pass app
         await app.state.db_pool.close()
         print("Connection pool closed successfully")
 
-async def get_pool(request: Request) -> asyncpg.Pool:
+async def get_pool(request: Request) -> InstrumentedPool:
     # Return the shared pool stored on the app state
     return request.app.state.db_pool
 
-async def get_db(pool: asyncpg.Pool = Depends(get_pool)):
+async def get_db(request: Request, pool: InstrumentedPool = Depends(get_pool)):
+    # Hold time is attributed to the route template (not the raw path, which embeds ids)
+    route = request.scope.get("route")
+    label = f"{request.method} {route.path}" if route is not None else "get_db"
     conn = None
     try:
-        conn = await pool.acquire()
+        conn = await pool.acquire(label=label)
         yield conn
     finally:
         if conn is not None:
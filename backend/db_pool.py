@@ -0,0 +1,171 @@
+# backend/db_pool.py
+"""
+Instrumented wrapper around the asyncpg pool.
+
+Every acquire is labelled with its call site (the route for get_db, otherwise
+the calling module.function) and records how long it waited for a connection
+and how long the connection was held. Pool size, idle, in-use and waiting
+counts are exported as gauges. Connections held longer than
+DB_POOL_LONG_HOLD_SECONDS are logged on release, and a watchdog reports
+connections still held after DB_POOL_LEAK_SECONDS (likely leaks).
+check_no_connection_held() lets model call sites flag a connection held
+across a model call.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import asyncpg
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Labels of the connections held by the current request/task (shared with tasks it spawns)
+_held_labels: contextvars.ContextVar[Optional[List[str]]] = contextvars.ContextVar("held_db_connections", default=None)
+
+
+class PoolInstrumentationConfig:
+    """Thresholds for pool hold-time warnings and leak detection."""
+
+    def __init__(self):
+        self.long_hold_seconds = float(os.getenv("DB_POOL_LONG_HOLD_SECONDS", "5"))
+        self.leak_seconds = float(os.getenv("DB_POOL_LEAK_SECONDS", "60"))
+        self.leak_check_seconds = float(os.getenv("DB_POOL_LEAK_CHECK_SECONDS", "10"))
+
+
+class HeldConnection:
+    """Bookkeeping for one checked-out connection."""
+
+    __slots__ = ("label", "acquired_at", "reported")
+
+    def __init__(self, label: str):
+        self.label = label
+        self.acquired_at = time.monotonic()
+        self.reported = False
+
+
+class _AcquireContext:
+    """Supports both `async with pool.acquire()` and `await pool.acquire()`, like asyncpg's."""
+
+    def __init__(self, pool: "InstrumentedPool", label: str, timeout: Optional[float]):
+        self._pool = pool
+        self._label = label
+        self._timeout = timeout
+        self._conn = None
+
+    def __await__(self):
+        return self._pool._acquire(self._label, self._timeout).__await__()
+
+    async def __aenter__(self) -> asyncpg.Connection:
+        self._conn = await self._pool._acquire(self._label, self._timeout)
+        return self._conn
+
+    async def __aexit__(self, *exc) -> None:
+        conn, self._conn = self._conn, None
+        await self._pool.release(conn)
+
+
+def _caller_label(depth: int = 2) -> str:
+    frame = sys._getframe(depth)
+    module = frame.f_globals.get("__name__", "?")
+    if module.startswith("backend."):
+        module = module[len("backend."):]
+    return f"{module}.{frame.f_code.co_name}"
+
+
+class InstrumentedPool:
+    """asyncpg.Pool wrapper recording acquire wait, hold time per call site and pool saturation."""
+
+    def __init__(self, pool: asyncpg.Pool, config: Optional[PoolInstrumentationConfig] = None):
+        self._pool = pool
+        self.config = config or PoolInstrumentationConfig()
+        self._held: Dict[int, HeldConnection] = {}
+        self._waiting = 0
+        self._watchdog: Optional[asyncio.Task] = None
+        metrics.register_gauge("db_pool.size", pool.get_size)
+        metrics.register_gauge("db_pool.max_size", pool.get_max_size)
+        metrics.register_gauge("db_pool.idle", pool.get_idle_size)
+        metrics.register_gauge("db_pool.in_use", lambda: len(self._held))
+        metrics.register_gauge("db_pool.waiting", lambda: self._waiting)
+
+    def __getattr__(self, name):
+        # Everything not instrumented (get_size, fetch, execute, ...) goes to the real pool
+        return getattr(self._pool, name)
+
+    @property
+    def saturated(self) -> bool:
+        """True while requests are queued for a connection or every connection is in use."""
+        return self._waiting > 0 or (
+            self._pool.get_size() >= self._pool.get_max_size() and self._pool.get_idle_size() == 0
+        )
+
+    def acquire(self, *, timeout: Optional[float] = None, label: Optional[str] = None) -> _AcquireContext:
+        return _AcquireContext(self, label or _caller_label(), timeout)
+
+    async def _acquire(self, label: str, timeout: Optional[float]) -> asyncpg.Connection:
+        started = time.monotonic()
+        self._waiting += 1
+        try:
+            conn = await self._pool.acquire(timeout=timeout)
+        except asyncio.TimeoutError:
+            metrics.inc("db_pool.acquire_timeouts")
+            logger.warning(f"Timed out acquiring a DB connection for {label} after {time.monotonic() - started:.2f}s")
+            raise
+        finally:
+            self._waiting -= 1
+        metrics.observe("db_pool.acquire_wait_seconds", time.monotonic() - started)
+        self._held[id(conn)] = HeldConnection(label)
+        held = _held_labels.get()
+        if held is None:
+            held = []
+            _held_labels.set(held)
+        held.append(label)
+        return conn
+
+    async def release(self, conn: asyncpg.Connection, *, timeout: Optional[float] = None) -> None:
+        entry = self._held.pop(id(conn), None)
+        if entry is not None:
+            hold = time.monotonic() - entry.acquired_at
+            metrics.observe(f"db_pool.hold_seconds.{entry.label}", hold)
+            if hold > self.config.long_hold_seconds:
+                metrics.inc("db_pool.long_held")
+                logger.warning(f"DB connection held {hold:.2f}s by {entry.label}")
+            held = _held_labels.get()
+            if held and entry.label in held:
+                held.remove(entry.label)
+        await self._pool.release(conn, timeout=timeout)
+
+    def start_watchdog(self) -> None:
+        """Periodically report connections held past the leak threshold."""
+        self._watchdog = asyncio.create_task(self._watch())
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.leak_check_seconds)
+            now = time.monotonic()
+            for entry in list(self._held.values()):
+                if not entry.reported and now - entry.acquired_at > self.config.leak_seconds:
+                    entry.reported = True
+                    metrics.inc("db_pool.suspected_leaks")
+                    logger.error(f"DB connection held {now - entry.acquired_at:.0f}s by {entry.label} (possible leak)")
+
+    async def close(self) -> None:
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            await asyncio.gather(self._watchdog, return_exceptions=True)
+            self._watchdog = None
+        await self._pool.close()
+
+
+def check_no_connection_held(operation: str) -> None:
+    """Warn (and count) when the current request holds a DB connection across a model call."""
+    held = _held_labels.get()
+    if held:
+        metrics.inc("db_pool.held_during_model_call")
+        logger.warning(f"DB connection held by {', '.join(held)} during {operation}")
@@ -4,9 +4,17 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from svix.webhooks import Webhook, WebhookVerificationError
 from .routers import raven
-from .database import init_db, close_db, get_db
+from .database import init_db, close_db, get_db, register_warmup_query
 from .pymodels import *
 from .services.system_service import system_service
+from .services.token_accounting import token_accounting
+from .services.summary_jobs import summary_jobs
+from .services.chat_purge import chat_purge
+from .services.chat_archive import chat_archive
+from .services.user_service import user_profiles
+from .services.message_service import MessageHistoryService
+from .metrics import metrics
+from .auth import session_verifier
 import os
 from dotenv import load_dotenv
 import asyncpg
@@ -33,6 +41,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 # --- CORS ---
 
@@ -83,6 +92,8 @@ async def clerk_webhook(request: Request, db: asyncpg.Connection = Depends(get_d
         # Process the event based on its type
         if event_type == "user.created":
             await create_user(db, data)
+        elif event_type == "user.updated":
+            await update_user(db, data)
         else:
             print(f"Unhandled event type: {event_type}")
             return JSONResponse({"message": f"Unhandled event type: {event_type}"}, status_code=200)
@@ -96,6 +107,14 @@ async def clerk_webhook(request: Request, db: asyncpg.Connection = Depends(get_d
         print(f"Error processing webhook: {e}")
         raise HTTPException(status_code=500, detail=f"Error processing webhook: {e}")
 
+@app.get("/metrics")
+async def get_metrics(request: Request):
+    """In-process service metrics (queue depths, latencies, cache hit rates)."""
+    metrics_token = os.getenv("METRICS_TOKEN")
+    if metrics_token and request.headers.get("Authorization") != f"Bearer {metrics_token}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid metrics token")
+    return metrics.snapshot()
+
 async def create_user(db, user_data: Dict):
     """Creates a new user in the database."""
     print("create user data:", user_data)
@@ -117,44 +136,71 @@ async def create_user(db, user_data: Dict):
             VALUES ($1, $2, $3, $4, $5)
             ON CONFLICT (id) DO NOTHING  -- Handle potential duplicates
         ''', user_id, email, first_name, last_name, profile_image_url)
+        # Drop a cached "no profile yet" from chats sent before the webhook arrived
+        user_profiles.invalidate(user_id)
         print(f"User created: {user_id}")
 
     except Exception as e:
         print(f"Error creating user: {e}")
         raise  # Re-raise the exception to be caught by the main webhook handler
 
-# --- Database Schema (Add the 'users' table and 'processed_webhooks' table) ---
-async def create_tables(db):
-    """Creates the necessary database tables."""
-    async with db.acquire() as connection:
-        await connection.execute('''
-            CREATE TABLE IF NOT EXISTS users_raven (
-                id TEXT PRIMARY KEY,
-                email TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                profile_image_url TEXT
-            )
-        ''')
-        # Create a table to track processed webhook events (for idempotency)
-        await connection.execute('''
-            CREATE TABLE IF NOT EXISTS processed_webhooks (
-                event_id TEXT PRIMARY KEY
-            )
-        ''')
-        print("users and processed_webhooks tables created (if they didn't exist).")
+async def update_user(db, user_data: Dict):
+    """Updates (or creates) a user's profile and drops their cached personalization."""
+    try:
+        user_id = user_data['id']
+        email_addresses = user_data.get('email_addresses') or []
+        primary_email_id = user_data.get('primary_email_address_id')
+        email = next(
+            (e['email_address'] for e in email_addresses if e.get('id') == primary_email_id),
+            email_addresses[0]['email_address'] if email_addresses else None,
+        )
+
+        await db.execute('''
+            INSERT INTO users_raven (id, email, first_name, last_name, profile_image_url)
+            VALUES ($1, $2, $3, $4, $5)
+            ON CONFLICT (id) DO UPDATE SET
+                email = EXCLUDED.email,
+                first_name = EXCLUDED.first_name,
+                last_name = EXCLUDED.last_name,
+                profile_image_url = EXCLUDED.profile_image_url
+        ''', user_id, email, user_data.get('first_name'), user_data.get('last_name'),
+            user_data.get('profile_image_url'))
+        user_profiles.invalidate(user_id)
+        print(f"User updated: {user_id}")
+
+    except Exception as e:
+        print(f"Error updating user: {e}")
+        raise  # Re-raise the exception to be caught by the main webhook handler
 
 # --- Event Handlers (Database Connection)---
+# Prepare the per-turn context queries on every new pool connection
+register_warmup_query(MessageHistoryService.CONTEXT_QUERY, "", "", 0, MessageHistoryService.MAX_SCAN_ROWS)
+register_warmup_query(MessageHistoryService.CHAT_STATE_QUERY, "", "")
+
 @app.on_event("startup")
 async def startup():
     await init_db(app)
-    # Use the shared pool initialized on app.state for table creation
-    await create_tables(app.state.db_pool)
-    # Preload system instruction
-    await system_service.get_system_instruction()
+    # Keep Clerk's signing keys cached for local token verification
+    session_verifier.jwks.start()
+    # Load the system instruction and keep revalidating it in the background
+    await system_service.start()
+    # Backfill pending token counts off the request path
+    token_accounting.start(app.state.db_pool)
+    # Summarize long chats off the request path
+    summary_jobs.start(app.state.db_pool)
+    # Purge soft-deleted chats in rate-limited batches
+    chat_purge.start(app.state.db_pool)
+    # Move idle chats into compressed archives
+    chat_archive.start(app.state.db_pool)
 
 @app.on_event("shutdown")
 async def shutdown():
+    await session_verifier.jwks.stop()
+    await system_service.stop()
+    await chat_archive.stop()
+    await chat_purge.stop()
+    await summary_jobs.stop()
+    await token_accounting.stop()
     await close_db(app)  # Ensure the pool is closed
 
 # --- Include Routers ---
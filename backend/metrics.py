@@ -0,0 +1,82 @@
+# backend/metrics.py
+"""
+Minimal in-process metrics registry.
+
+Services record counters, gauges and timing samples here; GET /metrics returns
+a JSON snapshot. Timings keep a bounded reservoir of recent samples per name
+and report count / avg / p50 / p95 / max over it.
+"""
+
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict
+
+
+class MetricsRegistry:
+    def __init__(self, reservoir_size: int = 1024):
+        self._reservoir_size = reservoir_size
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._gauge_callbacks: Dict[str, Callable[[], float]] = {}
+        self._timings: Dict[str, Deque[float]] = {}
+        self._timing_counts: Dict[str, int] = defaultdict(int)
+
+    def inc(self, name: str, value: float = 1) -> None:
+        self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        self._gauges[name] = value
+
+    def register_gauge(self, name: str, callback: Callable[[], float]) -> None:
+        """Register a gauge evaluated lazily on every snapshot."""
+        self._gauge_callbacks[name] = callback
+
+    def observe(self, name: str, value: float) -> None:
+        """Record a sample (seconds for timings)."""
+        samples = self._timings.get(name)
+        if samples is None:
+            samples = self._timings[name] = deque(maxlen=self._reservoir_size)
+        samples.append(value)
+        self._timing_counts[name] += 1
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    @staticmethod
+    def _summarize(samples: Deque[float], total_count: int) -> dict:
+        ordered = sorted(samples)
+        n = len(ordered)
+        return {
+            "count": total_count,
+            "avg": sum(ordered) / n,
+            "p50": ordered[n // 2],
+            "p95": ordered[min(n - 1, int(n * 0.95))],
+            "max": ordered[-1],
+        }
+
+    def snapshot(self) -> dict:
+        gauges = dict(self._gauges)
+        for name, callback in self._gauge_callbacks.items():
+            try:
+                gauges[name] = callback()
+            except Exception:
+                gauges[name] = None
+        return {
+            "counters": dict(self._counters),
+            "gauges": gauges,
+            "timings": {
+                name: self._summarize(samples, self._timing_counts[name])
+                for name, samples in self._timings.items()
+                if samples
+            },
+        }
+
+
+# Singleton instance
+metrics = MetricsRegistry()
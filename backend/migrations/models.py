@@ -1,5 +1,5 @@
 #models.py
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Text, ARRAY
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, DateTime, ForeignKey, Text, ARRAY, LargeBinary, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -55,15 +55,89 @@ class RavenChat(Base):
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
     title = Column(String)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Running counters maintained with each message insert and summary save
+    message_count = Column(Integer, nullable=False, server_default="0")
+    total_tokens = Column(BigInteger, nullable=False, server_default="0")
+    tokens_since_last_summary = Column(BigInteger, nullable=False, server_default="0")
+    last_message_at = Column(DateTime)
+    # Bumped with every message insert and rename; backs the history ETag
+    history_version = Column(BigInteger, nullable=False, server_default="0")
+    # Soft delete: hidden from every query, purged in the background
+    deleted_at = Column(DateTime)
+    # Set while the messages live in raven_chat_archives; cleared on first read
+    archived_at = Column(DateTime)
 
 class RavenMessage(Base):
     __tablename__ = "raven_messages"
+    # Hash-partitioned by chat_id (partitions raven_messages_p0..N are created by migration)
+    __table_args__ = {"postgresql_partition_by": "HASH (chat_id)"}
 
-    id = Column(String, primary_key=True, index=True)
-    chat_id = Column(String, ForeignKey("raven_chats.id"), nullable=False)
+    id = Column(String, primary_key=True)
+    chat_id = Column(String, ForeignKey("raven_chats.id"), primary_key=True)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
     role = Column(String, nullable=False)
     content = Column(Text, nullable=False)
     media_type = Column(String)  # "text", "image", "video", etc. (for future use)
     media_url = Column(Text)      # URL in Cloud Storage (for future use)
-    timestamp = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    timestamp = Column(DateTime, default=datetime.utcnow)
+    token_count = Column(Integer)  # NULL while pending backfill
+
+class RavenChatArchive(Base):
+    __tablename__ = "raven_chat_archives"
+
+    # One compressed record per archived chat (see services/chat_archive.py)
+    chat_id = Column(String, ForeignKey("raven_chats.id"), primary_key=True)
+    user_id = Column(String, nullable=False)
+    payload = Column(LargeBinary, nullable=False)  # zstd-compressed JSON of the raven_messages rows
+    message_count = Column(Integer, nullable=False)
+    raw_bytes = Column(BigInteger, nullable=False)
+    media_urls = Column(ARRAY(Text), nullable=False, server_default="{}")
+    archived_at = Column(DateTime, nullable=False, server_default=func.now())
+
+class ChatSummary(Base):
+    __tablename__ = "chat_summaries"
+
+    id = Column(Integer, primary_key=True)
+    chat_id = Column(String, nullable=False)
+    user_id = Column(String, nullable=False)
+    summary_text = Column(Text, nullable=False)
+    summary_tokens = Column(Integer)
+    start_message_timestamp = Column(DateTime)
+    end_message_timestamp = Column(DateTime)
+    messages_summarized = Column(Integer)
+    version = Column(Integer)
+    created_at = Column(DateTime, server_default=func.now())
+
+class UserRaven(Base):
+    __tablename__ = "users_raven"
+
+    id = Column(Text, primary_key=True)  # Clerk user ID
+    email = Column(Text)
+    first_name = Column(Text)
+    last_name = Column(Text)
+    profile_image_url = Column(Text)
+
+class ProcessedWebhook(Base):
+    __tablename__ = "processed_webhooks"
+
+    event_id = Column(Text, primary_key=True)
+
+class RavenUserVersion(Base):
+    __tablename__ = "raven_user_versions"
+
+    # Bumped whenever the user's chat list changes; backs the chat list ETag
+    user_id = Column(String, primary_key=True)
+    chats_version = Column(BigInteger, nullable=False, server_default="0")
+
+class SummaryJob(Base):
+    __tablename__ = "summary_jobs"
+
+    id = Column(BigInteger, primary_key=True)
+    chat_id = Column(String, nullable=False)
+    user_id = Column(String, nullable=False)
+    status = Column(String, nullable=False, server_default="pending")  # pending, running, failed
+    attempts = Column(Integer, nullable=False, server_default="0")
+    run_after = Column(DateTime, nullable=False, server_default=func.now())
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    started_at = Column(DateTime)
+    last_error = Column(Text)
@@ -0,0 +1,36 @@
+"""Add running message/token counters to raven_chats
+
+Revision ID: 2a5cadf68179
+Revises: 406108848fb4
+Create Date: 2026-10-17 21:05:12.418203
+
+After upgrading, populate the counters for existing chats with:
+    python -m backend.services.chat_counters backfill
+and verify them with:
+    python -m backend.services.chat_counters check
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2a5cadf68179'
+down_revision: Union[str, None] = '406108848fb4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('raven_chats', sa.Column('message_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('raven_chats', sa.Column('total_tokens', sa.BigInteger(), server_default='0', nullable=False))
+    op.add_column('raven_chats', sa.Column('tokens_since_last_summary', sa.BigInteger(), server_default='0', nullable=False))
+    op.add_column('raven_chats', sa.Column('last_message_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('raven_chats', 'last_message_at')
+    op.drop_column('raven_chats', 'tokens_since_last_summary')
+    op.drop_column('raven_chats', 'total_tokens')
+    op.drop_column('raven_chats', 'message_count')
@@ -0,0 +1,144 @@
+"""Hash-partition raven_messages by chat_id
+
+Revision ID: a6c3e9f1d2b8
+Revises: f3b8d2a61c07
+Create Date: 2026-10-18 02:14:05.771930
+
+Every per-chat read and write (history pages, the context window, summaries,
+token backfill, purge) filters on chat_id, so each touches one partition, and
+vacuum and index maintenance work on partition-sized pieces. The primary key
+becomes (chat_id, id): unique constraints on a partitioned table must include
+the partition key.
+
+Migration path: the partitioned table is created next to the existing one and
+filled chat by chat in autocommit batches while the app keeps serving. A short
+final transaction then blocks writes to the old table, copies the rows of chats
+written to since the copy started, syncs token counts backfilled meanwhile and
+swaps the tables. Rows removed by the chat purge during the copy come back and
+are purged again.
+
+The partition count defaults to 16; pass `-x raven_messages_partitions=N` to
+choose another. Changing it later means repartitioning.
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6c3e9f1d2b8'
+down_revision: Union[str, None] = 'f3b8d2a61c07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DEFAULT_PARTITIONS = 16
+COPY_BATCH_CHATS = 500
+# Messages are stamped with their transaction's start time, so a chat written by a
+# transaction that began shortly before the copy started still counts as changed
+COPY_MARGIN = "INTERVAL '10 minutes'"
+
+COLUMNS = "id, chat_id, user_id, role, content, media_type, media_url, timestamp, token_count"
+
+
+def _columns():
+    return [
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('chat_id', sa.String(), nullable=False),
+        sa.Column('user_id', sa.String(), nullable=False),
+        sa.Column('role', sa.String(), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('media_type', sa.String(), nullable=True),
+        sa.Column('media_url', sa.Text(), nullable=True),
+        sa.Column('timestamp', sa.DateTime(), nullable=True),
+        sa.Column('token_count', sa.Integer(), nullable=True),
+    ]
+
+
+def _create_message_indexes(table: str, prefix: str) -> None:
+    op.create_index(f'{prefix}ix_raven_messages_chat_timestamp', table, ['chat_id', 'timestamp', 'id'], unique=False)
+    op.create_index(f'{prefix}ix_raven_messages_pending_tokens', table, ['timestamp'], unique=False,
+                    postgresql_where=sa.text('token_count IS NULL'))
+    op.create_index(f'{prefix}ix_raven_messages_media_url', table, ['media_url'], unique=False,
+                    postgresql_where=sa.text('media_url IS NOT NULL'))
+
+
+def _rename_message_indexes(prefix: str) -> None:
+    for name in ('raven_messages_pkey', 'ix_raven_messages_chat_timestamp',
+                 'ix_raven_messages_pending_tokens', 'ix_raven_messages_media_url'):
+        op.execute(f'ALTER INDEX {prefix}{name} RENAME TO {name}')
+    for name in ('raven_messages_chat_id_fkey', 'raven_messages_user_id_fkey'):
+        op.execute(f'ALTER TABLE raven_messages RENAME CONSTRAINT {prefix}{name} TO {name}')
+
+
+def upgrade() -> None:
+    partitions = int(context.get_x_argument(as_dictionary=True).get('raven_messages_partitions', DEFAULT_PARTITIONS))
+    op.create_table('raven_messages_partitioned',
+    *_columns(),
+    sa.ForeignKeyConstraint(['chat_id'], ['raven_chats.id'], name='part_raven_messages_chat_id_fkey'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name='part_raven_messages_user_id_fkey'),
+    sa.PrimaryKeyConstraint('chat_id', 'id', name='part_raven_messages_pkey'),
+    postgresql_partition_by='HASH (chat_id)'
+    )
+    for remainder in range(partitions):
+        op.execute(
+            f'CREATE TABLE raven_messages_p{remainder} PARTITION OF raven_messages_partitioned '
+            f'FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})'
+        )
+    _create_message_indexes('raven_messages_partitioned', 'part_')
+
+    # Bulk copy while the app keeps reading and writing the old table
+    conn = op.get_bind()
+    with op.get_context().autocommit_block():
+        copy_started = conn.execute(sa.text('SELECT NOW()')).scalar()
+        last_id = ''
+        while True:
+            chat_ids = conn.execute(
+                sa.text('SELECT id FROM raven_chats WHERE id > :last_id ORDER BY id LIMIT :limit'),
+                {'last_id': last_id, 'limit': COPY_BATCH_CHATS},
+            ).scalars().all()
+            if not chat_ids:
+                break
+            conn.execute(sa.text(f"""
+                INSERT INTO raven_messages_partitioned ({COLUMNS})
+                SELECT {COLUMNS} FROM raven_messages WHERE chat_id = ANY(:chat_ids)
+                ON CONFLICT DO NOTHING
+            """), {'chat_ids': list(chat_ids)})
+            last_id = chat_ids[-1]
+
+    # Catch up and swap; reads continue, writes wait for the swap
+    op.execute('LOCK TABLE raven_messages IN SHARE ROW EXCLUSIVE MODE')
+    conn.execute(sa.text(f"""
+        INSERT INTO raven_messages_partitioned ({COLUMNS})
+        SELECT {COLUMNS} FROM raven_messages
+        WHERE chat_id IN (
+            SELECT id FROM raven_chats WHERE last_message_at >= :copy_started - {COPY_MARGIN}
+        )
+        ON CONFLICT DO NOTHING
+    """), {'copy_started': copy_started})
+    op.execute("""
+        UPDATE raven_messages_partitioned p
+        SET token_count = m.token_count
+        FROM raven_messages m
+        WHERE p.token_count IS NULL AND m.token_count IS NOT NULL
+          AND m.chat_id = p.chat_id AND m.id = p.id
+    """)
+    op.drop_table('raven_messages')
+    op.rename_table('raven_messages_partitioned', 'raven_messages')
+    _rename_message_indexes('part_')
+
+
+def downgrade() -> None:
+    op.create_table('raven_messages_unpartitioned',
+    *_columns(),
+    sa.ForeignKeyConstraint(['chat_id'], ['raven_chats.id'], name='unpart_raven_messages_chat_id_fkey'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name='unpart_raven_messages_user_id_fkey'),
+    sa.PrimaryKeyConstraint('id', name='unpart_raven_messages_pkey')
+    )
+    op.execute('LOCK TABLE raven_messages IN SHARE ROW EXCLUSIVE MODE')
+    op.execute(f'INSERT INTO raven_messages_unpartitioned ({COLUMNS}) SELECT {COLUMNS} FROM raven_messages')
+    _create_message_indexes('raven_messages_unpartitioned', 'unpart_')
+    op.drop_table('raven_messages')  # drops the partitions with it
+    op.rename_table('raven_messages_unpartitioned', 'raven_messages')
+    _rename_message_indexes('unpart_')
+    op.create_index(op.f('ix_raven_messages_id'), 'raven_messages', ['id'], unique=False)
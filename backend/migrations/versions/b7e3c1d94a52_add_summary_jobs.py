@@ -0,0 +1,44 @@
+"""Add summary_jobs queue for background summarization
+
+Revision ID: b7e3c1d94a52
+Revises: 2a5cadf68179
+Create Date: 2026-10-17 22:40:37.905114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e3c1d94a52'
+down_revision: Union[str, None] = '2a5cadf68179'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('summary_jobs',
+    sa.Column('id', sa.BigInteger(), sa.Identity(), nullable=False),
+    sa.Column('chat_id', sa.String(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('status', sa.String(), server_default='pending', nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('run_after', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # At most one queued or running job per chat; concurrent triggers collapse into it
+    op.create_index('uq_summary_jobs_active_chat', 'summary_jobs', ['chat_id'], unique=True,
+                    postgresql_where=sa.text("status IN ('pending', 'running')"))
+    op.create_index('ix_summary_jobs_pending', 'summary_jobs', ['run_after'], unique=False,
+                    postgresql_where=sa.text("status = 'pending'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_summary_jobs_pending', table_name='summary_jobs')
+    op.drop_index('uq_summary_jobs_active_chat', table_name='summary_jobs')
+    op.drop_table('summary_jobs')
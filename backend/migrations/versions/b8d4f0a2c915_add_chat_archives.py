@@ -0,0 +1,60 @@
+"""Archive cold chats into compressed per-chat records
+
+Revision ID: b8d4f0a2c915
+Revises: a6c3e9f1d2b8
+Create Date: 2026-10-18 03:02:48.530612
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d4f0a2c915'
+down_revision: Union[str, None] = 'a6c3e9f1d2b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Set while the chat's messages live in raven_chat_archives instead of raven_messages
+    op.add_column('raven_chats', sa.Column('archived_at', sa.DateTime(), nullable=True))
+    op.create_table('raven_chat_archives',
+    sa.Column('chat_id', sa.String(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=False),
+    # zstd-compressed JSON of the chat's raven_messages rows
+    sa.Column('payload', sa.LargeBinary(), nullable=False),
+    sa.Column('message_count', sa.Integer(), nullable=False),
+    sa.Column('raw_bytes', sa.BigInteger(), nullable=False),
+    # Uploads referenced by the archived messages (the purge checks them before deleting objects)
+    sa.Column('media_urls', postgresql.ARRAY(sa.Text()), server_default='{}', nullable=False),
+    sa.Column('archived_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['chat_id'], ['raven_chats.id'], ),
+    sa.PrimaryKeyConstraint('chat_id')
+    )
+    # Already compressed: store out of line without another (futile) pglz pass
+    op.execute('ALTER TABLE raven_chat_archives ALTER COLUMN payload SET STORAGE EXTERNAL')
+    op.create_index('ix_raven_chat_archives_media_urls', 'raven_chat_archives', ['media_urls'],
+                    unique=False, postgresql_using='gin')
+
+    with op.get_context().autocommit_block():
+        # Archive sweep: live, unarchived chats ordered by last activity
+        op.create_index('ix_raven_chats_archive_candidates', 'raven_chats', ['last_message_at'],
+                        unique=False, postgresql_where=sa.text('archived_at IS NULL AND deleted_at IS NULL'),
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    # Archived chats must be rehydrated first; refuse to drop their messages
+    archived = op.get_bind().execute(sa.text('SELECT COUNT(*) FROM raven_chat_archives')).scalar()
+    if archived:
+        raise RuntimeError(f"{archived} chats are archived; rehydrate them before downgrading")
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_raven_chats_archive_candidates', table_name='raven_chats',
+                      postgresql_concurrently=True, if_exists=True)
+    op.drop_index('ix_raven_chat_archives_media_urls', table_name='raven_chat_archives')
+    op.drop_table('raven_chat_archives')
+    op.drop_column('raven_chats', 'archived_at')
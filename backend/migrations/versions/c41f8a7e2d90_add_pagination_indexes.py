@@ -0,0 +1,37 @@
+"""Add keyset pagination indexes for chats and messages
+
+Revision ID: c41f8a7e2d90
+Revises: b7e3c1d94a52
+Create Date: 2026-10-17 23:18:44.120457
+
+Built CONCURRENTLY so existing tables stay writable during the upgrade.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41f8a7e2d90'
+down_revision: Union[str, None] = 'b7e3c1d94a52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        # GET /api/chats: WHERE user_id = $1 AND (created_at, id) < cursor ORDER BY created_at DESC, id DESC
+        op.create_index('ix_raven_chats_user_created', 'raven_chats', ['user_id', 'created_at', 'id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        # GET /api/chats/{chat_id} and the context window: WHERE chat_id = $1 ORDER BY timestamp DESC, id DESC
+        op.create_index('ix_raven_messages_chat_timestamp', 'raven_messages', ['chat_id', 'timestamp', 'id'],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_raven_messages_chat_timestamp', table_name='raven_messages',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_raven_chats_user_created', table_name='raven_chats',
+                      postgresql_concurrently=True, if_exists=True)
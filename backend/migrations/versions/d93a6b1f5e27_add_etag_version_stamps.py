@@ -0,0 +1,32 @@
+"""Add version stamps backing chat list and history ETags
+
+Revision ID: d93a6b1f5e27
+Revises: c41f8a7e2d90
+Create Date: 2026-10-17 23:52:09.664318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd93a6b1f5e27'
+down_revision: Union[str, None] = 'c41f8a7e2d90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('raven_chats', sa.Column('history_version', sa.BigInteger(), server_default='0', nullable=False))
+    op.create_table('raven_user_versions',
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('chats_version', sa.BigInteger(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('raven_user_versions')
+    op.drop_column('raven_chats', 'history_version')
@@ -0,0 +1,77 @@
+"""Add chat_summaries, token_count, webhook tables and hot-path indexes
+
+Revision ID: e5a2f19c7b34
+Revises: d93a6b1f5e27
+Create Date: 2026-10-18 00:41:27.305816
+
+chat_summaries, raven_messages.token_count, users_raven and processed_webhooks
+were created outside of migrations (users_raven/processed_webhooks by DDL at
+app startup), so they are created only if missing. Indexes are built
+CONCURRENTLY so existing tables stay writable during the upgrade.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a2f19c7b34'
+down_revision: Union[str, None] = 'd93a6b1f5e27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('users_raven',
+    sa.Column('id', sa.Text(), nullable=False),
+    sa.Column('email', sa.Text(), nullable=True),
+    sa.Column('first_name', sa.Text(), nullable=True),
+    sa.Column('last_name', sa.Text(), nullable=True),
+    sa.Column('profile_image_url', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    if_not_exists=True
+    )
+    # Clerk webhook event ids already handled (idempotency)
+    op.create_table('processed_webhooks',
+    sa.Column('event_id', sa.Text(), nullable=False),
+    sa.PrimaryKeyConstraint('event_id'),
+    if_not_exists=True
+    )
+    op.create_table('chat_summaries',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('chat_id', sa.String(), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('summary_text', sa.Text(), nullable=False),
+    sa.Column('summary_tokens', sa.Integer(), nullable=True),
+    sa.Column('start_message_timestamp', sa.DateTime(), nullable=True),
+    sa.Column('end_message_timestamp', sa.DateTime(), nullable=True),
+    sa.Column('messages_summarized', sa.Integer(), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    if_not_exists=True
+    )
+    # NULL = pending; backfilled by the token accounting pipeline
+    op.execute('ALTER TABLE raven_messages ADD COLUMN IF NOT EXISTS token_count INTEGER')
+    # Deployments that already had the column may have created it NOT NULL
+    op.execute('ALTER TABLE raven_messages ALTER COLUMN token_count DROP NOT NULL')
+
+    with op.get_context().autocommit_block():
+        # Latest summary of a chat: WHERE chat_id = $1 AND user_id = $2 ORDER BY version DESC LIMIT 1
+        op.create_index('ix_chat_summaries_chat_user_version', 'chat_summaries',
+                        ['chat_id', 'user_id', sa.text('version DESC')],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        # Token backfill sweep: WHERE token_count IS NULL AND timestamp < ... (stays tiny)
+        op.create_index('ix_raven_messages_pending_tokens', 'raven_messages', ['timestamp'],
+                        unique=False, postgresql_where=sa.text('token_count IS NULL'),
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_raven_messages_pending_tokens', table_name='raven_messages',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_chat_summaries_chat_user_version', table_name='chat_summaries',
+                      postgresql_concurrently=True, if_exists=True)
+    # Tables and token_count predate this revision in existing deployments, so they are kept
@@ -0,0 +1,43 @@
+"""Soft delete for chats and indexes for the background purge
+
+Revision ID: f3b8d2a61c07
+Revises: e5a2f19c7b34
+Create Date: 2026-10-18 01:26:53.418027
+
+Indexes are built CONCURRENTLY so existing tables stay writable during the upgrade.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b8d2a61c07'
+down_revision: Union[str, None] = 'e5a2f19c7b34'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Set by DELETE /api/chats/{chat_id}; the purge worker removes the chat and its data later
+    op.add_column('raven_chats', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+
+    with op.get_context().autocommit_block():
+        # Purge sweep: WHERE deleted_at IS NOT NULL ORDER BY deleted_at (stays tiny)
+        op.create_index('ix_raven_chats_deleted', 'raven_chats', ['deleted_at'],
+                        unique=False, postgresql_where=sa.text('deleted_at IS NOT NULL'),
+                        postgresql_concurrently=True, if_not_exists=True)
+        # Purge: is an uploaded object still referenced by another chat?
+        op.create_index('ix_raven_messages_media_url', 'raven_messages', ['media_url'],
+                        unique=False, postgresql_where=sa.text('media_url IS NOT NULL'),
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_raven_messages_media_url', table_name='raven_messages',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_raven_chats_deleted', table_name='raven_chats',
+                      postgresql_concurrently=True, if_exists=True)
+    op.drop_column('raven_chats', 'deleted_at')
@@ -46,6 +46,8 @@ class FormattedChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     messages: list[FormattedChatMessage]
     chatId: Optional[str] = None
+    # Same key on a retried send attaches to (or replays) the original generation
+    idempotencyKey: Optional[str] = Field(default=None, max_length=128)
 
 class ChatCreateRequest(BaseModel):
     user_id: str  # Get from Clerk
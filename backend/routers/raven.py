@@ -1,15 +1,21 @@
 # backend/routers/raven.py
 from httpx import request
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from fastapi.responses import StreamingResponse
 from ..pymodels import PresignedUrlRequest, PresignedUrlResponse, ChatRequest, ChatCreateRequest, ChatCreateResponse, Chat, ChatMessage, ChatRenameRequest
 from ..database import get_db, get_pool
 from ..auth import get_current_user
 import asyncpg
 from ..services.chat_service import generate_stream, add_messages_to_db
-from ..utils import convert_storage_path
+from ..services.message_service import context_cache
+from ..services.chat_archive import chat_archive
+from ..services.chat_flights import chat_flights
+from ..services.prompt_cache import prompt_cache
+from ..services.signing_service import signing_service
+from ..utils import convert_storage_path, encode_cursor, decode_cursor
+import asyncio
 import uuid
-from typing import List
+from typing import List, Optional
 from google.cloud import storage
 import os
 from uuid import uuid4
@@ -23,29 +29,45 @@ from google.oauth2 import service_account
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-# --- Google Cloud Storage Setup ---
-storage_client = storage.Client()
-# --- Google Cloud Storage Setup ---
-
 MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB (same as frontend)
 
-import datetime
-import google.auth.impersonated_credentials
-import google.auth.transport.requests
-
-def get_impersonated_credentials():
-    scopes = ['https://www.googleapis.com/auth/cloud-platform']
-    credentials, project = google.auth.default(scopes=scopes)
-    if credentials.token is None:
-        credentials.refresh(google.auth.transport.requests.Request())
-    signing_credentials = google.auth.impersonated_credentials.Credentials(
-        source_credentials=credentials,
-        target_principal=credentials.service_account_email,
-        target_scopes=scopes,
-        lifetime=datetime.timedelta(seconds=3600),
-        delegates=[credentials.service_account_email]
-    )
-    return signing_credentials
+# Page sizes for the chat list and message history (default / upper bound per request)
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", "50"))
+CHAT_PAGE_SIZE_MAX = int(os.getenv("CHAT_PAGE_SIZE_MAX", "200"))
+MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", "100"))
+MESSAGE_PAGE_SIZE_MAX = int(os.getenv("MESSAGE_PAGE_SIZE_MAX", "500"))
+
+# Keyset on (created_at, id): each page is a bounded scan of ix_raven_chats_user_created
+CHAT_PAGE_SQL = """
+    SELECT id, user_id, title, created_at AS created_ts, EXTRACT(EPOCH FROM created_at) as created_at
+    FROM raven_chats
+    WHERE user_id = $1 AND deleted_at IS NULL
+    ORDER BY created_ts DESC, id DESC
+    LIMIT $2
+"""
+CHAT_PAGE_AFTER_CURSOR_SQL = """
+    SELECT id, user_id, title, created_at AS created_ts, EXTRACT(EPOCH FROM created_at) as created_at
+    FROM raven_chats
+    WHERE user_id = $1 AND (created_at, id) < ($2, $3) AND deleted_at IS NULL
+    ORDER BY created_ts DESC, id DESC
+    LIMIT $4
+"""
+
+# Keyset on (timestamp, id), newest first: a bounded scan of ix_raven_messages_chat_timestamp
+MESSAGE_PAGE_SQL = """
+    SELECT id, role, content, timestamp AS ts, EXTRACT(EPOCH FROM timestamp) as timestamp, media_type, media_url
+    FROM raven_messages
+    WHERE chat_id = $1
+    ORDER BY ts DESC, id DESC
+    LIMIT $2
+"""
+MESSAGE_PAGE_AFTER_CURSOR_SQL = """
+    SELECT id, role, content, timestamp AS ts, EXTRACT(EPOCH FROM timestamp) as timestamp, media_type, media_url
+    FROM raven_messages
+    WHERE chat_id = $1 AND (timestamp, id) < ($2, $3)
+    ORDER BY ts DESC, id DESC
+    LIMIT $4
+"""
 
 # --- Raven Chat Endpoints ---
 @router.post("/api/upload-url", response_model=PresignedUrlResponse)
@@ -53,25 +75,15 @@ async def create_upload_url(request_body: PresignedUrlRequest, user_id: str = De
     """Generates a presigned URL for uploading a file to GCS."""
     try:
         bucket_name = os.environ["GCS_BUCKET_NAME"]  # Get bucket name from environment variable
-        bucket = storage_client.bucket(bucket_name)
         # Create a unique filename.  Good practice to prefix with user ID.
         blob_name = f"uploads/{user_id}/{uuid4()}-{request_body.filename}"
-        blob = bucket.blob(blob_name)
-
-        credentials=get_impersonated_credentials()
-        # Generate the presigned URL
-        url = blob.generate_signed_url(
-            version="v4",
-            credentials=credentials,
-            expiration=timedelta(days=7),  # URL expires in 7 days
-            method="PUT",  # Allow PUT requests (uploads)
-            content_type=request_body.contentType,
+
+        # Generate the presigned URLs with the shared signing credential
+        url = await asyncio.to_thread(
+            signing_service.sign_upload_url, bucket_name, blob_name, request_body.contentType
         )
-        download_url = blob.generate_signed_url(
-            version="v4",
-            credentials=credentials,
-            expiration=timedelta(days=7),  # URL expires in 7 days
-            method="GET",  # Allow GET requests (downloads)
+        download_url = await asyncio.to_thread(
+            signing_service.sign_download_url, bucket_name, blob_name
         )
         # Return *both* the presigned URL *and* the final GCS URL
         return PresignedUrlResponse(url=url, gcs_url=download_url)
@@ -89,20 +101,89 @@ async def create_chat(chat_create_request: ChatCreateRequest, user_id: str = Dep
         if not user_exists:
             raise HTTPException(status_code=400, detail="User not found")  # Or 404 if appropriate
 
-        await db.execute('''
-            INSERT INTO raven_chats (id, user_id, title, created_at)
-            VALUES ($1, $2, $3, NOW())
-        ''', chat_id, user_id, "New Chat")
+        async with db.transaction():
+            await db.execute('''
+                INSERT INTO raven_chats (id, user_id, title, created_at)
+                VALUES ($1, $2, $3, NOW())
+            ''', chat_id, user_id, "New Chat")
+            await _bump_chats_version(db, user_id)
         return ChatCreateResponse(chat_id=chat_id)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Database error: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to create chat: {e}")
 
+# --- Conditional GET ---
+# raven_chats.history_version is bumped with every message insert and rename;
+# raven_user_versions.chats_version whenever a user's chat list changes.
+BUMP_CHATS_VERSION_SQL = """
+    INSERT INTO raven_user_versions (user_id, chats_version) VALUES ($1, 1)
+    ON CONFLICT (user_id) DO UPDATE SET chats_version = raven_user_versions.chats_version + 1
+"""
+
+CONDITIONAL_CACHE_CONTROL = "private, no-cache"
+
+async def _bump_chats_version(db: asyncpg.Connection, user_id: str) -> None:
+    await db.execute(BUMP_CHATS_VERSION_SQL, user_id)
+
+def _etag(*parts) -> str:
+    return 'W/"' + "-".join(str(part) for part in parts) + '"'
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison of If-None-Match against the current ETag."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in candidates)
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": CONDITIONAL_CACHE_CONTROL})
+# --- Conditional GET ---
+
+def _page_limit(limit: Optional[int], default: int, maximum: int) -> int:
+    return min(limit or default, maximum)
+
+def _decode_cursor_or_400(cursor: Optional[str]):
+    if cursor is None:
+        return None, None
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("/api/chats", response_model=List[Chat])
-async def get_chats(user_id: str = Depends(get_current_user), db: asyncpg.Connection = Depends(get_db)):
+async def get_chats(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user),
+    db: asyncpg.Connection = Depends(get_db)
+):
+    """Newest chats first, one page at a time. X-Next-Cursor holds the cursor for the next (older) page."""
+    page_size = _page_limit(limit, CHAT_PAGE_SIZE, CHAT_PAGE_SIZE_MAX)
+    cursor_ts, cursor_id = _decode_cursor_or_400(cursor)
     try:
-        query = "SELECT id, user_id, title, EXTRACT(EPOCH FROM created_at) as created_at FROM raven_chats WHERE user_id = $1 ORDER BY created_at DESC"  # Get all columns, convert timestamp
-        rows = await db.fetch(query, user_id)
+        # Unchanged chat list: answer 304 from the per-user version stamp alone
+        chats_version = await db.fetchval(
+            "SELECT chats_version FROM raven_user_versions WHERE user_id = $1", user_id
+        )
+        etag = _etag(chats_version or 0)
+        if _etag_matches(request, etag):
+            return _not_modified(etag)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CONDITIONAL_CACHE_CONTROL
+
+        if cursor_ts is None:
+            rows = await db.fetch(CHAT_PAGE_SQL, user_id, page_size + 1)
+        else:
+            rows = await db.fetch(CHAT_PAGE_AFTER_CURSOR_SQL, user_id, cursor_ts, cursor_id, page_size + 1)
+
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            response.headers["X-Next-Cursor"] = encode_cursor(rows[-1]['created_ts'], rows[-1]['id'])
         chats = [Chat(chatId=row['id'], userId=row['user_id'], title=row['title'], createdAt=row['created_at']) for row in rows] # Use a list comprehension
         return chats
     except Exception as e:
@@ -110,51 +191,56 @@ async def get_chats(user_id: str = Depends(get_current_user), db: asyncpg.Connec
         raise HTTPException(status_code=500, detail=f"Failed to retrieve chats: {e}")
 
 @router.get("/api/chats/{chat_id}", response_model=List[ChatMessage])
-async def get_chat_messages(chat_id: str, user_id: str = Depends(get_current_user), db: asyncpg.Connection = Depends(get_db)):
+async def get_chat_messages(
+    chat_id: str,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user),
+    db: asyncpg.Connection = Depends(get_db)
+):
+    """
+    Latest messages of a chat, one page at a time.
+
+    Pages are loaded newest-first and each page is returned in chronological
+    order. X-Next-Cursor holds the cursor for the next (older) page.
+    """
+    page_size = _page_limit(limit, MESSAGE_PAGE_SIZE, MESSAGE_PAGE_SIZE_MAX)
+    cursor_ts, cursor_id = _decode_cursor_or_400(cursor)
     try:
-        chat_query = "SELECT id FROM raven_chats WHERE id = $1 AND user_id = $2"
+        chat_query = "SELECT id, history_version, archived_at FROM raven_chats WHERE id = $1 AND user_id = $2 AND deleted_at IS NULL"
         chat = await db.fetchrow(chat_query, chat_id, user_id)  # Use fetchrow for single row
         if not chat:
             raise HTTPException(status_code=404, detail="Chat not found or access denied")
 
-        query = """
-            SELECT id, role, content, EXTRACT(EPOCH FROM timestamp) as timestamp, media_type, media_url
-            FROM raven_messages
-            WHERE chat_id = $1
-            ORDER BY timestamp ASC
-        """
-        rows = await db.fetch(query, chat_id)
+        # Unchanged history: answer 304 without touching raven_messages. The URL
+        # epoch rolls the ETag before any embedded signed URL could expire.
+        etag = _etag(chat['history_version'], signing_service.url_epoch())
+        if _etag_matches(request, etag):
+            return _not_modified(etag)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CONDITIONAL_CACHE_CONTROL
+        if chat['archived_at']:
+            # Cold chat: restore its messages before the first page is read
+            await chat_archive.rehydrate(db, chat_id)
+
+        if cursor_ts is None:
+            rows = await db.fetch(MESSAGE_PAGE_SQL, chat_id, page_size + 1)
+        else:
+            rows = await db.fetch(MESSAGE_PAGE_AFTER_CURSOR_SQL, chat_id, cursor_ts, cursor_id, page_size + 1)
+
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            response.headers["X-Next-Cursor"] = encode_cursor(rows[-1]['ts'], rows[-1]['id'])
+        rows = list(reversed(rows))
+
+        # Sign every media row at once; recently signed blobs come from the cache
+        signed_urls = await signing_service.sign_media_urls(row['media_url'] for row in rows)
 
         messages = []
         for row in rows:
-            media_url = row['media_url']
-
-            # If we stored gs://, sign a temporary GET URL so the browser can render it
-            if media_url:
-                try:
-                    gs_uri = convert_storage_path(media_url, 'gs_uri')
-                    if gs_uri.startswith('gs://'):
-                        parts = gs_uri.replace('gs://', '').split('/', 1)
-                        if len(parts) == 2:
-                            bucket_name, blob_name = parts
-                            bucket = storage_client.bucket(bucket_name)
-                            blob = bucket.blob(blob_name)
-                            credentials = get_impersonated_credentials()
-                            media_url = blob.generate_signed_url(
-                                version="v4",
-                                credentials=credentials,
-                                expiration=timedelta(days=7),
-                                method="GET",
-                            )
-                        else:
-                            # Malformed gs uri, fallback to public url
-                            media_url = convert_storage_path(media_url, 'public_url')
-                    else:
-                        # Already an https url; keep as is
-                        media_url = convert_storage_path(media_url, 'public_url')
-                except Exception as e:
-                    logger.error(f"Failed to sign media URL for chat history: {e}")
-                    media_url = convert_storage_path(media_url, 'public_url')
+            media_url = signed_urls.get(row['media_url'], row['media_url'])
 
             messages.append(
                 ChatMessage(
@@ -167,6 +253,8 @@ async def get_chat_messages(chat_id: str, user_id: str = Depends(get_current_use
                 )
             )
         return messages
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Database error: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to retrieve messages: {e}")
@@ -175,29 +263,45 @@ async def get_chat_messages(chat_id: str, user_id: str = Depends(get_current_use
 async def rename_chat(chat_id: str, request_body: ChatRenameRequest, user_id: str = Depends(get_current_user), db: asyncpg.Connection = Depends(get_db)):
     try:
         # Check if the chat exists and belongs to the user
-        result = await db.fetchrow("SELECT id FROM raven_chats WHERE id = $1 AND user_id = $2", chat_id, user_id)
+        result = await db.fetchrow("SELECT id FROM raven_chats WHERE id = $1 AND user_id = $2 AND deleted_at IS NULL", chat_id, user_id)
         if not result:
             raise HTTPException(status_code=404, detail="Chat not found or access denied")
 
         # Update the chat title
-        await db.execute("UPDATE raven_chats SET title = $1 WHERE id = $2", request_body.title, chat_id)
+        async with db.transaction():
+            await db.execute(
+                "UPDATE raven_chats SET title = $1, history_version = history_version + 1 WHERE id = $2",
+                request_body.title, chat_id
+            )
+            await _bump_chats_version(db, user_id)
+        context_cache.invalidate(chat_id)
         return {"message": "Chat renamed successfully"}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Database error: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to rename chat: {e}")
 
 @router.delete("/api/chats/{chat_id}")
 async def delete_chat(chat_id: str, user_id: str = Depends(get_current_user), db: asyncpg.Connection = Depends(get_db)):
+    """Soft-delete a chat: it disappears at once; messages, summaries and uploads are purged in the background."""
     async with db.transaction():
         try:
-            chat = await db.fetchrow("SELECT id FROM raven_chats WHERE id = $1 AND user_id = $2", chat_id, user_id)
+            chat = await db.fetchrow("""
+                UPDATE raven_chats SET deleted_at = NOW(), history_version = history_version + 1
+                WHERE id = $1 AND user_id = $2 AND deleted_at IS NULL
+                RETURNING id
+            """, chat_id, user_id)
             if not chat:
                 raise HTTPException(status_code=404, detail="Chat not found or access denied")
 
-            await db.execute("DELETE FROM raven_messages WHERE chat_id = $1", chat_id)
-            await db.execute("DELETE FROM raven_chats WHERE id = $1", chat_id)
+            await _bump_chats_version(db, user_id)
+            context_cache.invalidate(chat_id)
+            prompt_cache.invalidate(chat_id)
             return {"message": "Chat deleted successfully"}
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Database error: {e}")
             raise HTTPException(status_code=500, detail=f"Failed to delete chat: {e}")
@@ -205,23 +309,47 @@ async def delete_chat(chat_id: str, user_id: str = Depends(get_current_user), db
 @router.post("/chat")
 async def chat_endpoint(chat_request: ChatRequest, request: Request, user_id: str = Depends(get_current_user), pool: asyncpg.Pool = Depends(get_pool)):
     # Removed verbose printing of full chat_request to avoid noisy logs
-    if(len(chat_request.messages) >= 1):
-        try:
-            chat_id = chat_request.chatId
-        except (IndexError, AttributeError) as e:
-            logger.error(f"Error extracting chat ID: {e}")
-            raise HTTPException(status_code=400, detail="Invalid chat history format for existing chat.")
-    else:
-        chat_creation_request = ChatCreateRequest(user_id=user_id)
-        async with pool.acquire() as db:
-            created_chat = await create_chat(chat_creation_request, user_id, db)
-            chat_id = created_chat.chat_id
+    idempotency_key = chat_request.idempotencyKey or request.headers.get("Idempotency-Key")
+    flight = None
+    if idempotency_key:
+        # A retry of a send we've already seen streams the original generation instead
+        flight, created = chat_flights.claim(user_id, idempotency_key)
+        if not created:
+            return StreamingResponse(flight.subscribe(), media_type="text/event-stream")
 
+    # A retry after a failed generation reuses the turn the first attempt stored
+    chat_id = chat_flights.stored_turn(user_id, idempotency_key) if flight is not None else None
     try:
-        if chat_id:
-            async with pool.acquire() as db:
-                await add_messages_to_db(db, chat_request, chat_id, user_id)
-        return StreamingResponse(generate_stream(pool, chat_request, request, chat_id, user_id), media_type="text/event-stream")
+        if chat_id is None:
+            chat_id = await _start_chat_turn(chat_request, user_id, pool)
+            if flight is not None:
+                chat_flights.record_turn(user_id, idempotency_key, chat_id)
     except Exception as e:
         logger.error(f"Database error in chat endpoint: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to insert message: {e}")
\ No newline at end of file
+        if flight is not None:
+            chat_flights.fail(user_id, idempotency_key, flight, f"Failed to insert message: {e}")
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail=f"Failed to insert message: {e}")
+
+    if flight is None:
+        return StreamingResponse(generate_stream(pool, chat_request, request, chat_id, user_id), media_type="text/event-stream")
+    # The generation outlives this request so a reconnecting retry can pick it up
+    chat_flights.run(user_id, idempotency_key, flight, generate_stream(pool, chat_request, flight, chat_id, user_id))
+    return StreamingResponse(flight.subscribe(), media_type="text/event-stream")
+
+LIVE_CHAT_SQL = "SELECT 1 FROM raven_chats WHERE id = $1 AND user_id = $2 AND deleted_at IS NULL"
+
+async def _start_chat_turn(chat_request: ChatRequest, user_id: str, pool: asyncpg.Pool) -> str:
+    """Resolve (or create) the chat for a turn and store the new user message. Returns the chat id."""
+    async with pool.acquire() as db:
+        if not chat_request.messages:
+            created_chat = await create_chat(ChatCreateRequest(user_id=user_id), user_id, db)
+            return created_chat.chat_id
+        chat_id = chat_request.chatId
+        if chat_id:
+            message_ids = await add_messages_to_db(db, chat_request, chat_id, user_id)
+            # Nothing stored: a deleted (possibly being purged) or foreign chat gets no new turn
+            if not message_ids and not await db.fetchval(LIVE_CHAT_SQL, chat_id, user_id):
+                raise HTTPException(status_code=404, detail="Chat not found or access denied")
+        return chat_id
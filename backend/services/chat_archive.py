@@ -0,0 +1,242 @@
+# backend/services/chat_archive.py
+"""
+Archival of cold chats.
+
+Most chats are never opened again once they go quiet, yet their messages keep
+occupying raven_messages heap and index pages. Chats idle for longer than
+CHAT_ARCHIVE_AFTER_DAYS are packed into a single zstd-compressed record in
+raven_chat_archives and their rows are removed from raven_messages;
+raven_chats.archived_at marks them. The chat row itself (title, counters,
+history_version) is untouched, so the chat list and ETags don't change.
+
+Reads rehydrate lazily: the history endpoint and the context fetch for /chat
+call rehydrate() when they meet an archived chat, which restores the rows in
+one transaction before the normal query runs. Messages written to an archived
+chat before it is rehydrated simply land in raven_messages next to the
+restored ones.
+
+Like the purge, the worker never exceeds CHAT_ARCHIVE_MAX_ROWS_PER_SECOND and
+pauses whenever the connection pool is saturated.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import List, Optional
+
+import asyncpg
+import zstandard
+
+from ..metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# raven_messages columns kept in an archive payload, in payload order
+ARCHIVE_COLUMNS = ("id", "user_id", "role", "content", "media_type", "media_url", "timestamp", "token_count")
+
+# Live chats idle for longer than $1 days with no summary job outstanding (failed jobs don't count); $2 limit
+ARCHIVE_CANDIDATES_SQL = """
+    SELECT id FROM raven_chats c
+    WHERE archived_at IS NULL AND deleted_at IS NULL
+      AND last_message_at < NOW() - $1::float * INTERVAL '1 day'
+      AND NOT EXISTS (SELECT 1 FROM summary_jobs j WHERE j.chat_id = c.id AND j.status IN ('pending', 'running'))
+    ORDER BY last_message_at
+    LIMIT $2
+"""
+
+ARCHIVED_CHATS_SQL = "SELECT COUNT(*) FROM raven_chats WHERE archived_at IS NOT NULL"
+
+CHAT_MESSAGES_SQL = f"""
+    SELECT {', '.join(ARCHIVE_COLUMNS)} FROM raven_messages
+    WHERE chat_id = $1
+    ORDER BY timestamp, id
+"""
+
+# Locks the chat against concurrent inserts (which update the same row) while it is archived
+LOCK_CHAT_SQL = """
+    SELECT last_message_at FROM raven_chats c
+    WHERE id = $1 AND archived_at IS NULL AND deleted_at IS NULL
+      AND NOT EXISTS (SELECT 1 FROM summary_jobs j WHERE j.chat_id = c.id AND j.status IN ('pending', 'running'))
+    FOR UPDATE
+"""
+
+INSERT_ARCHIVE_SQL = """
+    INSERT INTO raven_chat_archives (chat_id, user_id, payload, message_count, raw_bytes, media_urls)
+    SELECT id, user_id, $2, $3, $4, $5 FROM raven_chats WHERE id = $1
+"""
+
+DELETE_ARCHIVED_MESSAGES_SQL = "DELETE FROM raven_messages WHERE chat_id = $1 AND id = ANY($2::text[])"
+
+# Deleting the archive row locks it, so concurrent rehydrations of one chat run one at a time
+TAKE_ARCHIVE_SQL = "DELETE FROM raven_chat_archives WHERE chat_id = $1 RETURNING payload"
+
+RESTORE_MESSAGES_SQL = """
+    INSERT INTO raven_messages (id, chat_id, user_id, role, content, media_type, media_url, timestamp, token_count)
+    SELECT m.id, $1, m.user_id, m.role, m.content, m.media_type, m.media_url, m.timestamp, m.token_count
+    FROM unnest($2::text[], $3::text[], $4::text[], $5::text[], $6::text[], $7::text[], $8::timestamp[], $9::int[])
+         AS m(id, user_id, role, content, media_type, media_url, timestamp, token_count)
+    ON CONFLICT DO NOTHING
+"""
+
+
+class ChatArchiveConfig:
+    """Configuration for cold-chat archival."""
+
+    def __init__(self):
+        self.enabled = os.getenv("CHAT_ARCHIVE_ENABLED", "true").lower() == "true"
+        # Idle time after which a chat is archived
+        self.after_days = float(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", "30"))
+        self.zstd_level = int(os.getenv("CHAT_ARCHIVE_ZSTD_LEVEL", "9"))
+        self.batch_size = int(os.getenv("CHAT_ARCHIVE_BATCH_SIZE", "50"))
+        self.max_rows_per_second = float(os.getenv("CHAT_ARCHIVE_MAX_ROWS_PER_SECOND", "2000"))
+        self.poll_interval_seconds = float(os.getenv("CHAT_ARCHIVE_POLL_SECONDS", "300"))
+        # How long to back off while the pool is saturated by foreground traffic
+        self.busy_backoff_seconds = float(os.getenv("CHAT_ARCHIVE_BUSY_BACKOFF_SECONDS", "1"))
+
+
+def _encode(rows: List[asyncpg.Record], level: int) -> tuple:
+    """Pack message rows into a zstd frame. Returns (payload, raw size in bytes)."""
+    raw = json.dumps(
+        [[row[column].isoformat() if column == "timestamp" and row[column] else row[column]
+          for column in ARCHIVE_COLUMNS] for row in rows],
+        separators=(",", ":"),
+    ).encode()
+    return zstandard.ZstdCompressor(level=level).compress(raw), len(raw)
+
+
+def _decode(payload: bytes) -> List[list]:
+    """Unpack an archive payload into rows ordered as ARCHIVE_COLUMNS."""
+    rows = json.loads(zstandard.ZstdDecompressor().decompress(payload))
+    timestamp = ARCHIVE_COLUMNS.index("timestamp")
+    for row in rows:
+        if row[timestamp]:
+            row[timestamp] = datetime.fromisoformat(row[timestamp])
+    return rows
+
+
+class ChatArchiveService:
+    """Moves idle chats into compressed archives and restores them on first read."""
+
+    def __init__(self, config: Optional[ChatArchiveConfig] = None):
+        self.config = config or ChatArchiveConfig()
+        self._pool: Optional[asyncpg.Pool] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self, pool: asyncpg.Pool) -> None:
+        """Start the archive worker."""
+        if not self.config.enabled:
+            logger.info("Chat archival disabled")
+            return
+        self._pool = pool
+        self._tasks = [asyncio.create_task(self._worker())]
+        logger.info(f"Chat archive worker started (after_days={self.config.after_days})")
+
+    async def stop(self) -> None:
+        """Stop the worker. Each chat is archived in one transaction, so nothing is left half-moved."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                archived = await self.archive_pending()
+            except Exception as e:
+                logger.error(f"Chat archive sweep failed: {e}")
+                archived = 0
+            if not archived:
+                await asyncio.sleep(self.config.poll_interval_seconds)
+
+    async def archive_pending(self, limit: Optional[int] = None) -> int:
+        """Archive up to `limit` idle chats, oldest first. Returns how many were archived."""
+        async with self._pool.acquire() as db:
+            metrics.set_gauge("chat_archive.archived_chats", await db.fetchval(ARCHIVED_CHATS_SQL))
+            chats = await db.fetch(ARCHIVE_CANDIDATES_SQL, self.config.after_days, limit or self.config.batch_size)
+        archived = 0
+        for chat in chats:
+            try:
+                if await self.archive_chat(chat['id']):
+                    archived += 1
+            except Exception as e:
+                metrics.inc("chat_archive.failures")
+                logger.error(f"Failed to archive chat_id={chat['id']}: {e}")
+        return archived
+
+    async def _wait_for_foreground(self) -> None:
+        # Raw asyncpg pools (scripts) have no saturation signal
+        while getattr(self._pool, "saturated", False):
+            metrics.inc("chat_archive.deferred")
+            await asyncio.sleep(self.config.busy_backoff_seconds)
+
+    async def archive_chat(self, chat_id: str) -> bool:
+        """Move one idle chat's messages into its archive record. Returns False if the chat changed meanwhile."""
+        # Import here to avoid circular imports
+        from .message_service import context_cache
+
+        await self._wait_for_foreground()
+        started = time.monotonic()
+        async with self._pool.acquire() as db:
+            last_message_at = await db.fetchval("SELECT last_message_at FROM raven_chats WHERE id = $1", chat_id)
+            rows = await db.fetch(CHAT_MESSAGES_SQL, chat_id)
+        if not rows:
+            return False
+
+        # Compress without holding a connection
+        payload, raw_bytes = await asyncio.to_thread(_encode, rows, self.config.zstd_level)
+        media_urls = sorted({row['media_url'] for row in rows if row['media_url']})
+
+        async with self._pool.acquire() as db:
+            async with db.transaction():
+                locked_at = await db.fetchval(LOCK_CHAT_SQL, chat_id)
+                if locked_at is None or locked_at != last_message_at:
+                    # Written to, deleted or summarized since the rows were read; retry next sweep
+                    return False
+                await db.execute(INSERT_ARCHIVE_SQL, chat_id, payload, len(rows), raw_bytes, media_urls)
+                await db.execute(DELETE_ARCHIVED_MESSAGES_SQL, chat_id, [row['id'] for row in rows])
+                await db.execute("UPDATE raven_chats SET archived_at = NOW() WHERE id = $1", chat_id)
+        context_cache.invalidate(chat_id)
+
+        metrics.inc("chat_archive.chats")
+        metrics.inc("chat_archive.messages", len(rows))
+        metrics.inc("chat_archive.raw_bytes", raw_bytes)
+        metrics.inc("chat_archive.compressed_bytes", len(payload))
+        logger.debug(f"Archived chat_id={chat_id} messages={len(rows)} bytes={raw_bytes}->{len(payload)}")
+
+        # Rate limit: a chat of N rows takes at least N / max_rows_per_second
+        pause = len(rows) / self.config.max_rows_per_second - (time.monotonic() - started)
+        if pause > 0:
+            await asyncio.sleep(pause)
+        return True
+
+    async def rehydrate(self, db: asyncpg.Connection, chat_id: str) -> bool:
+        """
+        Restore an archived chat's messages into raven_messages.
+
+        Safe to call concurrently and for chats that are not archived (returns False);
+        a caller that loses the race waits for the winner's transaction and then sees
+        the restored rows.
+        """
+        started = time.perf_counter()
+        async with db.transaction():
+            payload = await db.fetchval(TAKE_ARCHIVE_SQL, chat_id)
+            if payload is not None:
+                rows = await asyncio.to_thread(_decode, payload)
+                columns = list(zip(*rows)) if rows else [()] * len(ARCHIVE_COLUMNS)
+                await db.execute(RESTORE_MESSAGES_SQL, chat_id, *[list(values) for values in columns])
+            await db.execute(
+                "UPDATE raven_chats SET archived_at = NULL WHERE id = $1 AND archived_at IS NOT NULL", chat_id
+            )
+        if payload is None:
+            return False
+        metrics.inc("chat_archive.rehydrations")
+        metrics.observe("chat_archive.rehydrate_seconds", time.perf_counter() - started)
+        logger.info(f"Rehydrated chat_id={chat_id} messages={len(rows)}")
+        return True
+
+
+# Singleton instance
+chat_archive = ChatArchiveService()
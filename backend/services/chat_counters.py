@@ -0,0 +1,140 @@
+# backend/services/chat_counters.py
+"""
+Backfill and consistency checks for the running counters on raven_chats.
+
+message_count, total_tokens, tokens_since_last_summary and last_message_at are
+maintained incrementally by message inserts, the token backfill and summary
+saves. These helpers recompute them from raven_messages for existing chats and
+report chats whose counters have drifted. Archived chats are skipped: their
+messages are not in raven_messages until they are rehydrated.
+
+Usage:
+    python -m backend.services.chat_counters backfill
+    python -m backend.services.chat_counters check
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from typing import List
+
+import asyncpg
+from dotenv import load_dotenv
+
+from .token_accounting import PENDING_TOKEN_COUNT_SQL
+
+logger = logging.getLogger(__name__)
+
+# Counter values recomputed from raven_messages for the chats in $1
+ACTUAL_COUNTERS_SQL = f"""
+    SELECT c.id AS chat_id,
+           COUNT(m.id) AS message_count,
+           COALESCE(SUM({PENDING_TOKEN_COUNT_SQL}), 0) AS total_tokens,
+           COALESCE(SUM({PENDING_TOKEN_COUNT_SQL}) FILTER (
+               WHERE ls.end_message_timestamp IS NULL OR m.timestamp > ls.end_message_timestamp
+           ), 0) AS tokens_since_last_summary,
+           MAX(m.timestamp) AS last_message_at
+    FROM raven_chats c
+    LEFT JOIN LATERAL (
+        SELECT end_message_timestamp FROM chat_summaries
+        WHERE chat_id = c.id
+        ORDER BY version DESC
+        LIMIT 1
+    ) ls ON TRUE
+    LEFT JOIN raven_messages m ON m.chat_id = c.id
+    WHERE c.id = ANY($1::text[])
+    GROUP BY c.id, ls.end_message_timestamp
+"""
+
+COUNTER_COLUMNS = ("message_count", "total_tokens", "tokens_since_last_summary", "last_message_at")
+
+
+class ChatCounterService:
+    """Recompute and verify the denormalized per-chat counters."""
+
+    @staticmethod
+    async def _chat_id_batches(db: asyncpg.Connection, batch_size: int):
+        last_id = ""
+        while True:
+            rows = await db.fetch(
+                "SELECT id FROM raven_chats WHERE id > $1 AND archived_at IS NULL ORDER BY id LIMIT $2",
+                last_id, batch_size,
+            )
+            if not rows:
+                return
+            chat_ids = [row['id'] for row in rows]
+            last_id = chat_ids[-1]
+            yield chat_ids
+
+    @staticmethod
+    async def backfill(db: asyncpg.Connection, batch_size: int = 500) -> int:
+        """Recompute counters for every chat, one batch per transaction. Returns chats updated."""
+        updated = 0
+        async for chat_ids in ChatCounterService._chat_id_batches(db, batch_size):
+            async with db.transaction():
+                # Lock the batch so concurrent inserts can't interleave with the recompute
+                await db.execute(
+                    "SELECT 1 FROM raven_chats WHERE id = ANY($1::text[]) FOR UPDATE",
+                    chat_ids,
+                )
+                await db.execute(f"""
+                    UPDATE raven_chats c
+                    SET message_count = a.message_count,
+                        total_tokens = a.total_tokens,
+                        tokens_since_last_summary = a.tokens_since_last_summary,
+                        last_message_at = a.last_message_at
+                    FROM ({ACTUAL_COUNTERS_SQL}) a
+                    WHERE c.id = a.chat_id
+                """, chat_ids)
+            updated += len(chat_ids)
+            logger.info(f"Backfilled chat counters for chats={updated}")
+        return updated
+
+    @staticmethod
+    async def check(db: asyncpg.Connection, batch_size: int = 500) -> List[dict]:
+        """Return chats whose stored counters differ from the recomputed values."""
+        mismatches = []
+        async for chat_ids in ChatCounterService._chat_id_batches(db, batch_size):
+            rows = await db.fetch(f"""
+                SELECT c.id AS chat_id,
+                       c.message_count, c.total_tokens, c.tokens_since_last_summary, c.last_message_at,
+                       a.message_count AS actual_message_count,
+                       a.total_tokens AS actual_total_tokens,
+                       a.tokens_since_last_summary AS actual_tokens_since_last_summary,
+                       a.last_message_at AS actual_last_message_at
+                FROM raven_chats c
+                JOIN ({ACTUAL_COUNTERS_SQL}) a ON a.chat_id = c.id
+            """, chat_ids)
+            for row in rows:
+                diff = {
+                    column: (row[column], row[f"actual_{column}"])
+                    for column in COUNTER_COLUMNS
+                    if row[column] != row[f"actual_{column}"]
+                }
+                if diff:
+                    mismatches.append({'chat_id': row['chat_id'], 'diff': diff})
+        return mismatches
+
+
+async def _main(command: str) -> None:
+    load_dotenv()
+    db = await asyncpg.connect(os.environ["DATABASE_URL"], statement_cache_size=0)
+    try:
+        if command == "backfill":
+            updated = await ChatCounterService.backfill(db)
+            print(f"Backfilled counters for {updated} chats")
+        elif command == "check":
+            mismatches = await ChatCounterService.check(db)
+            for mismatch in mismatches:
+                print(f"{mismatch['chat_id']}: {mismatch['diff']}")
+            print(f"{len(mismatches)} chats with inconsistent counters")
+        else:
+            raise SystemExit(f"Unknown command: {command} (expected backfill or check)")
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "check"))
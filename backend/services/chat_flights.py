@@ -0,0 +1,161 @@
+# backend/services/chat_flights.py
+"""
+Single-flight /chat generations keyed by idempotency key.
+
+A /chat request carrying an idempotency key registers a flight before the user
+message is written. The generation runs as a background task that publishes
+its chunks to the flight; the original request and any retry with the same key
+(double click, reconnect after a network blip) subscribe to it, so a retry
+neither writes the user message again nor starts a second model call. Finished
+flights are kept for CHAT_IDEMPOTENCY_TTL_SECONDS and replayed to late
+retries. The generation keeps running while no client is attached for up to
+CHAT_ABANDON_GRACE_SECONDS, giving a dropped client time to reconnect.
+
+A failed flight is dropped so a retry can generate again, but the chat its user
+message was stored in is remembered per key for the same TTL: the retry reuses
+that stored turn instead of writing the message a second time.
+
+Flights live in process memory, so a retry routed to a different instance is
+not deduplicated.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import AsyncIterator, List, Optional, Tuple
+
+from cachetools import TTLCache
+
+from ..metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ChatFlightConfig:
+    """Configuration for /chat request deduplication."""
+
+    def __init__(self):
+        self.ttl_seconds = float(os.getenv("CHAT_IDEMPOTENCY_TTL_SECONDS", "600"))
+        self.max_flights = int(os.getenv("CHAT_IDEMPOTENCY_MAX_FLIGHTS", "10000"))
+        # How long a generation keeps running with no client attached
+        self.abandon_grace_seconds = float(os.getenv("CHAT_ABANDON_GRACE_SECONDS", "15"))
+
+
+class ChatFlight:
+    """One generation's stream chunks, fanned out to every request that shares its key."""
+
+    def __init__(self, abandon_grace_seconds: float):
+        self.chunks: List[str] = []
+        self.done = False
+        self.failed = False
+        self._abandon_grace_seconds = abandon_grace_seconds
+        self._updated = asyncio.Event()
+        self._subscribers = 0
+        self._detached_at = time.monotonic()
+
+    def publish(self, chunk: str) -> None:
+        self.chunks.append(chunk)
+        if '"error"' in chunk and "error" in json.loads(chunk):
+            self.failed = True
+        self._notify()
+
+    def finish(self) -> None:
+        self.done = True
+        self._notify()
+
+    def _notify(self) -> None:
+        # Swap in a fresh event so waiters that already saw the old chunks wake exactly once
+        updated, self._updated = self._updated, asyncio.Event()
+        updated.set()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """Yield every chunk from the start, then follow the live generation until it ends."""
+        self._subscribers += 1
+        index = 0
+        try:
+            while True:
+                updated = self._updated
+                while index < len(self.chunks):
+                    yield self.chunks[index]
+                    index += 1
+                if self.done:
+                    return
+                await updated.wait()
+        finally:
+            self._subscribers -= 1
+            if self._subscribers == 0:
+                self._detached_at = time.monotonic()
+
+    async def is_disconnected(self) -> bool:
+        """Stand-in for Request.is_disconnected: True once no client has been attached for the grace period."""
+        return (
+            self._subscribers == 0
+            and time.monotonic() - self._detached_at > self._abandon_grace_seconds
+        )
+
+
+class ChatFlightRegistry:
+    """In-flight and recently finished /chat generations by (user_id, idempotency key)."""
+
+    def __init__(self, config: Optional[ChatFlightConfig] = None):
+        self.config = config or ChatFlightConfig()
+        self._flights: TTLCache = TTLCache(maxsize=self.config.max_flights, ttl=self.config.ttl_seconds)
+        # (user_id, key) -> chat id whose user message is already stored; outlives failed flights
+        self._turns: TTLCache = TTLCache(maxsize=self.config.max_flights, ttl=self.config.ttl_seconds)
+        self._tasks: set = set()
+        metrics.register_gauge("chat_flights.running", lambda: len(self._tasks))
+
+    def claim(self, user_id: str, key: str) -> Tuple[ChatFlight, bool]:
+        """Return the flight for the key and whether this call created it (and must run it)."""
+        flight = self._flights.get((user_id, key))
+        if flight is not None:
+            metrics.inc("chat_flights.replayed" if flight.done else "chat_flights.attached")
+            logger.info(f"Retried /chat attached to existing generation done={flight.done}")
+            return flight, False
+        flight = ChatFlight(self.config.abandon_grace_seconds)
+        self._flights[(user_id, key)] = flight
+        metrics.inc("chat_flights.started")
+        return flight, True
+
+    def record_turn(self, user_id: str, key: str, chat_id: str) -> None:
+        """Remember that the key's user message is stored in chat_id."""
+        self._turns[(user_id, key)] = chat_id
+
+    def stored_turn(self, user_id: str, key: str) -> Optional[str]:
+        """Chat id of the key's already stored turn, if an earlier attempt stored it."""
+        return self._turns.get((user_id, key))
+
+    def run(self, user_id: str, key: str, flight: ChatFlight, stream: AsyncIterator[str]) -> None:
+        """Drive the generation in the background, publishing its chunks to the flight."""
+        task = asyncio.create_task(self._drive(user_id, key, flight, stream))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drive(self, user_id: str, key: str, flight: ChatFlight, stream: AsyncIterator[str]) -> None:
+        try:
+            async for chunk in stream:
+                flight.publish(chunk)
+        except Exception as e:
+            logger.error(f"Chat generation failed: {e}")
+            flight.publish(json.dumps({"error": str(e)}) + "\n")
+        finally:
+            flight.finish()
+            if flight.failed:
+                # Subscribers still get the error; a later retry generates again on the stored turn
+                self._forget(user_id, key, flight)
+
+    def fail(self, user_id: str, key: str, flight: ChatFlight, error: str) -> None:
+        """End a flight that never started generating (e.g. the user message could not be stored)."""
+        flight.publish(json.dumps({"error": error}) + "\n")
+        flight.finish()
+        self._forget(user_id, key, flight)
+
+    def _forget(self, user_id: str, key: str, flight: ChatFlight) -> None:
+        if self._flights.get((user_id, key)) is flight:
+            del self._flights[(user_id, key)]
+
+
+# Singleton instance
+chat_flights = ChatFlightRegistry()
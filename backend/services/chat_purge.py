@@ -0,0 +1,197 @@
+# backend/services/chat_purge.py
+"""
+Background purge of soft-deleted chats.
+
+DELETE /api/chats/{chat_id} only sets raven_chats.deleted_at, which hides the
+chat from every query. Once a chat has been deleted for CHAT_PURGE_DELAY_SECONDS
+(long enough for an in-flight turn to finish writing), this worker removes its
+messages in batches of CHAT_PURGE_BATCH_SIZE, deletes uploaded objects that no
+other chat references, then drops its summaries, summary jobs, archive record
+(see chat_archive) and the chat row.
+
+Each batch is its own short statement, the worker never exceeds
+CHAT_PURGE_MAX_ROWS_PER_SECOND, and it pauses whenever the connection pool is
+saturated, so purging never competes with foreground requests.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import List, Optional
+
+import asyncpg
+
+from ..metrics import metrics
+from .signing_service import signing_service
+
+logger = logging.getLogger(__name__)
+
+# $1 purge delay seconds, $2 limit
+PURGE_CANDIDATES_SQL = """
+    SELECT id FROM raven_chats
+    WHERE deleted_at IS NOT NULL AND deleted_at < NOW() - $1::float * INTERVAL '1 second'
+    ORDER BY deleted_at
+    LIMIT $2
+"""
+
+PENDING_PURGE_SQL = "SELECT COUNT(*) FROM raven_chats WHERE deleted_at IS NOT NULL"
+
+MESSAGE_BATCH_SQL = "SELECT id, media_url FROM raven_messages WHERE chat_id = $1 LIMIT $2"
+
+# Uploads of this batch that another chat's messages (live or archived) still point at
+SHARED_MEDIA_SQL = """
+    SELECT media_url FROM raven_messages
+    WHERE media_url = ANY($1::text[]) AND chat_id <> $2
+    UNION
+    SELECT url FROM raven_chat_archives a, unnest(a.media_urls) AS url
+    WHERE a.media_urls && $1::text[] AND a.chat_id <> $2 AND url = ANY($1::text[])
+"""
+
+ARCHIVED_MEDIA_SQL = "SELECT media_urls FROM raven_chat_archives WHERE chat_id = $1"
+
+DELETE_MESSAGES_SQL = "DELETE FROM raven_messages WHERE chat_id = $1 AND id = ANY($2::text[])"
+
+# The chat row goes last, and only once no message references it; its summaries,
+# jobs and archive record go with it and not before
+DELETE_CHAT_SQL = """
+    WITH purgeable AS (
+        SELECT id FROM raven_chats
+        WHERE id = $1 AND deleted_at IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM raven_messages WHERE chat_id = $1)
+        FOR UPDATE
+    ), summaries AS (
+        DELETE FROM chat_summaries WHERE chat_id IN (SELECT id FROM purgeable)
+    ), jobs AS (
+        DELETE FROM summary_jobs WHERE chat_id IN (SELECT id FROM purgeable)
+    ), archive AS (
+        DELETE FROM raven_chat_archives WHERE chat_id IN (SELECT id FROM purgeable)
+    )
+    DELETE FROM raven_chats WHERE id IN (SELECT id FROM purgeable)
+"""
+
+
+class ChatPurgeConfig:
+    """Configuration for the soft-deleted chat purge worker."""
+
+    def __init__(self):
+        self.enabled = os.getenv("CHAT_PURGE_ENABLED", "true").lower() == "true"
+        # Grace period before a deleted chat is purged
+        self.delay_seconds = float(os.getenv("CHAT_PURGE_DELAY_SECONDS", "300"))
+        self.batch_size = int(os.getenv("CHAT_PURGE_BATCH_SIZE", "500"))
+        self.max_rows_per_second = float(os.getenv("CHAT_PURGE_MAX_ROWS_PER_SECOND", "2000"))
+        self.poll_interval_seconds = float(os.getenv("CHAT_PURGE_POLL_SECONDS", "30"))
+        # How long to back off while the pool is saturated by foreground traffic
+        self.busy_backoff_seconds = float(os.getenv("CHAT_PURGE_BUSY_BACKOFF_SECONDS", "1"))
+
+
+class ChatPurgeService:
+    """Purges soft-deleted chats in bounded, rate-limited batches."""
+
+    def __init__(self, config: Optional[ChatPurgeConfig] = None):
+        self.config = config or ChatPurgeConfig()
+        self._pool: Optional[asyncpg.Pool] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self, pool: asyncpg.Pool) -> None:
+        """Start the purge worker."""
+        if not self.config.enabled:
+            logger.info("Chat purge disabled")
+            return
+        self._pool = pool
+        self._tasks = [asyncio.create_task(self._worker())]
+        logger.info("Chat purge worker started")
+
+    async def stop(self) -> None:
+        """Stop the worker. A chat interrupted mid-purge is picked up again on the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                purged = await self.purge_pending()
+            except Exception as e:
+                logger.error(f"Chat purge sweep failed: {e}")
+                purged = 0
+            if not purged:
+                await asyncio.sleep(self.config.poll_interval_seconds)
+
+    async def purge_pending(self, limit: int = 10) -> int:
+        """Purge up to `limit` chats whose grace period has passed. Returns how many were removed."""
+        async with self._pool.acquire() as db:
+            metrics.set_gauge("chat_purge.pending_chats", await db.fetchval(PENDING_PURGE_SQL))
+            chats = await db.fetch(PURGE_CANDIDATES_SQL, self.config.delay_seconds, limit)
+        purged = 0
+        for chat in chats:
+            try:
+                if await self.purge_chat(chat['id']):
+                    purged += 1
+            except Exception as e:
+                metrics.inc("chat_purge.failures")
+                logger.error(f"Failed to purge chat_id={chat['id']}: {e}")
+        return purged
+
+    async def _wait_for_foreground(self) -> None:
+        # Raw asyncpg pools (scripts) have no saturation signal
+        while getattr(self._pool, "saturated", False):
+            metrics.inc("chat_purge.deferred")
+            await asyncio.sleep(self.config.busy_backoff_seconds)
+
+    async def _delete_unshared_media(self, chat_id: str, media_urls) -> int:
+        """Delete the uploads among `media_urls` that no other chat references. Returns objects deleted."""
+        media_urls = list(set(media_urls))
+        if not media_urls:
+            return 0
+        async with self._pool.acquire() as db:
+            shared = {row['media_url'] for row in await db.fetch(SHARED_MEDIA_SQL, media_urls, chat_id)}
+        deleted = 0
+        for media_url in media_urls:
+            if media_url not in shared and await asyncio.to_thread(signing_service.delete_uploaded_object, media_url):
+                deleted += 1
+        return deleted
+
+    async def purge_chat(self, chat_id: str) -> bool:
+        """Remove a soft-deleted chat and everything that belongs to it, one batch at a time."""
+        started = time.perf_counter()
+        messages = 0
+        objects = 0
+        async with self._pool.acquire() as db:
+            archived_media = await db.fetchval(ARCHIVED_MEDIA_SQL, chat_id)
+        if archived_media:
+            objects += await self._delete_unshared_media(chat_id, archived_media)
+        while True:
+            await self._wait_for_foreground()
+            batch_started = time.monotonic()
+            async with self._pool.acquire() as db:
+                rows = await db.fetch(MESSAGE_BATCH_SQL, chat_id, self.config.batch_size)
+            if not rows:
+                break
+
+            # Objects go before the rows that reference them, so a failure leaves nothing orphaned
+            objects += await self._delete_unshared_media(chat_id, {row['media_url'] for row in rows if row['media_url']})
+            async with self._pool.acquire() as db:
+                await db.execute(DELETE_MESSAGES_SQL, chat_id, [row['id'] for row in rows])
+            messages += len(rows)
+            metrics.inc("chat_purge.messages", len(rows))
+
+            # Rate limit: a batch of N rows takes at least N / max_rows_per_second
+            pause = len(rows) / self.config.max_rows_per_second - (time.monotonic() - batch_started)
+            if pause > 0:
+                await asyncio.sleep(pause)
+
+        async with self._pool.acquire() as db:
+            status = await db.execute(DELETE_CHAT_SQL, chat_id)
+        removed = status == "DELETE 1"
+        metrics.inc("chat_purge.objects", objects)
+        if removed:
+            metrics.inc("chat_purge.chats")
+            metrics.observe("chat_purge.chat_seconds", time.perf_counter() - started)
+        logger.info(f"Purged chat_id={chat_id} messages={messages} objects={objects} removed={removed}")
+        return removed
+
+
+# Singleton instance
+chat_purge = ChatPurgeService()
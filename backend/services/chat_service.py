@@ -4,22 +4,26 @@ import json
 import os
 import logging
 import uuid
-from typing import AsyncGenerator, List, Tuple, Union
+from typing import AsyncGenerator, AsyncIterator, List, Optional, Tuple, Union
 from uuid import uuid4
 from ..utils import convert_storage_path
+from ..db_pool import check_no_connection_held
 
 import asyncpg
 from dotenv import load_dotenv
 from fastapi import Depends, Request
-from google import genai
 from google.cloud import storage
 from google.genai import types
 from pydantic import BaseModel, Field
 from ..pymodels import ChatRequest
-from .message_service import MessageHistoryService
+from .message_service import MessageHistoryService, context_cache
 from .token_service import TokenService
 from .media_service import MediaInclusionService, MediaInclusionConfig
 from .system_service import system_service
+from .user_service import user_profiles
+from .model_backend import CachedContentExpiredError, CachedPrefix, get_model_backend
+from .prompt_cache import prompt_cache
+from .token_accounting import token_accounting, PENDING_TOKEN_COUNT_SQL
 
 def load_text_from_file(filename):
     try:
@@ -37,22 +41,25 @@ load_dotenv()
 
 # Get API key from environment or use a default project setup
 api_key = os.getenv("GOOGLE_API_KEY")
-project_ID = os.getenv("PROJECT_ID", "careful-aleph-452520-k9")
-location = os.getenv("LOCATION", "us-central1")
 chat_window_size = int(os.getenv("CHAT_WINDOW_SIZE", "20"))  # Default to last 20 messages
 
 # Token-aware settings  
 max_context_tokens = int(os.getenv("MAX_CONTEXT_TOKENS", "8000"))
 target_window_tokens = int(os.getenv("TARGET_WINDOW_TOKENS", "6000"))
 
+# Streaming timeouts (seconds): the first chunk includes model time-to-first-token,
+# later chunks only inter-token gaps
+stream_first_chunk_timeout = float(os.getenv("STREAM_FIRST_CHUNK_TIMEOUT", "90"))
+stream_chunk_timeout = float(os.getenv("STREAM_CHUNK_TIMEOUT", "30"))
+
 # Initialize token service
 token_service = TokenService()
 
-# Always use Vertex AI with ADC/service account
-client = genai.Client(vertexai=True, project=project_ID, location=location)
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
-logger.info("Using Vertex AI (project/location)")
+
+# Model calls go through the configured backend (Vertex AI by default, or the local stub)
+model_backend = get_model_backend()
 
 # Define model name via env with default
 model_name = os.getenv("RAVEN_MODEL", "gemini-2.5-flash")
@@ -111,11 +118,70 @@ async def _prepare_contents(chat_request: ChatRequest) -> Tuple[str, List[types.
     prompt = "\n".join(prompt_lines)
     return prompt, media_parts
 
-async def _generate_stream(contents: Union[str, List[Union[str, types.Part]]], request: Request, personalized_system: str = None) -> AsyncGenerator[str, None]:
-    """Generates content using Gemini API with streaming for text and/or media.
+async def _iter_with_timeouts(stream: AsyncIterator) -> AsyncGenerator:
+    """Yields items from an async stream, bounding the wait for each item.
+
+    Raises asyncio.TimeoutError if the first item takes longer than
+    stream_first_chunk_timeout or any later item longer than stream_chunk_timeout.
+    """
+    iterator = stream.__aiter__()
+    timeout = stream_first_chunk_timeout
+    try:
+        while True:
+            try:
+                item = await asyncio.wait_for(iterator.__anext__(), timeout=timeout)
+            except StopAsyncIteration:
+                return
+            timeout = stream_chunk_timeout
+            yield item
+    finally:
+        # Release the underlying HTTP stream when the consumer stops early
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            try:
+                await aclose()
+            except Exception as e:
+                logger.debug(f"Error closing model stream: {e}")
+
+async def _stream_with_prompt_cache(
+    contents,
+    full_contents,
+    system_instruction: str,
+    cached_prefix: CachedPrefix,
+    chat_id: str,
+) -> AsyncIterator[str]:
+    """Stream using the cached prefix; if the backend no longer has it, resend the full prompt."""
+    started = False
+    try:
+        async for text in model_backend.stream(model=model_name, contents=contents, cached_content=cached_prefix.name):
+            if not started:
+                started = True
+                prompt_cache.record_use(cached_prefix)
+            yield text
+        return
+    except CachedContentExpiredError as e:
+        if started:
+            raise
+        logger.info(f"Model cache expired, sending full prompt chat_id={chat_id}: {e}")
+        prompt_cache.expire(chat_id, cached_prefix.name)
+
+    async for text in model_backend.stream(model=model_name, contents=full_contents, system_instruction=system_instruction):
+        yield text
+
+async def _generate_stream(
+    contents: Union[str, List[Union[str, types.Part]]],
+    request: Request,
+    personalized_system: str = None,
+    cached_prefix: Optional[CachedPrefix] = None,
+    full_contents: Union[str, List[Union[str, types.Part]], None] = None,
+    chat_id: Optional[str] = None,
+) -> AsyncGenerator[str, None]:
+    """Generates content using the model backend with streaming for text and/or media.
 
     contents may be a plain string, or a list mixing the prompt string and media Parts.
     personalized_system will override the default system instruction if provided.
+    With cached_prefix, contents omit the cached summary and full_contents is the
+    complete prompt used if the cache has expired.
     """
     logger.debug("Starting _generate_stream")
     
@@ -132,29 +198,33 @@ async def _generate_stream(contents: Union[str, List[Union[str, types.Part]]], r
             if i > 0:  # Skip the first item which is the prompt text
                 logger.debug(f"_generate_stream item type: {type(item)}")
     
+    check_no_connection_held("model stream")
     try:
-        # Configure Gemini with personalized system instruction if provided
-        generation_config = types.GenerateContentConfig(
-            system_instruction=personalized_system or system_instruction,
-            # thinking_config=types.ThinkingConfig(thinking_budget=0)
-        )
-        
-        # Stream response from Gemini
-        for chunk in client.models.generate_content_stream(
-            model=model_name,
-            contents=contents,
-            config=generation_config,
-        ):
+        # Stream through the async model backend so waiting on the model never
+        # blocks the event loop for other requests
+        if cached_prefix is not None:
+            stream = _stream_with_prompt_cache(
+                contents, full_contents, personalized_system, cached_prefix, chat_id
+            )
+        else:
+            stream = model_backend.stream(
+                model=model_name,
+                contents=full_contents if full_contents is not None else contents,
+                system_instruction=personalized_system or system_instruction,
+            )
+        async for text in _iter_with_timeouts(stream):
             if await request.is_disconnected():
                 logger.info("Client disconnected")
                 return
-                
-            # Some chunks may have empty text; skip those
-            if getattr(chunk, "text", None):
-                yield json.dumps({"response": chunk.text}) + "\n"
-            await asyncio.sleep(0)
+
+            # The next chunk is only pulled once this one has been consumed, so slow
+            # clients apply backpressure to the model stream instead of buffering it.
+            yield json.dumps({"response": text}) + "\n"
+    except asyncio.TimeoutError:
+        logger.error("Timed out waiting for model stream chunk")
+        yield json.dumps({"error": "Model response timed out"}) + "\n"
     except Exception as e:
-        logger.error(f"Error in Gemini streaming: {e}")
+        logger.error(f"Error in model streaming: {e}")
         yield json.dumps({"error": str(e)}) + "\n"
 
 async def generate_stream(pool, chat_request: ChatRequest, request: Request, chat_id: str, user_id: str) -> AsyncGenerator[str, None]:
@@ -167,24 +237,16 @@ async def generate_stream(pool, chat_request: ChatRequest, request: Request, cha
         
         # Get a database connection for fetching history
         async with pool.acquire() as db:
-            # Fetch user's name or other profile info
-            user_info = await db.fetchrow("""
-                SELECT email, first_name, last_name FROM users_raven WHERE id = $1
-            """, user_id)
-            
-            # Get system instruction from service (loads from GCS or local fallback)
-            base_instruction = await system_service.get_system_instruction()
-            
-            # Personalize the instruction for this user
-            personalized_system = system_service.personalize_for_user(base_instruction, user_info)
-            
-            # Use summary-aware message retrieval (falls back to token-aware windowing)
-            logger.debug(f"Fetching history with summary support. budget={target_window_tokens}")
+            # Fetch the summary and token-budgeted history in one round trip
+            logger.debug(f"Fetching context with summary support. budget={target_window_tokens}")
             history_messages, history_tokens = await MessageHistoryService.get_messages_with_summary(
                 db, chat_id, user_id, max_tokens=target_window_tokens
             )
             logger.debug(f"History fetched messages={len(history_messages)} tokens={history_tokens}")
             
+            # System instruction personalized for this user (cached per user and instruction version)
+            personalized_system = await user_profiles.get_personalized_instruction(db, user_id)
+            
             # Extract ONLY the new user message (ignore any history client sent)
             logger.debug(f"Client sent messages={len(chat_request.messages)}")
             new_user_messages = []
@@ -214,44 +276,61 @@ async def generate_stream(pool, chat_request: ChatRequest, request: Request, cha
             # Convert allowed URLs to gs:// for matching in formatter
             allowed_gs = {convert_storage_path(u, 'gs_uri') for u in allowed_urls}
 
+            # The summary block is part of the stable prefix cached on the model side
+            summary_prefix, body_messages = MessageHistoryService.split_summary_prefix(all_messages)
+            
             # Format the conversation for the model, passing allowed URIs so formatter can skip others
-            prompt, media_parts = await MessageHistoryService.format_conversation_for_model(all_messages, allowed_gs_uris=allowed_gs)
-            logger.debug(f"Prompt chars={len(prompt)} media_parts={len(media_parts)}")
+            prompt, media_parts = await MessageHistoryService.format_conversation_for_model(body_messages, allowed_gs_uris=allowed_gs)
+            full_prompt = f"{summary_prefix}\n{prompt}" if summary_prefix else prompt
+            logger.debug(f"Prompt chars={len(full_prompt)} media_parts={len(media_parts)}")
             
         response_text = ""
+        stream_failed = False
 
         # Build the contents argument: plain string for text-only, or [string, *media_parts]
         stream_contents: Union[str, List[Union[str, types.Part]]]
+        full_contents: Union[str, List[Union[str, types.Part]]]
         if media_parts:
             stream_contents = [prompt] + media_parts
+            full_contents = [full_prompt] + media_parts
             logger.info(f"Sending to model media_parts={len(media_parts)}")
         else:
             stream_contents = prompt
+            full_contents = full_prompt
+
+        # Reuse the model-side cache of system instruction + summary when there is one
+        cached_prefix = prompt_cache.lookup(chat_id, model_name, personalized_system, summary_prefix)
 
         # Generate and stream the response
-        async for chunk in _generate_stream(stream_contents, request, personalized_system):
+        async for chunk in _generate_stream(
+            stream_contents, request, personalized_system,
+            cached_prefix=cached_prefix, full_contents=full_contents, chat_id=chat_id,
+        ):
             yield chunk
             try:
                 response_part = json.loads(chunk.strip())
                 if "response" in response_part:
                     response_text += response_part["response"]
+                elif "error" in response_part:
+                    stream_failed = True
             except:
                 continue
 
+        # A reply cut short by an error is not stored: the client retries the turn, and a
+        # truncated assistant message would be duplicated and fed into the retry's context
+        if stream_failed:
+            logger.warning(f"Not saving partial response for chat {chat_id} after a failed stream")
         # Store the response text to DB using a fresh connection from the pool
-        if response_text and chat_id:
+        elif response_text and chat_id:
             try:
                 async with pool.acquire() as db:
-                    # Count tokens for assistant response
+                    # Persist with a pending token count; the count is backfilled in the background
                     from ..pymodels import FormattedChatMessage, ChatMessagePart
                     assistant_message = FormattedChatMessage(
                         role="assistant", 
                         parts=[ChatMessagePart(text=response_text, type="text", mimeType=None)]
                     )
-                    response_tokens = await token_service.count_message_tokens(assistant_message)
-                    logger.debug(f"Assistant response tokens={response_tokens}")
-                    
-                    await add_message_to_db(db, chat_id, user_id, "assistant", response_text, token_count=response_tokens)
+                    await _persist_messages(db, [assistant_message], chat_id, user_id)
             except Exception as e:
                 logger.error(f"Error saving assistant response: {e}")
 
@@ -259,61 +338,154 @@ async def generate_stream(pool, chat_request: ChatRequest, request: Request, cha
         logger.error(f"General error in generate_stream: {e}")
         yield json.dumps({"error": str(e)}) + "\n"
 
-async def add_message_to_db(db, chat_id, user_id, role, content, media_type=None, media_url=None, token_count=0):
-    """Helper function to add a single message to the database with token count"""
-    message_id = str(uuid.uuid4())
+# Inserts every row of a batch in one statement and bumps the chat's running
+# counters in the same statement. Rows keep their batch order via microsecond
+# offsets from the transaction timestamp, since NOW() is constant inside a single
+# statement. The counter UPDATE only matches a live chat owned by the user; when
+# it matches nothing the caller rolls the inserted rows back. Pending token counts
+# are added to the counters as estimates and corrected by the token accounting
+# backfill; history_version (the history ETag) moves with every insert. Returns
+# the inserted window rows for the context cache.
+BULK_INSERT_MESSAGES_SQL = f"""
+    WITH inserted AS (
+        INSERT INTO raven_messages (id, chat_id, user_id, role, content, timestamp, media_type, media_url, token_count)
+        SELECT m.id, $1, $2, m.role, m.content,
+               NOW() + (m.ord - 1) * INTERVAL '1 microsecond',
+               m.media_type, m.media_url, m.token_count
+        FROM unnest($3::text[], $4::text[], $5::text[], $6::text[], $7::text[], $8::int[])
+             WITH ORDINALITY AS m(id, role, content, media_type, media_url, token_count, ord)
+        RETURNING id, role, content, media_type, media_url, timestamp, {PENDING_TOKEN_COUNT_SQL} AS tokens
+    )
+    UPDATE raven_chats
+    SET message_count = message_count + (SELECT COUNT(*) FROM inserted),
+        total_tokens = total_tokens + (SELECT COALESCE(SUM(tokens), 0) FROM inserted),
+        tokens_since_last_summary = tokens_since_last_summary + (SELECT COALESCE(SUM(tokens), 0) FROM inserted),
+        last_message_at = GREATEST(last_message_at, (SELECT MAX(timestamp) FROM inserted)),
+        history_version = history_version + 1
+    WHERE id = $1 AND user_id = $2 AND deleted_at IS NULL
+    RETURNING (
+        SELECT json_agg(json_build_object(
+            'id', id, 'role', role, 'content', content, 'media_type', media_type,
+            'media_url', media_url, 'token_count', tokens, 'timestamp', EXTRACT(EPOCH FROM timestamp)
+        ) ORDER BY timestamp)
+        FROM inserted
+    ) AS inserted_rows
+"""
+
+async def add_messages_bulk(db, chat_id, user_id, rows: List[dict]) -> List[str]:
+    """Insert many raven_messages rows for one chat in a single transaction and round trip.
+
+    Each row is a dict with role, content and optional media_type, media_url and
+    token_count (None stores the count as pending). Returns the new ids in row order,
+    or an empty list if the insert failed or the chat is deleted or not the user's
+    (nothing is written then).
+    """
+    if not rows:
+        return []
+    message_ids = [str(uuid.uuid4()) for _ in rows]
     try:
-        await db.execute('''
-            INSERT INTO raven_messages (id, chat_id, user_id, role, content, timestamp, media_type, media_url, token_count)
-            VALUES ($1, $2, $3, $4, $5, NOW(), $6, $7, $8)
-        ''', message_id, chat_id, user_id, role, content or "", media_type, media_url, token_count)
-        logger.debug(f"Message {message_id} inserted with {token_count} tokens")
-        return message_id
+        async with db.transaction():
+            inserted_rows = await db.fetchval(
+                BULK_INSERT_MESSAGES_SQL,
+                chat_id,
+                user_id,
+                message_ids,
+                [row['role'] for row in rows],
+                [row.get('content') or "" for row in rows],
+                [row.get('media_type') for row in rows],
+                [row.get('media_url') for row in rows],
+                [row.get('token_count') for row in rows],
+            )
+            if inserted_rows is None:
+                # No live chat of this user matched: roll the inserted rows back
+                raise LookupError("chat not found, deleted or not owned by the user")
+        logger.debug(f"Inserted messages={len(message_ids)} for chat_id={chat_id}")
+        if inserted_rows:
+            context_cache.append(chat_id, json.loads(inserted_rows))
+        return message_ids
     except Exception as e:
-        logger.error(f"Error inserting message {message_id}: {e}")
-        return None
+        logger.error(f"Error inserting {len(rows)} messages for chat {chat_id}: {e}")
+        return []
+
+async def add_message_to_db(db, chat_id, user_id, role, content, media_type=None, media_url=None, token_count=0):
+    """Helper function to add a single message to the database with token count.
+
+    token_count=None stores the count as pending for the token accounting pipeline.
+    """
+    message_ids = await add_messages_bulk(db, chat_id, user_id, [{
+        'role': role,
+        'content': content,
+        'media_type': media_type,
+        'media_url': media_url,
+        'token_count': token_count,
+    }])
+    return message_ids[0] if message_ids else None
+
+def _message_to_rows(message) -> Tuple[List[dict], List[int]]:
+    """Split a message into raven_messages rows (text first, then one per media part).
+
+    Returns the rows and the indexes of rows that carry the message's token count.
+    """
+    rows: List[dict] = []
+    counted_rows: List[int] = []
+
+    # Process text content
+    content = ""
+    for part in message.parts:
+        if part.type == 'text':
+            content += part.text if part.text else ""
+
+    # Save text content if available
+    if content.strip():
+        counted_rows.append(len(rows))
+        rows.append({'role': message.role, 'content': content, 'token_count': None})
+
+    # Process media parts separately (tokens counted for the whole message)
+    for part in message.parts:
+        if part.type != 'text' and part.text:
+            # Store gs:// URI in the database for server-side processing
+            gs_uri = convert_storage_path(part.text, 'gs_uri')
+            # Only store tokens for media-only messages (when no text content)
+            if not content.strip():
+                counted_rows.append(len(rows))
+            rows.append({
+                'role': message.role,
+                'content': "",
+                'media_type': part.mimeType,
+                'media_url': gs_uri,
+                'token_count': None if not content.strip() else 0,
+            })
+
+    return rows, counted_rows
+
+async def _persist_messages(db, messages, chat_id, user_id) -> List[str]:
+    """Write all rows for the given messages in one batch and queue their token counts."""
+    rows: List[dict] = []
+    counted: List[Tuple[int, object]] = []
+    for message in messages:
+        message_rows, counted_rows = _message_to_rows(message)
+        counted.extend((len(rows) + index, message) for index in counted_rows)
+        rows.extend(message_rows)
+
+    message_ids = await add_messages_bulk(db, chat_id, user_id, rows)
+    if message_ids:
+        for index, message in counted:
+            token_accounting.enqueue(message_ids[index], message, chat_id)
+    return message_ids
 
 async def add_messages_to_db(db, chat_requests, chat_id, user_id):
-    """Processes and adds messages from chat requests to the database with token counting"""
+    """Processes and adds messages from chat requests to the database.
+
+    All rows of a turn (text + media) are written in a single transaction. Token
+    counts are written as pending (NULL) and backfilled by the token accounting
+    pipeline, so nothing here waits on token counting.
+    """
     if not isinstance(chat_requests, list):
         chat_requests = [chat_requests]
 
-    for chat_request in chat_requests:
-        # Only process the last message from the request (the new one)
-        messages_to_add = [chat_request.messages[-1]] if chat_request.messages else []
-
-        for message in messages_to_add:
-            role = message.role
-            
-            # Count tokens for the entire message (including media)
-            try:
-                message_tokens = await token_service.count_message_tokens(message)
-                logger.debug(f"Calculated {message_tokens} tokens for {role} message")
-            except Exception as e:
-                logger.warning(f"Error counting tokens for message: {e}")
-                message_tokens = 0
-            
-            # Process text content
-            content = ""
-            for part in message.parts:
-                if part.type == 'text':
-                    content += part.text if part.text else ""
-            
-            # Save text content if available
-            if content.strip():
-                await add_message_to_db(db, chat_id, user_id, role, content, token_count=message_tokens)
-            
-            # Process media parts separately (tokens already counted above)
-            for part in message.parts:
-                if part.type != 'text':
-                    media_type = part.mimeType
-                    media_url = part.text
-                    if media_url:
-                        # Store gs:// URI in the database for server-side processing
-                        gs_uri = convert_storage_path(media_url, 'gs_uri')
-                        # Only store tokens for media-only messages (when no text content)
-                        media_tokens = message_tokens if not content.strip() else 0
-                        await add_message_to_db(db, chat_id, user_id, role, "", media_type, gs_uri, token_count=media_tokens)
+    # Only process the last message from each request (the new one)
+    messages_to_add = [chat_request.messages[-1] for chat_request in chat_requests if chat_request.messages]
+    return await _persist_messages(db, messages_to_add, chat_id, user_id)
 
 def get_last_messages(chat_messages):
     if not chat_messages:
@@ -1,14 +1,198 @@
 # backend/services/message_service.py
-from typing import List, Optional, Tuple
+import json
+import os
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
 import asyncpg
+from cachetools import TTLCache
+from ..metrics import metrics
 from ..pymodels import ChatMessage, ChatMessagePart, FormattedChatMessage
+from .chat_archive import chat_archive
+from .token_accounting import PENDING_TOKEN_COUNT_SQL
 import logging
 logger = logging.getLogger(__name__)
 
 
+class ContextCacheConfig:
+    """Configuration for the in-process chat context cache."""
+
+    def __init__(self):
+        self.enabled = os.getenv("CONTEXT_CACHE_ENABLED", "true").lower() == "true"
+        self.max_chats = int(os.getenv("CONTEXT_CACHE_SIZE", "1000"))
+        self.ttl_seconds = float(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "600"))
+
+
+class CachedChatContext:
+    """
+    Token-budgeted window of one chat, kept formatted and trimmed incrementally.
+
+    rows mirror CONTEXT_QUERY's window_rows; messages/group_rows hold the same
+    rows grouped into FormattedChatMessage turns (as _convert_db_rows_to_messages
+    would), so appending or dropping a row only touches the last or first turn.
+    """
+
+    def __init__(self, context: dict, max_tokens: int):
+        self.max_tokens = max_tokens
+        self.summary = context['summary']
+        self.message_count = context['message_count']
+        self.rows = deque()
+        self.window_tokens = 0
+        self.messages: List[FormattedChatMessage] = []
+        self.group_rows: List[int] = []
+        for row in context['window_rows']:
+            self._push(row)
+
+    @property
+    def summary_version(self) -> Optional[int]:
+        return self.summary['version'] if self.summary else None
+
+    @property
+    def budget(self) -> int:
+        summary_tokens = int(self.summary['summary_tokens'] or 0) if self.summary else 0
+        return self.max_tokens - summary_tokens
+
+    def _push(self, row: dict) -> None:
+        parts = MessageHistoryService._row_to_parts(row)
+        row = dict(row, part_count=len(parts))
+        self.rows.append(row)
+        self.window_tokens += int(row['token_count'] or 0)
+        if self.messages and self.messages[-1].role == row['role']:
+            # Replace rather than mutate: callers may still hold the previous turn
+            last = self.messages[-1]
+            self.messages[-1] = FormattedChatMessage(role=last.role, parts=last.parts + parts)
+            self.group_rows[-1] += 1
+        else:
+            self.messages.append(FormattedChatMessage(role=row['role'], parts=parts))
+            self.group_rows.append(1)
+
+    def _pop_oldest(self) -> None:
+        row = self.rows.popleft()
+        self.window_tokens -= int(row['token_count'] or 0)
+        if self.group_rows[0] == 1:
+            self.messages.pop(0)
+            self.group_rows.pop(0)
+        else:
+            first = self.messages[0]
+            self.messages[0] = FormattedChatMessage(role=first.role, parts=first.parts[row['part_count']:])
+            self.group_rows[0] -= 1
+
+    def trim(self) -> None:
+        """Drop the oldest rows until the window fits the budget and scan bound, like the DB cut."""
+        while self.rows and (
+            self.window_tokens > self.budget or len(self.rows) > MessageHistoryService.MAX_SCAN_ROWS
+        ):
+            self._pop_oldest()
+
+    def append(self, rows: List[dict]) -> None:
+        for row in rows:
+            self._push(row)
+        self.message_count += len(rows)
+        self.trim()
+
+    def apply_token_counts(self, counts: Dict[str, int]) -> None:
+        for row in self.rows:
+            if row['id'] in counts:
+                self.window_tokens += counts[row['id']] - int(row['token_count'] or 0)
+                row['token_count'] = counts[row['id']]
+        self.trim()
+
+
+class ChatContextCache:
+    """
+    Bounded LRU/TTL cache of chat windows keyed by chat_id.
+
+    Filled on a context fetch miss, appended to as messages are persisted,
+    adjusted by the token backfill and invalidated by summary saves, renames and
+    deletes. Entries are checked against raven_chats (message_count) and the
+    latest summary version before use, so writes from other instances turn into
+    a miss instead of a stale window.
+    """
+
+    def __init__(self, config: Optional[ContextCacheConfig] = None):
+        self.config = config or ContextCacheConfig()
+        self._entries: TTLCache = TTLCache(maxsize=self.config.max_chats, ttl=self.config.ttl_seconds)
+        self.hits = 0
+        self.misses = 0
+        metrics.register_gauge("context_cache.hit_rate", self.hit_rate)
+        metrics.register_gauge("context_cache.size", lambda: len(self._entries))
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, chat_id: str, max_tokens: int) -> Optional[CachedChatContext]:
+        if not self.config.enabled:
+            return None
+        entry = self._entries.get(chat_id)
+        if entry is not None and entry.max_tokens != max_tokens:
+            return None
+        return entry
+
+    def put(self, chat_id: str, context: dict, max_tokens: int) -> Optional[CachedChatContext]:
+        if not self.config.enabled or not context['owned']:
+            return None
+        entry = CachedChatContext(context, max_tokens)
+        self._entries[chat_id] = entry
+        return entry
+
+    def record(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+            metrics.inc("context_cache.hits")
+        else:
+            self.misses += 1
+            metrics.inc("context_cache.misses")
+
+    def append(self, chat_id: str, rows: List[dict]) -> None:
+        """Add newly persisted rows (oldest first) to the chat's cached window, if cached."""
+        entry = self._entries.get(chat_id)
+        if entry is not None:
+            entry.append(rows)
+
+    def apply_token_counts(self, chat_id: str, counts: Dict[str, int]) -> None:
+        """Replace pending token estimates with backfilled counts."""
+        entry = self._entries.get(chat_id)
+        if entry is not None:
+            entry.apply_token_counts(counts)
+
+    def invalidate(self, chat_id: str) -> None:
+        self._entries.pop(chat_id, None)
+
+
+# Singleton instance
+context_cache = ChatContextCache()
+
+
 class MessageHistoryService:
     """Service class for managing chat message history and windowing."""
     
+    # Upper bound on rows scanned for a token-budgeted window, so cost stays flat
+    # no matter how long the chat is
+    MAX_SCAN_ROWS = int(os.getenv("HISTORY_MAX_SCAN_ROWS", "500"))
+
+    # Newest-first bounded index scan, cumulative token SUM over it, and only the
+    # rows within budget returned in chronological order.
+    # $1 chat_id, $2 rows to skip, $3 scan bound, $4 token budget
+    TOKEN_WINDOW_QUERY = f"""
+        SELECT id, role, content, media_type, media_url, token_count,
+               EXTRACT(EPOCH FROM ts) AS timestamp
+        FROM (
+            SELECT id, role, content, media_type, media_url, token_count, ts,
+                   SUM(token_count) OVER (ORDER BY ts DESC, id DESC ROWS UNBOUNDED PRECEDING) AS running_tokens
+            FROM (
+                SELECT id, role, content, media_type, media_url, timestamp AS ts,
+                       {PENDING_TOKEN_COUNT_SQL} AS token_count
+                FROM raven_messages
+                WHERE chat_id = $1
+                ORDER BY timestamp DESC, id DESC
+                LIMIT $3 OFFSET $2
+            ) bounded
+        ) windowed
+        WHERE running_tokens <= $4
+        ORDER BY ts ASC, id ASC
+    """
+    
     @staticmethod
     async def get_recent_messages(
         db: asyncpg.Connection, 
@@ -32,14 +216,17 @@ class MessageHistoryService:
         """
         try:
             # First verify the chat belongs to the user
-            chat_query = "SELECT id FROM raven_chats WHERE id = $1 AND user_id = $2"
+            chat_query = "SELECT id, archived_at FROM raven_chats WHERE id = $1 AND user_id = $2 AND deleted_at IS NULL"
             chat = await db.fetchrow(chat_query, chat_id, user_id)
+            if chat and chat['archived_at']:
+                await chat_archive.rehydrate(db, chat_id)
             if not chat:
                 return []
 
             # Fetch recent messages with their media and token counts (excluding latest N if specified)
-            query = """
-                SELECT id, role, content, media_type, media_url, token_count,
+            query = f"""
+                SELECT id, role, content, media_type, media_url,
+                       {PENDING_TOKEN_COUNT_SQL} AS token_count,
                        EXTRACT(EPOCH FROM timestamp) as timestamp
                 FROM raven_messages
                 WHERE chat_id = $1
@@ -115,75 +302,24 @@ class MessageHistoryService:
         """
         try:
             # First verify the chat belongs to the user
-            chat_query = "SELECT id FROM raven_chats WHERE id = $1 AND user_id = $2"
+            chat_query = "SELECT id, archived_at FROM raven_chats WHERE id = $1 AND user_id = $2 AND deleted_at IS NULL"
             chat = await db.fetchrow(chat_query, chat_id, user_id)
+            if chat and chat['archived_at']:
+                await chat_archive.rehydrate(db, chat_id)
             if not chat:
                 return [], 0
 
-            # Fetch messages ordered by timestamp (newest first) with token counts
-            query = """
-                SELECT id, role, content, media_type, media_url, token_count,
-                       EXTRACT(EPOCH FROM timestamp) as timestamp
-                FROM raven_messages
-                WHERE chat_id = $1
-                ORDER BY timestamp DESC
-                OFFSET $2
-            """
+            # Budget cut happens in Postgres; only the rows that fit are returned (oldest first)
             logger.debug(f"Token-aware fetch max_tokens={max_tokens} exclude_latest={exclude_latest}")
-            rows = await db.fetch(query, chat_id, exclude_latest)
-            logger.debug(f"Token-aware fetch rows={len(rows)}")
-            
-            # Filter by token budget, starting from most recent
-            selected_rows = []
-            total_tokens = 0
-            
-            for row in rows:
-                row_tokens = row['token_count'] or 0
-                
-                if total_tokens + row_tokens > max_tokens:
-                    logger.debug(f"Token budget exceeded at tokens={total_tokens}")
-                    break
-                    
-                selected_rows.append(row)
-                total_tokens += row_tokens
-                
-            logger.debug(f"Token-aware fetch selected_rows={len(selected_rows)} tokens_used={total_tokens}")
-            
-            # Group selected messages by role and timestamp to reconstruct conversation turns
-            messages = []
-            current_message = None
-            
-            # Process in reverse order to get chronological flow (oldest first)
-            for row in reversed(selected_rows):
-                role = row['role']
-                content = row['content']
-                media_type = row['media_type']
-                media_url = row['media_url']
-                
-                # If this is a new message (different role or significant time gap)
-                if current_message is None or current_message.role != role:
-                    # Save previous message if exists
-                    if current_message is not None:
-                        messages.append(current_message)
-                    
-                    # Start new message
-                    current_message = FormattedChatMessage(role=role, parts=[])
-                
-                # Add text content if present
-                if content and content.strip():
-                    current_message.parts.append(
-                        ChatMessagePart(text=content.strip(), type="text", mimeType=None)
-                    )
-                
-                # Add media content if present
-                if media_type and media_url:
-                    current_message.parts.append(
-                        ChatMessagePart(text=media_url, type=media_type.split('/')[0], mimeType=media_type)
-                    )
+            rows = await db.fetch(
+                MessageHistoryService.TOKEN_WINDOW_QUERY,
+                chat_id, exclude_latest, MessageHistoryService.MAX_SCAN_ROWS, max_tokens
+            )
+            total_tokens = sum(int(row['token_count'] or 0) for row in rows)
+            logger.debug(f"Token-aware fetch selected_rows={len(rows)} tokens_used={total_tokens}")
             
-            # Add the last message
-            if current_message is not None:
-                messages.append(current_message)
+            # Group selected messages by role to reconstruct conversation turns
+            messages = await MessageHistoryService._convert_db_rows_to_messages(rows)
             
             logger.debug(f"Token-aware reconstruct messages={len(messages)} tokens={total_tokens}")
             return messages, total_tokens
@@ -192,6 +328,196 @@ class MessageHistoryService:
             logger.error(f"Error retrieving token-aware message history: {e}")
             return [], 0
 
+    # One round trip for everything generate_stream needs before calling the model:
+    # ownership, latest summary, the running counters on raven_chats
+    # for the summary decision, and the newest messages after the summary that fit the token budget
+    # (bounded newest-first scan with a cumulative SUM, cut in Postgres).
+    CONTEXT_QUERY = f"""
+        WITH chat AS (
+            SELECT id, message_count, total_tokens, tokens_since_last_summary, archived_at
+            FROM raven_chats WHERE id = $1 AND user_id = $2 AND deleted_at IS NULL
+        ),
+        summary AS (
+            SELECT summary_text, summary_tokens, end_message_timestamp, version
+            FROM chat_summaries
+            WHERE chat_id = $1 AND user_id = $2 AND EXISTS (SELECT 1 FROM chat)
+            ORDER BY version DESC
+            LIMIT 1
+        ),
+        messages AS (
+            SELECT id, role, content, media_type, media_url, timestamp AS ts,
+                   {PENDING_TOKEN_COUNT_SQL} AS token_count
+            FROM raven_messages
+            WHERE chat_id = $1 AND EXISTS (SELECT 1 FROM chat)
+        ),
+        recent AS (
+            SELECT id, role, content, media_type, media_url, token_count, ts,
+                   EXTRACT(EPOCH FROM ts) AS timestamp,
+                   SUM(token_count) OVER (ORDER BY ts DESC, id DESC ROWS UNBOUNDED PRECEDING) AS running_tokens
+            FROM (
+                SELECT * FROM messages
+                WHERE NOT EXISTS (SELECT 1 FROM summary)
+                   OR ts > (SELECT end_message_timestamp FROM summary)
+                ORDER BY ts DESC, id DESC
+                LIMIT $4
+            ) bounded
+        )
+        SELECT
+            EXISTS (SELECT 1 FROM chat) AS owned,
+            (SELECT archived_at IS NOT NULL FROM chat) AS archived,
+            (SELECT row_to_json(summary) FROM summary) AS summary,
+            COALESCE((SELECT message_count FROM chat), 0) AS message_count,
+            COALESCE((SELECT total_tokens FROM chat), 0) AS total_tokens,
+            COALESCE((SELECT tokens_since_last_summary FROM chat), 0) AS tokens_since_summary,
+            (
+                SELECT COALESCE(json_agg(json_build_object(
+                    'id', id, 'role', role, 'content', content, 'media_type', media_type,
+                    'media_url', media_url, 'token_count', token_count, 'timestamp', timestamp
+                ) ORDER BY ts ASC, id ASC), '[]'::json)
+                FROM recent
+                WHERE running_tokens <= $3 - COALESCE((SELECT summary_tokens FROM summary), 0)
+            ) AS window_rows
+    """
+
+    # Ownership, counters and latest summary version: enough to decide whether a
+    # cached window is still current
+    CHAT_STATE_QUERY = """
+        SELECT c.message_count, c.total_tokens, c.tokens_since_last_summary,
+               (SELECT MAX(version) FROM chat_summaries s WHERE s.chat_id = c.id) AS summary_version
+        FROM raven_chats c
+        WHERE c.id = $1 AND c.user_id = $2 AND c.deleted_at IS NULL
+    """
+
+    @staticmethod
+    async def _cached_chat_context(
+        db: asyncpg.Connection,
+        chat_id: str,
+        user_id: str,
+        max_tokens: int
+    ) -> Tuple[Optional[CachedChatContext], dict]:
+        """
+        Return the cached window (validated against raven_chats) or fetch and cache it.
+        
+        Returns:
+            Tuple of (window, or None if the chat isn't the user's, counters dict)
+        """
+        started = time.perf_counter()
+        entry = context_cache.get(chat_id, max_tokens)
+        if entry is not None:
+            state = await db.fetchrow(MessageHistoryService.CHAT_STATE_QUERY, chat_id, user_id)
+            if (
+                state is not None
+                and int(state['message_count']) == entry.message_count
+                and state['summary_version'] == entry.summary_version
+            ):
+                context_cache.record(hit=True)
+                metrics.observe("context_fetch.hit_seconds", time.perf_counter() - started)
+                return entry, {
+                    'owned': True,
+                    'message_count': int(state['message_count']),
+                    'total_tokens': int(state['total_tokens']),
+                    'tokens_since_summary': int(state['tokens_since_last_summary']),
+                }
+            context_cache.invalidate(chat_id)
+        
+        context_cache.record(hit=False)
+        context = await MessageHistoryService.fetch_chat_context(db, chat_id, user_id, max_tokens)
+        entry = context_cache.put(chat_id, context, max_tokens)
+        metrics.observe("context_fetch.miss_seconds", time.perf_counter() - started)
+        if entry is None and context['owned']:
+            # Cache disabled: build an uncached window from the fetched rows
+            entry = CachedChatContext(context, max_tokens)
+        return entry, context
+
+    @staticmethod
+    async def fetch_chat_context(
+        db: asyncpg.Connection,
+        chat_id: str,
+        user_id: str,
+        max_tokens: int = 6000
+    ) -> dict:
+        """
+        Fetch the whole pre-generation context for a chat in a single query.
+        
+        Returns:
+            Dict with owned, summary, message_count, total_tokens,
+            tokens_since_summary and window_rows (chronological, within budget)
+        """
+        row = await db.fetchrow(
+            MessageHistoryService.CONTEXT_QUERY,
+            chat_id, user_id, max_tokens, MessageHistoryService.MAX_SCAN_ROWS
+        )
+        if row['archived']:
+            # Cold chat: restore its messages and read again
+            await chat_archive.rehydrate(db, chat_id)
+            row = await db.fetchrow(
+                MessageHistoryService.CONTEXT_QUERY,
+                chat_id, user_id, max_tokens, MessageHistoryService.MAX_SCAN_ROWS
+            )
+        return {
+            'owned': row['owned'],
+            'summary': json.loads(row['summary']) if row['summary'] else None,
+            'message_count': int(row['message_count']),
+            'total_tokens': int(row['total_tokens']),
+            'tokens_since_summary': int(row['tokens_since_summary']),
+            'window_rows': json.loads(row['window_rows']),
+        }
+
+    @staticmethod
+    async def get_conversation_context(
+        db: asyncpg.Connection,
+        chat_id: str,
+        user_id: str,
+        max_tokens: int = 6000
+    ) -> Tuple[List[FormattedChatMessage], int]:
+        """
+        Get the conversation context (summary + recent messages).
+        
+        Returns:
+            Tuple of (messages_for_context, total_tokens_used)
+        """
+        # Import here to avoid circular imports
+        from .summary_jobs import summary_jobs
+        
+        entry, context = await MessageHistoryService._cached_chat_context(db, chat_id, user_id, max_tokens)
+        if entry is None:
+            return [], 0
+        
+        # Decide on summarization from the totals returned with the context. The
+        # summary is built in the background; this turn uses the current one.
+        should_summarize = summary_jobs.summary_service.needs_summary(
+            context['message_count'],
+            context['total_tokens'],
+            entry.summary is not None,
+            context['tokens_since_summary'],
+        )
+        if should_summarize:
+            logger.debug(f"Chat needs summarization chat_id={chat_id} tokens={context['total_tokens']}")
+            try:
+                await summary_jobs.enqueue(db, chat_id, user_id)
+            except Exception as e:
+                logger.error(f"Failed to queue summary job: {e}")
+        
+        messages = []
+        tokens_used = entry.window_tokens
+        
+        summary = entry.summary
+        if summary:
+            summary_text = summary['summary_text']
+            tokens_used += int(summary['summary_tokens'] or 0)
+            logger.debug(f"Using summary + recent messages count={len(entry.rows)} tokens={tokens_used}")
+            
+            # Add summary as a system message for context
+            messages.append(FormattedChatMessage(
+                role="system",
+                parts=[ChatMessagePart(text=f"Previous conversation summary: {summary_text}", type="text", mimeType=None)]
+            ))
+        else:
+            logger.debug(f"No summary available; token-aware window count={len(entry.rows)} tokens={tokens_used}")
+        
+        messages.extend(entry.messages)
+        return messages, tokens_used
+
     @staticmethod 
     async def get_messages_with_summary(
         db: asyncpg.Connection,
@@ -207,128 +533,34 @@ class MessageHistoryService:
             Tuple of (messages_for_context, total_tokens_used)
         """
         try:
-            # Import here to avoid circular imports
-            from .summary_service import SummaryService
-            from .token_service import TokenService
-            
-            token_service = TokenService()
-            summary_service = SummaryService(token_service)
-            
-            # Check if we should create a summary first
-            should_summarize, total_tokens = await summary_service.should_create_summary(
-                db, chat_id, user_id
-            )
-            
-            if should_summarize:
-                logger.debug(f"Chat needs summarization chat_id={chat_id} tokens={total_tokens}")
-                await MessageHistoryService._create_summary_if_needed(
-                    db, chat_id, user_id, summary_service
-                )
-            
-            # Try to get summary + recent messages
-            summary_text, recent_messages, tokens_used = await summary_service.get_summary_with_recent_messages(
+            return await MessageHistoryService.get_conversation_context(
                 db, chat_id, user_id, max_tokens
             )
-            
-            if summary_text:
-                logger.debug(f"Using summary + recent messages count={len(recent_messages)} tokens={tokens_used}")
-                
-                # Convert recent messages to FormattedChatMessage objects
-                formatted_messages = []
-                
-                # Add summary as a system message for context
-                from ..pymodels import ChatMessagePart
-                summary_message = FormattedChatMessage(
-                    role="system",
-                    parts=[ChatMessagePart(text=f"Previous conversation summary: {summary_text}", type="text", mimeType=None)]
-                )
-                formatted_messages.append(summary_message)
-                
-                # Process recent messages
-                formatted_messages.extend(
-                    await MessageHistoryService._convert_db_rows_to_messages(recent_messages)
-                )
-                
-                return formatted_messages, tokens_used
-            else:
-                logger.debug("No summary available; falling back to token-aware windowing")
-                # Fallback to existing token-aware method
-                return await MessageHistoryService.get_recent_messages_by_tokens(
-                    db, chat_id, user_id, max_tokens, exclude_latest=0
-                )
                 
         except Exception as e:
-            logger.error(f"Failed to get messages with summary: {e}")
+            logger.error(f"Context assembly failed, falling back to separate queries: {e}")
             # Fallback to existing method
             return await MessageHistoryService.get_recent_messages_by_tokens(
                 db, chat_id, user_id, max_tokens, exclude_latest=0
             )
     
     @staticmethod
-    async def _create_summary_if_needed(
-        db: asyncpg.Connection,
-        chat_id: str,
-        user_id: str,
-        summary_service
-    ) -> None:
-        """Create a summary if conditions are met."""
-        try:
-            # Get messages to summarize (exclude recent ones)
-            messages_query = """
-                SELECT id, role, content, media_type, media_url, token_count,
-                       EXTRACT(EPOCH FROM timestamp) as timestamp
-                FROM raven_messages
-                WHERE chat_id = $1
-                ORDER BY timestamp ASC
-                OFFSET 0 LIMIT (
-                    SELECT COUNT(*) - $2 FROM raven_messages WHERE chat_id = $1
-                )
-            """
-            
-            rows = await db.fetch(messages_query, chat_id, summary_service.config.keep_recent_messages)
-            
-            if len(rows) < summary_service.config.min_messages_to_summarize:
-                logger.debug(f"Not enough messages to summarize count={len(rows)}")
-                return
-            
-            # Convert to FormattedChatMessage objects
-            messages_to_summarize = await MessageHistoryService._convert_db_rows_to_messages(rows)
-            
-            if not messages_to_summarize:
-                return
-            
-            # Generate summary
-            summary_text = await summary_service.generate_summary(
-                db, chat_id, user_id, messages_to_summarize
-            )
-            
-            if summary_text:
-                # Get timestamp range
-                start_timestamp = rows[0]['timestamp']
-                end_timestamp = rows[-1]['timestamp']
-                
-                # Convert epoch timestamps (which may be Decimal) to datetime
-                from datetime import datetime
-                try:
-                    start_dt = datetime.fromtimestamp(float(start_timestamp))
-                except Exception:
-                    start_dt = datetime.utcnow()
-                try:
-                    end_dt = datetime.fromtimestamp(float(end_timestamp))
-                except Exception:
-                    end_dt = datetime.utcnow()
-                
-                # Save summary
-                await summary_service.save_summary(
-                    db, chat_id, user_id, summary_text,
-                    start_dt, end_dt, len(rows)
-                )
-                
-                logger.debug(f"Created summary for messages={len(rows)}")
-            
-        except Exception as e:
-            logger.error(f"Failed to create summary: {e}")
-    
+    def _row_to_parts(row: dict) -> List[ChatMessagePart]:
+        """Message parts for one raven_messages row (text and/or media)."""
+        parts = []
+        content = row['content']
+        media_type = row['media_type']
+        media_url = row['media_url']
+        
+        # Add text content if present
+        if content and content.strip():
+            parts.append(ChatMessagePart(text=content.strip(), type="text", mimeType=None))
+        
+        # Add media content if present
+        if media_type and media_url:
+            parts.append(ChatMessagePart(text=media_url, type=media_type.split('/')[0], mimeType=media_type))
+        return parts
+
     @staticmethod
     async def _convert_db_rows_to_messages(rows: List[dict]) -> List[FormattedChatMessage]:
         """Convert database rows to FormattedChatMessage objects."""
@@ -337,9 +569,6 @@ class MessageHistoryService:
         
         for row in rows:
             role = row['role']
-            content = row['content']
-            media_type = row['media_type']
-            media_url = row['media_url']
             
             # If this is a new message (different role or significant time gap)
             if current_message is None or current_message.role != role:
@@ -350,19 +579,7 @@ class MessageHistoryService:
                 # Start new message
                 current_message = FormattedChatMessage(role=role, parts=[])
             
-            # Add text content if present
-            if content and content.strip():
-                from ..pymodels import ChatMessagePart
-                current_message.parts.append(
-                    ChatMessagePart(text=content.strip(), type="text", mimeType=None)
-                )
-            
-            # Add media content if present
-            if media_type and media_url:
-                from ..pymodels import ChatMessagePart
-                current_message.parts.append(
-                    ChatMessagePart(text=media_url, type=media_type.split('/')[0], mimeType=media_type)
-                )
+            current_message.parts.extend(MessageHistoryService._row_to_parts(row))
         
         # Add the last message
         if current_message is not None:
@@ -370,6 +587,26 @@ class MessageHistoryService:
         
         return messages
 
+    @staticmethod
+    def split_summary_prefix(
+        messages: List[FormattedChatMessage],
+    ) -> Tuple[Optional[str], List[FormattedChatMessage]]:
+        """
+        Split a leading summary (system) message off the conversation.
+        
+        Returns:
+            Tuple of (prompt text of the summary lines as format_conversation_for_model
+            would render them, or None; the remaining messages)
+        """
+        if not messages or messages[0].role != "system":
+            return None, messages
+        lines = [
+            f"{messages[0].role.upper()}: {part.text}"
+            for part in messages[0].parts
+            if part.type == "text" and part.text and part.text.strip()
+        ]
+        return ("\n".join(lines) or None), messages[1:]
+    
     @staticmethod
     async def format_conversation_for_model(
         messages: List[FormattedChatMessage],
@@ -0,0 +1,352 @@
+# backend/services/model_backend.py
+"""
+Model backend abstraction.
+
+All model calls made by the chat, token and summary services go through a
+ModelBackend so the service can run against Vertex AI in production or a
+deterministic local stub for load testing and latency profiling.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from google import genai
+from google.genai import errors, types
+
+logger = logging.getLogger(__name__)
+
+
+class ModelBackendError(Exception):
+    """Raised when a model backend call fails."""
+
+
+class CachedContentExpiredError(ModelBackendError):
+    """Raised when a call references cached content that expired or was deleted."""
+
+
+class CachedPrefix:
+    """Handle to model-side cached content (system instruction + leading contents)."""
+
+    def __init__(self, name: str, expire_at: float, token_count: int):
+        self.name = name
+        # Unix timestamp after which the backend drops the cache
+        self.expire_at = expire_at
+        self.token_count = token_count
+
+
+class ModelBackend:
+    """Interface for the model operations used by the services."""
+
+    name = "base"
+
+    async def generate(
+        self,
+        *,
+        model: str,
+        contents: Any,
+        system_instruction: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_output_tokens: Optional[int] = None,
+        cached_content: Optional[str] = None,
+    ) -> str:
+        """Generate a complete response and return its text."""
+        raise NotImplementedError
+
+    def stream(
+        self,
+        *,
+        model: str,
+        contents: Any,
+        system_instruction: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_output_tokens: Optional[int] = None,
+        cached_content: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """Stream a response as an async iterator of text chunks.
+
+        With cached_content, the cached system instruction and contents are
+        prepended to contents (system_instruction must then be None).
+        """
+        raise NotImplementedError
+
+    async def create_cached_content(
+        self,
+        *,
+        model: str,
+        system_instruction: Optional[str],
+        contents: List[str],
+        ttl_seconds: int,
+    ) -> CachedPrefix:
+        """Cache a stable prompt prefix on the model side for reuse across calls."""
+        raise NotImplementedError
+
+    async def delete_cached_content(self, name: str) -> None:
+        """Delete cached content before it expires."""
+        raise NotImplementedError
+
+    async def count_tokens(self, *, model: str, contents: Any) -> int:
+        """Count input tokens for the given contents."""
+        raise NotImplementedError
+
+    async def summarize(
+        self,
+        *,
+        model: str,
+        prompt: str,
+        temperature: Optional[float] = None,
+        max_output_tokens: Optional[int] = None,
+    ) -> str:
+        """Generate a summary for a fully built summary prompt."""
+        return await self.generate(
+            model=model,
+            contents=[prompt],
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+        )
+
+
+class VertexBackend(ModelBackend):
+    """Gemini on Vertex AI through the async google-genai client."""
+
+    name = "vertex"
+
+    def __init__(self, project_id: Optional[str] = None, location: Optional[str] = None):
+        project_id = project_id or os.getenv("PROJECT_ID", "careful-aleph-452520-k9")
+        location = location or os.getenv("LOCATION", "us-central1")
+        # Always use Vertex AI with ADC/service account
+        self.client = genai.Client(vertexai=True, project=project_id, location=location)
+
+    def _build_config(self, system_instruction, temperature, max_output_tokens, cached_content=None):
+        return types.GenerateContentConfig(
+            system_instruction=system_instruction,
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+            cached_content=cached_content,
+            # thinking_config=types.ThinkingConfig(thinking_budget=0)
+        )
+
+    @staticmethod
+    def _is_cache_miss(error: errors.ClientError) -> bool:
+        # Expired or deleted caches come back as NOT_FOUND (or INVALID_ARGUMENT naming the cache)
+        return error.code == 404 or (error.code == 400 and "cache" in str(error).lower())
+
+    async def generate(self, *, model, contents, system_instruction=None, temperature=None, max_output_tokens=None,
+                       cached_content=None) -> str:
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=model,
+                contents=contents,
+                config=self._build_config(system_instruction, temperature, max_output_tokens, cached_content),
+            )
+        except errors.ClientError as e:
+            if cached_content and self._is_cache_miss(e):
+                raise CachedContentExpiredError(str(e)) from e
+            raise
+        return response.text or ""
+
+    async def stream(self, *, model, contents, system_instruction=None, temperature=None, max_output_tokens=None,
+                     cached_content=None):
+        # The request is only sent when the stream is first iterated, so a cache miss
+        # can surface there. Only errors before the first chunk mean "resend without
+        # the cache"; after that the caller has already streamed part of a reply.
+        yielded = False
+        try:
+            response_stream = await self.client.aio.models.generate_content_stream(
+                model=model,
+                contents=contents,
+                config=self._build_config(system_instruction, temperature, max_output_tokens, cached_content),
+            )
+            async for chunk in response_stream:
+                # Some chunks may have empty text; skip those
+                if getattr(chunk, "text", None):
+                    yielded = True
+                    yield chunk.text
+        except errors.ClientError as e:
+            if cached_content and not yielded and self._is_cache_miss(e):
+                raise CachedContentExpiredError(str(e)) from e
+            raise
+
+    async def count_tokens(self, *, model, contents) -> int:
+        response = await self.client.aio.models.count_tokens(model=model, contents=contents)
+        return int(response.total_tokens)
+
+    async def create_cached_content(self, *, model, system_instruction, contents, ttl_seconds) -> CachedPrefix:
+        cache = await self.client.aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                contents=[types.Content(role="user", parts=[types.Part(text=text)]) for text in contents] or None,
+                ttl=f"{int(ttl_seconds)}s",
+            ),
+        )
+        expire_at = cache.expire_time.timestamp() if cache.expire_time else time.time() + ttl_seconds
+        token_count = cache.usage_metadata.total_token_count if cache.usage_metadata else 0
+        return CachedPrefix(cache.name, expire_at, int(token_count or 0))
+
+    async def delete_cached_content(self, name: str) -> None:
+        await self.client.aio.caches.delete(name=name)
+
+
+class StubBackendConfig:
+    """Configuration for the local stub backend."""
+
+    def __init__(self):
+        # Latency profile
+        self.time_to_first_token_ms = float(os.getenv("STUB_TTFT_MS", "300"))
+        self.tokens_per_second = float(os.getenv("STUB_TOKENS_PER_SECOND", "80"))
+        self.response_tokens = int(os.getenv("STUB_RESPONSE_TOKENS", "120"))
+        self.tokens_per_chunk = int(os.getenv("STUB_TOKENS_PER_CHUNK", "8"))
+        self.count_tokens_latency_ms = float(os.getenv("STUB_COUNT_TOKENS_MS", "0"))
+        self.create_cache_latency_ms = float(os.getenv("STUB_CREATE_CACHE_MS", "0"))
+
+        # Failure injection: fraction of calls that fail, and where streams fail
+        self.failure_rate = float(os.getenv("STUB_FAILURE_RATE", "0"))
+        self.failure_mode = os.getenv("STUB_FAILURE_MODE", "start")  # "start" or "mid"
+        self.seed = int(os.getenv("STUB_SEED", "0"))
+
+
+class StubBackend(ModelBackend):
+    """Deterministic local backend with a configurable latency and failure profile.
+
+    Responses are derived from a hash of the input so the same prompt always
+    produces the same output, and failures are drawn from a seeded RNG so a
+    load test run can be replayed exactly.
+    """
+
+    name = "stub"
+
+    WORDS = (
+        "raven", "answer", "context", "stream", "token", "window", "summary",
+        "message", "latency", "model", "chat", "response", "history", "media",
+    )
+    TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+    def __init__(self, config: Optional[StubBackendConfig] = None):
+        self.config = config or StubBackendConfig()
+        self._rng = random.Random(self.config.seed)
+        # name -> (expire_at, cached contents text)
+        self._caches: Dict[str, Tuple[float, str]] = {}
+        self._cache_counter = 0
+
+    @staticmethod
+    def _contents_text(contents: Any) -> str:
+        """Flatten str / Part / Content / list contents into plain text."""
+        if contents is None:
+            return ""
+        if isinstance(contents, str):
+            return contents
+        if isinstance(contents, (list, tuple)):
+            return "\n".join(StubBackend._contents_text(item) for item in contents)
+        parts = getattr(contents, "parts", None)
+        if parts:
+            return StubBackend._contents_text(parts)
+        text = getattr(contents, "text", None)
+        return text or ""
+
+    def _maybe_fail(self) -> None:
+        if self.config.failure_rate > 0 and self._rng.random() < self.config.failure_rate:
+            raise ModelBackendError("Injected stub backend failure")
+
+    def _response_words(self, contents: Any, max_output_tokens: Optional[int]) -> List[str]:
+        digest = hashlib.sha256(self._contents_text(contents).encode("utf-8")).digest()
+        count = self.config.response_tokens
+        if max_output_tokens:
+            count = min(count, max_output_tokens)
+        return [self.WORDS[digest[i % len(digest)] % len(self.WORDS)] for i in range(count)]
+
+    def _with_cached_prefix(self, contents: Any, cached_content: Optional[str]) -> Any:
+        """Prepend cached contents, as the real backend would; missing/expired caches fail."""
+        if not cached_content:
+            return contents
+        cached = self._caches.get(cached_content)
+        if cached is None or cached[0] <= time.time():
+            self._caches.pop(cached_content, None)
+            raise CachedContentExpiredError(f"Cached content {cached_content} not found")
+        return [cached[1], contents] if cached[1] else contents
+
+    async def generate(self, *, model, contents, system_instruction=None, temperature=None, max_output_tokens=None,
+                       cached_content=None) -> str:
+        chunks = []
+        async for chunk in self.stream(
+            model=model,
+            contents=contents,
+            system_instruction=system_instruction,
+            temperature=temperature,
+            max_output_tokens=max_output_tokens,
+            cached_content=cached_content,
+        ):
+            chunks.append(chunk)
+        return "".join(chunks)
+
+    async def stream(self, *, model, contents, system_instruction=None, temperature=None, max_output_tokens=None,
+                     cached_content=None):
+        contents = self._with_cached_prefix(contents, cached_content)
+        fail_mid = False
+        if self.config.failure_mode == "mid":
+            try:
+                self._maybe_fail()
+            except ModelBackendError:
+                fail_mid = True
+        else:
+            self._maybe_fail()
+
+        await asyncio.sleep(self.config.time_to_first_token_ms / 1000)
+
+        words = self._response_words(contents, max_output_tokens)
+        per_chunk = max(1, self.config.tokens_per_chunk)
+        chunk_delay = per_chunk / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0
+        for index in range(0, len(words), per_chunk):
+            if index > 0:
+                await asyncio.sleep(chunk_delay)
+            if fail_mid and index >= len(words) // 2:
+                raise ModelBackendError("Injected stub backend failure mid-stream")
+            yield " ".join(words[index:index + per_chunk]) + " "
+
+    async def count_tokens(self, *, model, contents) -> int:
+        if self.config.count_tokens_latency_ms:
+            await asyncio.sleep(self.config.count_tokens_latency_ms / 1000)
+        return len(self.TOKEN_PATTERN.findall(self._contents_text(contents)))
+
+    async def create_cached_content(self, *, model, system_instruction, contents, ttl_seconds) -> CachedPrefix:
+        if self.config.create_cache_latency_ms:
+            await asyncio.sleep(self.config.create_cache_latency_ms / 1000)
+        self._maybe_fail()
+        self._cache_counter += 1
+        name = f"stub-caches/{self._cache_counter}"
+        text = self._contents_text(list(contents))
+        self._caches[name] = (time.time() + ttl_seconds, text)
+        token_count = len(self.TOKEN_PATTERN.findall(self._contents_text([system_instruction or "", text])))
+        return CachedPrefix(name, time.time() + ttl_seconds, token_count)
+
+    async def delete_cached_content(self, name: str) -> None:
+        self._caches.pop(name, None)
+
+
+_backend: Optional[ModelBackend] = None
+
+
+def get_model_backend() -> ModelBackend:
+    """Return the process-wide backend selected by MODEL_BACKEND (vertex or stub)."""
+    global _backend
+    if _backend is None:
+        backend_name = os.getenv("MODEL_BACKEND", "vertex").lower()
+        if backend_name == "stub":
+            _backend = StubBackend()
+        elif backend_name == "vertex":
+            _backend = VertexBackend()
+        else:
+            raise ValueError(f"Unknown MODEL_BACKEND: {backend_name}")
+        logger.info(f"Using model backend: {_backend.name}")
+    return _backend
+
+
+def set_model_backend(backend: Optional[ModelBackend]) -> None:
+    """Override the process-wide backend (None resets to the env default)."""
+    global _backend
+    _backend = backend
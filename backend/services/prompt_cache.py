@@ -0,0 +1,180 @@
+# backend/services/prompt_cache.py
+"""
+Model-side caching of the stable prompt prefix.
+
+Every turn of a chat starts with the same personalized system instruction and,
+once the chat has been summarized, the same "Previous conversation summary"
+block. The registry keeps one cached content per chat for that prefix, keyed by
+a digest of model + instruction + summary, so a new summary version or
+instruction change rolls it over. Caches are created in the background on the
+first turn that misses and used from the next turn on; a turn whose cache has
+expired on the backend falls back to sending the full prompt.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from typing import Optional
+
+from cachetools import TTLCache
+
+from ..metrics import metrics
+from .model_backend import CachedPrefix, ModelBackend, get_model_backend
+from .token_service import local_token_counter
+
+logger = logging.getLogger(__name__)
+
+
+class PromptCacheConfig:
+    """Configuration for model-side prompt prefix caching."""
+
+    def __init__(self):
+        self.enabled = os.getenv("MODEL_CACHE_ENABLED", "true").lower() == "true"
+        self.ttl_seconds = int(os.getenv("MODEL_CACHE_TTL_SECONDS", "3600"))
+        # Backends reject (or don't discount) caches below a minimum size
+        self.min_tokens = int(os.getenv("MODEL_CACHE_MIN_TOKENS", "1024"))
+        self.max_chats = int(os.getenv("MODEL_CACHE_SIZE", "1000"))
+        # Caches this close to expiry are not used (a turn could outlive them)
+        self.expiry_margin_seconds = float(os.getenv("MODEL_CACHE_EXPIRY_MARGIN_SECONDS", "60"))
+        # How long a prefix whose cache creation failed is left uncached
+        self.failure_backoff_seconds = float(os.getenv("MODEL_CACHE_FAILURE_BACKOFF_SECONDS", "300"))
+
+
+class CachedPrefixEntry:
+    """A chat's cached prefix and the digest of what it contains."""
+
+    def __init__(self, key: str, cached: CachedPrefix):
+        self.key = key
+        self.cached = cached
+
+
+class PromptCacheRegistry:
+    """Per-chat registry of model-side cached prefixes."""
+
+    def __init__(self, config: Optional[PromptCacheConfig] = None, backend: Optional[ModelBackend] = None):
+        self.config = config or PromptCacheConfig()
+        self._backend = backend
+        self._entries: TTLCache = TTLCache(maxsize=self.config.max_chats, ttl=self.config.ttl_seconds)
+        self._failed: TTLCache = TTLCache(maxsize=self.config.max_chats, ttl=self.config.failure_backoff_seconds)
+        # chat_id -> in-flight creation, so concurrent turns create one cache
+        self._creating: dict = {}
+        self._tasks: set = set()
+        metrics.register_gauge("model_cache.size", lambda: len(self._entries))
+
+    @property
+    def backend(self) -> ModelBackend:
+        if self._backend is None:
+            self._backend = get_model_backend()
+        return self._backend
+
+    @staticmethod
+    def _key(model: str, system_instruction: Optional[str], prefix_text: Optional[str]) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        for value in (model, system_instruction or "", prefix_text or ""):
+            digest.update(value.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def lookup(
+        self,
+        chat_id: str,
+        model: str,
+        system_instruction: Optional[str],
+        prefix_text: Optional[str],
+    ) -> Optional[CachedPrefix]:
+        """
+        Return the chat's usable cached prefix, if any.
+
+        On a miss for a prefix large enough to cache, creation starts in the
+        background and the caller sends the full prompt this turn.
+        """
+        if not self.config.enabled:
+            return None
+        key = self._key(model, system_instruction, prefix_text)
+        entry = self._entries.get(chat_id)
+        if (
+            entry is not None
+            and entry.key == key
+            and entry.cached.expire_at - time.time() > self.config.expiry_margin_seconds
+        ):
+            metrics.inc("model_cache.hits")
+            return entry.cached
+
+        metrics.inc("model_cache.misses")
+        if key in self._failed or chat_id in self._creating:
+            return None
+        estimated = local_token_counter.count(f"{system_instruction or ''}\n{prefix_text or ''}")
+        if estimated < self.config.min_tokens:
+            metrics.inc("model_cache.skipped_small")
+            return None
+        self._creating[chat_id] = self._spawn(
+            self._create(chat_id, key, model, system_instruction, prefix_text)
+        )
+        return None
+
+    async def _create(
+        self,
+        chat_id: str,
+        key: str,
+        model: str,
+        system_instruction: Optional[str],
+        prefix_text: Optional[str],
+    ) -> None:
+        try:
+            cached = await self.backend.create_cached_content(
+                model=model,
+                system_instruction=system_instruction,
+                contents=[prefix_text] if prefix_text else [],
+                ttl_seconds=self.config.ttl_seconds,
+            )
+        except Exception as e:
+            self._failed[key] = True
+            metrics.inc("model_cache.create_failures")
+            logger.warning(f"Failed to create model cache chat_id={chat_id}: {e}")
+            return
+        finally:
+            self._creating.pop(chat_id, None)
+
+        previous = self._entries.get(chat_id)
+        self._entries[chat_id] = CachedPrefixEntry(key, cached)
+        metrics.inc("model_cache.creates")
+        logger.debug(f"Created model cache chat_id={chat_id} name={cached.name} tokens={cached.token_count}")
+        if previous is not None and previous.cached.name != cached.name:
+            # Superseded by a new summary or instruction version
+            self._spawn(self._delete(previous.cached.name))
+
+    async def _delete(self, name: str) -> None:
+        try:
+            await self.backend.delete_cached_content(name)
+        except Exception as e:
+            logger.debug(f"Failed to delete model cache name={name}: {e}")
+
+    def record_use(self, cached: CachedPrefix) -> None:
+        """Count the prefix tokens a turn did not send as fresh input."""
+        metrics.inc("model_cache.tokens_saved", cached.token_count)
+        metrics.observe("model_cache.tokens_saved_per_turn", cached.token_count)
+
+    def expire(self, chat_id: str, name: str) -> None:
+        """Forget a cache the backend no longer has; the next turn recreates it."""
+        entry = self._entries.get(chat_id)
+        if entry is not None and entry.cached.name == name:
+            del self._entries[chat_id]
+        metrics.inc("model_cache.expired_fallbacks")
+
+    def invalidate(self, chat_id: str) -> None:
+        """Drop the chat's cached prefix (e.g. the chat was deleted)."""
+        entry = self._entries.pop(chat_id, None)
+        if entry is not None:
+            self._spawn(self._delete(entry.cached.name))
+
+
+# Singleton instance
+prompt_cache = PromptCacheRegistry()
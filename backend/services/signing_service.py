@@ -0,0 +1,215 @@
+# backend/services/signing_service.py
+"""
+Signed URL generation for Cloud Storage objects.
+
+One impersonated signing credential is shared by every caller and rebuilt only
+when it gets old, instead of running google.auth.default (and possibly a token
+refresh) per URL. Signed GET URLs are cached per blob and reused until less than
+SIGNED_URL_MIN_REMAINING_SECONDS of validity is left, so rendering a chat's
+history only signs media that has not been signed recently.
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import google.auth
+import google.auth.impersonated_credentials
+import google.auth.transport.requests
+from cachetools import LRUCache
+from google.api_core import exceptions as gcs_exceptions
+from google.cloud import storage
+
+from ..metrics import metrics
+from ..utils import convert_storage_path
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ['https://www.googleapis.com/auth/cloud-platform']
+
+
+class SigningConfig:
+    """Configuration for signed URLs and the shared signing credential."""
+
+    def __init__(self):
+        # V4 signed URLs are valid for at most 7 days
+        self.url_ttl_seconds = int(os.getenv("SIGNED_URL_TTL_SECONDS", str(7 * 24 * 3600)))
+        # Cached URLs are only handed out while they stay valid at least this long
+        self.min_remaining_seconds = int(os.getenv("SIGNED_URL_MIN_REMAINING_SECONDS", str(24 * 3600)))
+        self.cache_size = int(os.getenv("SIGNED_URL_CACHE_SIZE", "10000"))
+        # Impersonated token lifetime; the credential is rebuilt a few minutes before it ends
+        self.credentials_lifetime_seconds = int(os.getenv("SIGNING_CREDENTIALS_LIFETIME_SECONDS", "3600"))
+
+
+class SigningService:
+    """Shared signing credential plus a per-blob cache of signed GET URLs."""
+
+    def __init__(self, config: Optional[SigningConfig] = None):
+        self.config = config or SigningConfig()
+        self._storage_client: Optional[storage.Client] = None
+        self._credentials = None
+        self._credentials_expire_at = 0.0
+        self._credentials_lock = threading.Lock()
+        # (bucket, blob) -> (url, expires_at); LRUCache is not thread-safe and
+        # sign_download_url runs in worker threads, so every access takes _urls_lock
+        self._urls: LRUCache = LRUCache(maxsize=self.config.cache_size)
+        self._urls_lock = threading.Lock()
+
+    @property
+    def storage_client(self) -> storage.Client:
+        if self._storage_client is None:
+            self._storage_client = storage.Client()
+        return self._storage_client
+
+    def get_credentials(self):
+        """Return the shared impersonated signing credential, building it when missing or old."""
+        with self._credentials_lock:
+            if self._credentials is None or time.time() >= self._credentials_expire_at:
+                credentials, _ = google.auth.default(scopes=SCOPES)
+                if credentials.token is None:
+                    credentials.refresh(google.auth.transport.requests.Request())
+                self._credentials = google.auth.impersonated_credentials.Credentials(
+                    source_credentials=credentials,
+                    target_principal=credentials.service_account_email,
+                    target_scopes=SCOPES,
+                    lifetime=datetime.timedelta(seconds=self.config.credentials_lifetime_seconds),
+                    delegates=[credentials.service_account_email]
+                )
+                self._credentials_expire_at = time.time() + self.config.credentials_lifetime_seconds - 300
+                metrics.inc("signing.credential_builds")
+            return self._credentials
+
+    def _blob(self, bucket_name: str, blob_name: str) -> storage.Blob:
+        return self.storage_client.bucket(bucket_name).blob(blob_name)
+
+    def sign_upload_url(self, bucket_name: str, blob_name: str, content_type: str) -> str:
+        """Signed PUT URL for uploading a new object (never cached)."""
+        return self._blob(bucket_name, blob_name).generate_signed_url(
+            version="v4",
+            credentials=self.get_credentials(),
+            expiration=datetime.timedelta(seconds=self.config.url_ttl_seconds),
+            method="PUT",
+            content_type=content_type,
+        )
+
+    def _cached_download_url(self, bucket_name: str, blob_name: str) -> Optional[str]:
+        with self._urls_lock:
+            cached = self._urls.get((bucket_name, blob_name))
+        if cached is not None and cached[1] - time.time() >= self.config.min_remaining_seconds:
+            metrics.inc("signing.url_cache_hits")
+            return cached[0]
+        return None
+
+    def _generate_download_url(self, bucket_name: str, blob_name: str) -> Tuple[str, float]:
+        """Sign a GET URL without touching the cache (blocking IAM signBlob). Returns (url, expires_at)."""
+        metrics.inc("signing.url_cache_misses")
+        now = time.time()
+        url = self._blob(bucket_name, blob_name).generate_signed_url(
+            version="v4",
+            credentials=self.get_credentials(),
+            expiration=datetime.timedelta(seconds=self.config.url_ttl_seconds),
+            method="GET",
+        )
+        return url, now + self.config.url_ttl_seconds
+
+    def _store_download_url(self, bucket_name: str, blob_name: str, url: str, expires_at: float) -> None:
+        with self._urls_lock:
+            self._urls[(bucket_name, blob_name)] = (url, expires_at)
+
+    def sign_download_url(self, bucket_name: str, blob_name: str) -> str:
+        """Signed GET URL for an object, reused from the cache while it has enough validity left."""
+        url = self._cached_download_url(bucket_name, blob_name)
+        if url is not None:
+            return url
+        url, expires_at = self._generate_download_url(bucket_name, blob_name)
+        self._store_download_url(bucket_name, blob_name, url, expires_at)
+        return url
+
+    def url_epoch(self) -> int:
+        """
+        Counter that advances before any signed URL handed out earlier can expire.
+
+        Mixed into ETags of responses that embed signed URLs, so a 304 never
+        revalidates a cached body whose URLs are no longer valid.
+        """
+        return int(time.time() // self.config.min_remaining_seconds)
+
+    @staticmethod
+    def _split_gs_uri(media_url: str) -> Optional[Tuple[str, str]]:
+        gs_uri = convert_storage_path(media_url, 'gs_uri')
+        if not gs_uri.startswith('gs://'):
+            return None
+        parts = gs_uri.replace('gs://', '').split('/', 1)
+        return (parts[0], parts[1]) if len(parts) == 2 else None
+
+    def sign_media_url(self, media_url: str) -> str:
+        """Browser-renderable URL for a stored media reference (gs:// or https)."""
+        try:
+            location = self._split_gs_uri(media_url)
+            if location is None:
+                # Already an https url or malformed gs uri: fall back to the public url
+                return convert_storage_path(media_url, 'public_url')
+            return self.sign_download_url(*location)
+        except Exception as e:
+            logger.error(f"Failed to sign media URL: {e}")
+            return convert_storage_path(media_url, 'public_url')
+
+    async def sign_media_urls(self, media_urls: Iterable[str]) -> Dict[str, str]:
+        """
+        Sign many stored media references at once.
+
+        Cache lookups and stores happen on the event loop; only the signatures
+        themselves (blocking IAM signBlob calls) run concurrently in worker threads.
+        """
+        signed: Dict[str, str] = {}
+        to_sign: Dict[str, Tuple[str, str]] = {}
+        for media_url in dict.fromkeys(url for url in media_urls if url):
+            location = self._split_gs_uri(media_url)
+            if location is None:
+                # Already an https url or malformed gs uri: fall back to the public url
+                signed[media_url] = convert_storage_path(media_url, 'public_url')
+                continue
+            cached = self._cached_download_url(*location)
+            if cached is not None:
+                signed[media_url] = cached
+            else:
+                to_sign[media_url] = location
+
+        results = await asyncio.gather(*[
+            asyncio.to_thread(self._generate_download_url, *location) for location in to_sign.values()
+        ], return_exceptions=True)
+        for (media_url, location), result in zip(to_sign.items(), results):
+            if isinstance(result, BaseException):
+                logger.error(f"Failed to sign media URL: {result}")
+                signed[media_url] = convert_storage_path(media_url, 'public_url')
+                continue
+            url, expires_at = result
+            self._store_download_url(*location, url, expires_at)
+            signed[media_url] = url
+        return signed
+
+    def delete_uploaded_object(self, media_url: str) -> bool:
+        """
+        Delete a user upload (gs://<bucket>/uploads/...) and forget its signed URL.
+
+        Blocking; run in a worker thread. Returns False for references that are
+        not uploads. An object that is already gone counts as deleted.
+        """
+        location = self._split_gs_uri(media_url)
+        if location is None or not location[1].startswith("uploads/"):
+            return False
+        with self._urls_lock:
+            self._urls.pop(location, None)
+        try:
+            self._blob(*location).delete()
+        except gcs_exceptions.NotFound:
+            pass
+        return True
+
+
+# Singleton instance
+signing_service = SigningService()
@@ -0,0 +1,234 @@
+# backend/services/summary_jobs.py
+"""
+Background summarization.
+
+/chat never summarizes inline: when a turn crosses the summary threshold it
+enqueues a row in summary_jobs and carries on with the previous summary (or the
+plain token window). A partial unique index keeps at most one pending/running
+job per chat, so concurrent triggers collapse into one. Workers claim jobs with
+FOR UPDATE SKIP LOCKED, retry failures with exponential backoff, and reclaim
+jobs whose lease expired (e.g. the instance died mid-summary). A job that finds
+too few new messages stays pending and looks again later instead of completing,
+so turns arriving meanwhile collapse into it rather than enqueueing afresh.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import List, Optional
+
+import asyncpg
+
+from ..metrics import metrics
+from .summary_service import SummaryNotReadyError, SummaryService
+
+logger = logging.getLogger(__name__)
+
+ENQUEUE_SQL = """
+    INSERT INTO summary_jobs (chat_id, user_id)
+    VALUES ($1, $2)
+    ON CONFLICT DO NOTHING
+    RETURNING id
+"""
+
+# $1 lease seconds
+CLAIM_SQL = """
+    UPDATE summary_jobs
+    SET status = 'running', attempts = attempts + 1, started_at = NOW()
+    WHERE id = (
+        SELECT id FROM summary_jobs
+        WHERE (status = 'pending' AND run_after <= NOW())
+           OR (status = 'running' AND started_at < NOW() - $1::int * INTERVAL '1 second')
+        ORDER BY run_after
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, chat_id, user_id, attempts
+"""
+
+COMPLETE_SQL = """
+    DELETE FROM summary_jobs WHERE id = $1
+    RETURNING EXTRACT(EPOCH FROM NOW() - created_at) AS latency
+"""
+
+# $1 id, $2 max attempts, $3 backoff seconds, $4 error
+RETRY_SQL = """
+    UPDATE summary_jobs
+    SET status = CASE WHEN attempts >= $2 THEN 'failed' ELSE 'pending' END,
+        run_after = NOW() + $3::float * INTERVAL '1 second',
+        last_error = $4
+    WHERE id = $1
+    RETURNING status
+"""
+
+# $1 id, $2 delay seconds, $3 max job age seconds; a deferral doesn't count as an attempt
+DEFER_SQL = """
+    UPDATE summary_jobs
+    SET status = 'pending', attempts = attempts - 1,
+        run_after = NOW() + $2::float * INTERVAL '1 second'
+    WHERE id = $1 AND created_at > NOW() - $3::float * INTERVAL '1 second'
+    RETURNING id
+"""
+
+QUEUE_STATS_SQL = """
+    SELECT COUNT(*) AS depth,
+           COALESCE(EXTRACT(EPOCH FROM NOW() - MIN(created_at)), 0) AS oldest_age
+    FROM summary_jobs
+    WHERE status IN ('pending', 'running')
+"""
+
+
+class SummaryJobConfig:
+    """Configuration for the background summary workers."""
+
+    def __init__(self):
+        self.workers = int(os.getenv("SUMMARY_WORKERS", "2"))
+        self.poll_interval_seconds = float(os.getenv("SUMMARY_JOB_POLL_SECONDS", "5"))
+        self.max_attempts = int(os.getenv("SUMMARY_JOB_MAX_ATTEMPTS", "5"))
+        self.backoff_base_seconds = float(os.getenv("SUMMARY_JOB_BACKOFF_SECONDS", "10"))
+        self.backoff_max_seconds = float(os.getenv("SUMMARY_JOB_BACKOFF_MAX_SECONDS", "600"))
+        # A running job older than this is assumed abandoned and claimed again
+        self.lease_seconds = int(os.getenv("SUMMARY_JOB_LEASE_SECONDS", "300"))
+        # Waiting for enough new messages: recheck interval, and how long before giving up
+        # (an idle chat's job must not stay pending forever, it would block archival)
+        self.defer_seconds = float(os.getenv("SUMMARY_JOB_DEFER_SECONDS", "300"))
+        self.max_defer_seconds = float(os.getenv("SUMMARY_JOB_MAX_DEFER_SECONDS", "86400"))
+        self.stats_interval_seconds = float(os.getenv("SUMMARY_JOB_STATS_SECONDS", "15"))
+
+
+class SummaryJobService:
+    """Durable, deduplicated summary job queue with asyncio workers."""
+
+    def __init__(self, config: Optional[SummaryJobConfig] = None):
+        self.config = config or SummaryJobConfig()
+        self._summary_service: Optional[SummaryService] = None
+        self._pool: Optional[asyncpg.Pool] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def summary_service(self) -> SummaryService:
+        if self._summary_service is None:
+            self._summary_service = SummaryService()
+        return self._summary_service
+
+    def start(self, pool: asyncpg.Pool) -> None:
+        """Start the workers and the queue stats refresher."""
+        self._pool = pool
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.config.workers)]
+        self._tasks.append(asyncio.create_task(self._stats()))
+        logger.info(f"Summary workers started count={self.config.workers}")
+
+    async def stop(self) -> None:
+        """Stop the workers. Interrupted jobs are reclaimed once their lease expires."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, db: asyncpg.Connection, chat_id: str, user_id: str) -> bool:
+        """Queue a summary for the chat. Returns False if one is already queued or running."""
+        job_id = await db.fetchval(ENQUEUE_SQL, chat_id, user_id)
+        if job_id is None:
+            metrics.inc("summary_jobs.deduplicated")
+            return False
+        metrics.inc("summary_jobs.enqueued")
+        logger.debug(f"Queued summary job id={job_id} chat_id={chat_id}")
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    async def _claim(self) -> Optional[asyncpg.Record]:
+        async with self._pool.acquire() as db:
+            return await db.fetchrow(CLAIM_SQL, self.config.lease_seconds)
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logger.error(f"Failed to claim summary job: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.config.poll_interval_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            await self._run(job)
+
+    async def _run(self, job: asyncpg.Record) -> None:
+        started = time.perf_counter()
+        try:
+            await self.summary_service.summarize_chat(self._pool, job['chat_id'], job['user_id'])
+        except SummaryNotReadyError as e:
+            if await self._defer(job, e):
+                return
+        except Exception as e:
+            await self._retry(job, e)
+            return
+        finally:
+            metrics.observe("summary_jobs.run_seconds", time.perf_counter() - started)
+
+        async with self._pool.acquire() as db:
+            latency = await db.fetchval(COMPLETE_SQL, job['id'])
+        metrics.inc("summary_jobs.completed")
+        if latency is not None:
+            metrics.observe("summary_jobs.latency_seconds", float(latency))
+        logger.info(f"Summary job done id={job['id']} chat_id={job['chat_id']} attempts={job['attempts']}")
+
+    async def _defer(self, job: asyncpg.Record, reason: Exception) -> bool:
+        """Put the job back to wait for more messages. Returns False once it is too old to keep waiting."""
+        try:
+            async with self._pool.acquire() as db:
+                deferred = await db.fetchval(
+                    DEFER_SQL, job['id'], self.config.defer_seconds, self.config.max_defer_seconds
+                )
+        except Exception as e:
+            # Left running: reclaimed when the lease expires
+            logger.error(f"Failed to defer summary job id={job['id']}: {e}")
+            return True
+        if deferred is None:
+            logger.info(f"Summary job id={job['id']} chat_id={job['chat_id']} gave up waiting: {reason}")
+            return False
+        metrics.inc("summary_jobs.deferred")
+        logger.debug(f"Summary job id={job['id']} deferred {self.config.defer_seconds:.0f}s: {reason}")
+        return True
+
+    async def _retry(self, job: asyncpg.Record, error: Exception) -> None:
+        backoff = min(
+            self.config.backoff_base_seconds * 2 ** (job['attempts'] - 1),
+            self.config.backoff_max_seconds,
+        )
+        try:
+            async with self._pool.acquire() as db:
+                status = await db.fetchval(
+                    RETRY_SQL, job['id'], self.config.max_attempts, backoff, str(error)
+                )
+        except Exception as e:
+            logger.error(f"Failed to reschedule summary job id={job['id']}: {e}")
+            return
+        if status == 'failed':
+            metrics.inc("summary_jobs.failed")
+            logger.error(f"Summary job failed id={job['id']} chat_id={job['chat_id']} attempts={job['attempts']}: {error}")
+        else:
+            metrics.inc("summary_jobs.retried")
+            logger.warning(f"Summary job id={job['id']} failed attempt={job['attempts']}, retrying in {backoff:.0f}s: {error}")
+
+    async def _stats(self) -> None:
+        while True:
+            try:
+                async with self._pool.acquire() as db:
+                    row = await db.fetchrow(QUEUE_STATS_SQL)
+                metrics.set_gauge("summary_jobs.queue_depth", int(row['depth']))
+                metrics.set_gauge("summary_jobs.oldest_job_age_seconds", float(row['oldest_age']))
+            except Exception as e:
+                logger.error(f"Failed to refresh summary queue stats: {e}")
+            await asyncio.sleep(self.config.stats_interval_seconds)
+
+
+# Singleton instance
+summary_jobs = SummaryJobService()
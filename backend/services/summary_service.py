@@ -9,13 +9,19 @@ to optimize token usage in long conversations.
 import os
 import logging
 import asyncpg
-from typing import Optional, Tuple, List
+from typing import Optional, List
 from datetime import datetime
-from google import genai
-from google.genai import types
 
 from ..pymodels import FormattedChatMessage
+from ..db_pool import check_no_connection_held
 from .token_service import TokenService
+from .model_backend import ModelBackend
+from .token_accounting import PENDING_TOKEN_COUNT_SQL
+from .message_service import MessageHistoryService, context_cache
+
+
+class SummaryNotReadyError(Exception):
+    """Too few messages since the last summary to fold yet."""
 
 
 class SummaryConfig:
@@ -30,6 +36,9 @@ class SummaryConfig:
         # Trigger conditions
         self.min_messages_to_summarize = int(os.getenv("SUMMARY_MIN_MESSAGES", "10"))
         self.keep_recent_messages = int(os.getenv("SUMMARY_KEEP_RECENT", "5"))
+        # Incremental updates: new messages needed to fold, and the most folded in one update
+        self.min_new_messages = int(os.getenv("SUMMARY_MIN_NEW_MESSAGES", "4"))
+        self.max_messages_per_update = int(os.getenv("SUMMARY_MAX_MESSAGES_PER_UPDATE", "200"))
         
         # Summary generation
         self.summary_temperature = float(os.getenv("SUMMARY_TEMPERATURE", "0.3"))
@@ -47,85 +56,56 @@ class SummaryService:
     - Integrate summaries with message history
     """
     
-    def __init__(self, token_service: TokenService = None):
+    def __init__(self, token_service: TokenService = None, backend: ModelBackend = None):
         self.config = SummaryConfig()
-        self.token_service = token_service or TokenService()
+        self.token_service = token_service or TokenService(backend)
         
-        # Initialize GenAI client (reuse existing configuration)
-        project_id = os.getenv("PROJECT_ID", "careful-aleph-452520-k9")
-        location = os.getenv("LOCATION", "us-central1")
-        self.client = genai.Client(vertexai=True, project=project_id, location=location)
+        # Share the process-wide model backend
+        self.backend = backend or self.token_service.backend
         
         self.logger = logging.getLogger(__name__)
         self.logger.debug(f"SummaryService trigger={self.config.trigger_total_tokens} tokens")
     
-    async def should_create_summary(
-        self, 
-        db: asyncpg.Connection, 
-        chat_id: str, 
-        user_id: str
-    ) -> Tuple[bool, int]:
+    def needs_summary(
+        self,
+        message_count: int,
+        total_tokens: int,
+        has_summary: bool = False,
+        tokens_since_summary: int = 0
+    ) -> bool:
         """
-        Determine if a conversation needs summarization.
+        Summarization decision from precomputed chat totals.
         
-        Returns:
-            Tuple of (should_summarize, total_tokens)
+        A first summary needs enough messages and tokens; an existing summary is
+        refreshed once half the trigger threshold has accumulated since it.
+        The newest keep_recent_messages are never summarized, so they don't
+        count towards the first summary's minimum.
         """
-        try:
-            # Get total tokens for this chat
-            query = """
-                SELECT 
-                    COUNT(*) as message_count,
-                    COALESCE(SUM(token_count), 0) as total_tokens
-                FROM raven_messages 
-                WHERE chat_id = $1
-            """
-            row = await db.fetchrow(query, chat_id)
-            
-            message_count = int(row['message_count']) if row['message_count'] is not None else 0
-            total_tokens = int(row['total_tokens']) if row['total_tokens'] is not None else 0
-            
-            self.logger.debug(f"chat_id={chat_id} messages={message_count} tokens={total_tokens}")
-            
-            # Check if we need summarization
-            should_summarize = (
-                total_tokens >= self.config.trigger_total_tokens and
-                message_count >= self.config.min_messages_to_summarize
-            )
-            
-            # Check if summary already exists
-            if should_summarize:
-                existing_summary = await self._get_latest_summary(db, chat_id, user_id)
-                if existing_summary:
-                    self.logger.debug("Existing summary found; checking if update needed")
-                    # Get tokens since last summary
-                    tokens_since_summary = await self._get_tokens_since_summary(
-                        db, chat_id, existing_summary['end_message_timestamp']
-                    )
-                    trigger_threshold = self.config.trigger_total_tokens // 2
-                    should_summarize = tokens_since_summary >= trigger_threshold
-            
-            return should_summarize, total_tokens
-            
-        except Exception as e:
-            self.logger.error(f"Failed to check summary need: {e}")
-            return False, 0
+        if total_tokens < self.config.trigger_total_tokens:
+            return False
+        if message_count < self.config.min_messages_to_summarize + self.config.keep_recent_messages:
+            return False
+        if has_summary:
+            return tokens_since_summary >= self.config.trigger_total_tokens // 2
+        return True
     
     async def generate_summary(
         self,
         db: asyncpg.Connection,
         chat_id: str,
         user_id: str,
-        messages_to_summarize: List[FormattedChatMessage]
+        messages_to_summarize: List[FormattedChatMessage],
+        previous_summary: Optional[str] = None
     ) -> Optional[str]:
         """
-        Generate a conversation summary using the GenAI API.
+        Generate a conversation summary using the model backend.
         
         Args:
             db: Database connection
             chat_id: Chat identifier
             user_id: User identifier  
             messages_to_summarize: List of messages to include in summary
+            previous_summary: Summary of everything before these messages, if any
             
         Returns:
             Generated summary text or None if failed
@@ -136,20 +116,21 @@ class SummaryService:
             # Build conversation text for summarization
             conversation_text = self._format_messages_for_summary(messages_to_summarize)
             
-            # Create summary prompt
-            summary_prompt = self._build_summary_prompt(conversation_text)
+            # Create summary prompt (extend the previous summary when there is one)
+            if previous_summary:
+                summary_prompt = self._build_incremental_summary_prompt(previous_summary, conversation_text)
+            else:
+                summary_prompt = self._build_summary_prompt(conversation_text)
             
-            # Generate summary using GenAI
-            response = self.client.models.generate_content(
+            # Generate summary using the model backend
+            check_no_connection_held("summary generation")
+            summary_text = await self.backend.summarize(
                 model=self.config.summary_model,
-                contents=[summary_prompt],
-                config=types.GenerateContentConfig(
-                    temperature=self.config.summary_temperature,
-                    max_output_tokens=self.config.max_summary_tokens,
-                )
+                prompt=summary_prompt,
+                temperature=self.config.summary_temperature,
+                max_output_tokens=self.config.max_summary_tokens,
             )
-            
-            summary_text = response.text.strip()
+            summary_text = summary_text.strip()
             
             # Count tokens in the generated summary
             summary_tokens = await self.token_service.count_text_tokens(summary_text)
@@ -178,29 +159,47 @@ class SummaryService:
             summary_tokens_result = await self.token_service.count_text_tokens(summary_text)
             summary_tokens = int(summary_tokens_result) if summary_tokens_result is not None else 0
             
-            # Get next version number
-            version_query = """
-                SELECT COALESCE(MAX(version), 0) + 1 as next_version
-                FROM chat_summaries WHERE chat_id = $1
-            """
-            next_version_result = await db.fetchval(version_query, chat_id)
-            next_version = int(next_version_result) if next_version_result is not None else 1
-            
-            # Insert new summary
+            # Insert new summary (nothing for a chat deleted meanwhile)
             insert_query = """
                 INSERT INTO chat_summaries (
                     chat_id, user_id, summary_text, summary_tokens,
                     start_message_timestamp, end_message_timestamp,
                     messages_summarized, version
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                )
+                SELECT $1, $2, $3, $4, $5, $6, $7, $8
+                WHERE EXISTS (SELECT 1 FROM raven_chats WHERE id = $1::varchar AND deleted_at IS NULL)
                 RETURNING id
             """
             
-            summary_id = await db.fetchval(
-                insert_query,
-                chat_id, user_id, summary_text, summary_tokens,
-                start_timestamp, end_timestamp, messages_count, next_version
-            )
+            # Tokens after the summarized range restart the "since last summary" counter
+            counter_query = f"""
+                UPDATE raven_chats
+                SET tokens_since_last_summary = (
+                    SELECT COALESCE(SUM({PENDING_TOKEN_COUNT_SQL}), 0)
+                    FROM raven_messages
+                    WHERE chat_id = $1 AND timestamp > $2
+                )
+                WHERE id = $1
+            """
+            
+            async with db.transaction():
+                # Get next version number
+                version_query = """
+                    SELECT COALESCE(MAX(version), 0) + 1 as next_version
+                    FROM chat_summaries WHERE chat_id = $1
+                """
+                next_version_result = await db.fetchval(version_query, chat_id)
+                next_version = int(next_version_result) if next_version_result is not None else 1
+                
+                summary_id = await db.fetchval(
+                    insert_query,
+                    chat_id, user_id, summary_text, summary_tokens,
+                    start_timestamp, end_timestamp, messages_count, next_version
+                )
+                await db.execute(counter_query, chat_id, end_timestamp)
+            
+            # Cached windows were cut against the previous summary
+            context_cache.invalidate(chat_id)
             
             self.logger.info(f"Saved summary id={summary_id} version={next_version}")
             return summary_id
@@ -209,71 +208,88 @@ class SummaryService:
             self.logger.error(f"Failed to save summary: {e}")
             return None
     
-    async def get_summary_with_recent_messages(
+    async def summarize_chat(
         self,
-        db: asyncpg.Connection,
+        pool: asyncpg.Pool,
         chat_id: str,
-        user_id: str,
-        max_tokens: int
-    ) -> Tuple[Optional[str], List[dict], int]:
+        user_id: str
+    ) -> Optional[str]:
         """
-        Get conversation summary combined with recent messages.
-        
+        Fold the messages since the last summary into its next version.
+
+        The model sees the previous version's summary_text plus only the messages
+        after its end_message_timestamp (minus the most recent ones, which stay
+        verbatim in the window), so each update costs the same however long the
+        chat gets. The first summary of a chat starts from message zero.
+
+        Run by the background summary worker. A connection is only held for the
+        reads and the save, never while the model is generating.
+
         Returns:
-            Tuple of (summary_text, recent_messages, total_tokens_used)
+            New summary id, or None when the chat is gone or deleted
+
+        Raises:
+            SummaryNotReadyError: too few new messages yet (the job waits for more)
+            RuntimeError: generation or save failed (the job is retried)
         """
-        try:
-            # Get latest summary
-            summary = await self._get_latest_summary(db, chat_id, user_id)
-            
-            if not summary:
-                self.logger.debug(f"No summary found for chat {chat_id}")
-                return None, [], 0
-            
-            summary_tokens = int(summary['summary_tokens']) if summary['summary_tokens'] is not None else 0
-            remaining_tokens = max_tokens - summary_tokens
-            
-            self.logger.debug(f"Summary tokens={summary_tokens} remaining={remaining_tokens}")
-            
-            if remaining_tokens <= 0:
-                self.logger.warning("Summary exceeds token budget")
-                return summary['summary_text'], [], summary_tokens
-            
-            # Get recent messages since summary
-            recent_messages_query = """
-                SELECT id, role, content, media_type, media_url, token_count,
-                       EXTRACT(EPOCH FROM timestamp) as timestamp
-                FROM raven_messages
-                WHERE chat_id = $1 AND timestamp > $2
-                ORDER BY timestamp ASC
-            """
-            
-            recent_rows = await db.fetch(
-                recent_messages_query, 
-                chat_id, 
-                summary['end_message_timestamp']
+        # Oldest messages after the previous summary; bounded so a chat's first
+        # summary reads max_messages_per_update + keep_recent rows, not the whole chat
+        messages_query = f"""
+            SELECT id, role, content, media_type, media_url, timestamp,
+                   {PENDING_TOKEN_COUNT_SQL} AS token_count
+            FROM raven_messages
+            WHERE chat_id = $1 AND timestamp > $2
+            ORDER BY timestamp ASC, id ASC
+            LIMIT $3
+        """
+        async with pool.acquire() as db:
+            deleted = await db.fetchval("SELECT deleted_at IS NOT NULL FROM raven_chats WHERE id = $1", chat_id)
+            if deleted is not False:
+                self.logger.debug(f"Chat gone or deleted, skipping summary chat_id={chat_id}")
+                return None
+            previous = await self._get_latest_summary(db, chat_id, user_id)
+            since = previous['end_message_timestamp'] if previous else datetime.min
+            rows = await db.fetch(
+                messages_query, chat_id, since,
+                self.config.max_messages_per_update + self.config.keep_recent_messages
             )
-            
-            # Filter recent messages by remaining token budget
-            selected_messages = []
-            tokens_used = summary_tokens
-            
-            for row in recent_rows:
-                message_tokens = int(row['token_count']) if row['token_count'] is not None else 0
-                if tokens_used + message_tokens <= max_tokens:
-                    selected_messages.append(dict(row))
-                    tokens_used += message_tokens
-                else:
-                    break
-            
-            self.logger.debug(f"Combined summary + recent messages count={len(selected_messages)} total_tokens={tokens_used}")
-            
-            return summary['summary_text'], selected_messages, tokens_used
-            
-        except Exception as e:
-            self.logger.error(f"Failed to get summary with recent messages: {e}")
-            return None, [], 0
-    
+        # The newest keep_recent stay verbatim in the window. A full page ends
+        # keep_recent rows past max_messages_per_update, so the same cut applies.
+        rows = rows[:max(len(rows) - self.config.keep_recent_messages, 0)]
+
+        min_messages = (
+            self.config.min_new_messages if previous
+            else self.config.min_messages_to_summarize
+        )
+        if len(rows) < min_messages:
+            raise SummaryNotReadyError(f"{len(rows)} new messages, need {min_messages}")
+
+        messages_to_summarize = await MessageHistoryService._convert_db_rows_to_messages(rows)
+        if not messages_to_summarize:
+            return None
+
+        summary_text = await self.generate_summary(
+            None, chat_id, user_id, messages_to_summarize,
+            previous_summary=previous['summary_text'] if previous else None
+        )
+        if not summary_text:
+            raise RuntimeError("summary generation failed")
+
+        start_timestamp = previous['start_message_timestamp'] if previous else rows[0]['timestamp']
+        messages_count = len(rows) + (int(previous['messages_summarized'] or 0) if previous else 0)
+        async with pool.acquire() as db:
+            summary_id = await self.save_summary(
+                db, chat_id, user_id, summary_text,
+                start_timestamp, rows[-1]['timestamp'], messages_count
+            )
+        if summary_id is None:
+            raise RuntimeError("summary save failed")
+
+        self.logger.debug(
+            f"Created summary new_messages={len(rows)} incremental={previous is not None}"
+        )
+        return summary_id
+
     async def _get_latest_summary(
         self, 
         db: asyncpg.Connection, 
@@ -290,21 +306,6 @@ class SummaryService:
         row = await db.fetchrow(query, chat_id, user_id)
         return dict(row) if row else None
     
-    async def _get_tokens_since_summary(
-        self, 
-        db: asyncpg.Connection, 
-        chat_id: str, 
-        since_timestamp: datetime
-    ) -> int:
-        """Get total tokens of messages since the last summary."""
-        query = """
-            SELECT COALESCE(SUM(token_count), 0) as tokens
-            FROM raven_messages
-            WHERE chat_id = $1 AND timestamp > $2
-        """
-        result = await db.fetchval(query, chat_id, since_timestamp)
-        return int(result) if result is not None else 0
-    
     def _format_messages_for_summary(self, messages: List[FormattedChatMessage]) -> str:
         """Format messages into text suitable for summarization."""
         formatted_lines = []
@@ -340,4 +341,23 @@ Conversation to summarize:
 
 Summary:"""
 
+    def _build_incremental_summary_prompt(self, previous_summary: str, conversation_text: str) -> str:
+        """Build the prompt that folds new messages into an existing summary."""
+        return f"""Below is a summary of a conversation so far, followed by the messages that came after it.
+Rewrite the summary so it also covers the new messages. Focus on:
+1. Key topics discussed
+2. Important decisions or conclusions
+3. User's main questions and concerns
+4. Any specific requests or tasks mentioned
+5. Context that would be helpful for future conversation
+
+Keep details from the existing summary that are still relevant, drop ones that were superseded,
+and keep the summary between {self.config.target_summary_tokens//4} and {self.config.max_summary_tokens//4} words.
+
+Existing summary:
+{previous_summary}
+
+New messages:
+{conversation_text}
 
+Updated summary:"""
@@ -1,19 +1,33 @@
 import os
 import logging
+import time
 import aiohttp
 import asyncio
+from google.api_core.exceptions import NotModified
 from google.cloud import storage
+from ..metrics import metrics
 from ..utils import convert_storage_path
 
 logger = logging.getLogger(__name__)
 
 class SystemInstructionService:
-    """Service for managing system instructions and user personalization."""
+    """Service for managing system instructions and user personalization.
+    
+    The instruction is served from memory. A background loop revalidates it
+    against the source (GCS generation or HTTP ETag, so an unchanged file is
+    not downloaded again); if a request finds it stale it is still served while
+    a refresh runs. Concurrent refreshes share one in-flight fetch, and blocking
+    GCS calls run in a worker thread.
+    """
     
     def __init__(self):
         self._system_instruction = None
-        self._last_fetch_time = 0
-        self._cache_ttl = 3600  # 1 hour in seconds
+        # Bumped whenever the instruction text changes, so derived strings can be rebuilt
+        self._version = 0
+        self._refresh_interval = float(os.getenv("SYSTEM_INSTRUCTION_REFRESH_SECONDS", "300"))
+        self._retry_interval = float(os.getenv("SYSTEM_INSTRUCTION_RETRY_SECONDS", "60"))
+        self._next_refresh_at = 0.0
+        self._last_validated_at = None
         self._instruction_url = os.getenv(
             "SYSTEM_INSTRUCTION_URL", 
             "https://storage.googleapis.com/raven-uploads-beta/sys_instruct/raven_system_instruction.txt"
@@ -25,55 +39,132 @@ class SystemInstructionService:
             "prompts", 
             "raven_system_instruction.txt"
         )
+        
+        # Validators of the remote copy we hold (GCS object generation / HTTP ETag)
+        self._generation = None
+        self._etag = None
+        self._storage_client = None
+        self._refresh_task = None
+        self._refresh_loop_task = None
+        
+        metrics.register_gauge("system_instruction.version", lambda: self._version)
+        metrics.register_gauge("system_instruction.age_seconds", self._age_seconds)
+    
+    @property
+    def version(self):
+        """Version of the current system instruction text."""
+        return self._version
+    
+    @property
+    def storage_client(self):
+        if self._storage_client is None:
+            self._storage_client = storage.Client()
+        return self._storage_client
+    
+    def _age_seconds(self):
+        if self._last_validated_at is None:
+            return 0.0
+        return time.monotonic() - self._last_validated_at
+    
+    def _set_instruction(self, instruction):
+        if instruction != self._system_instruction:
+            self._system_instruction = instruction
+            self._version += 1
+    
+    async def start(self):
+        """Load the instruction and start the background refresher."""
+        await self.get_system_instruction()
+        self._refresh_loop_task = asyncio.create_task(self._refresh_loop())
+    
+    async def stop(self):
+        for task in (self._refresh_loop_task, self._refresh_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._refresh_loop_task = None
+        self._refresh_task = None
     
     async def get_system_instruction(self, refresh=False):
-        """Get the system instruction, fetching from remote if needed or requested.
+        """Get the system instruction.
+        
+        Returns the in-memory copy right away; a stale copy triggers a
+        background refresh. Only the very first load (normally done by start())
+        or an explicit refresh waits on the remote source.
         
         Args:
-            refresh: Force refresh the instruction from remote source
+            refresh: Wait for a revalidation against the remote source
             
         Returns:
             str: The system instruction text
         """
-        current_time = asyncio.get_event_loop().time()
+        if refresh or self._system_instruction is None:
+            await asyncio.shield(self._refresh_in_background())
+            return self._system_instruction
         
-        # Use cached version if available and not expired
-        if (not refresh and 
-            self._system_instruction and 
-            current_time - self._last_fetch_time < self._cache_ttl):
+        if time.monotonic() >= self._next_refresh_at:
+            # Stale: serve what we have and revalidate in the background
+            self._refresh_in_background()
+        else:
             logger.debug("Using cached system instruction")
-            return self._system_instruction
-            
-        # Try to fetch from remote
+        return self._system_instruction
+    
+    def _refresh_in_background(self):
+        """Start a refresh unless one is already in flight; returns the shared task."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+        return self._refresh_task
+    
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(max(self._next_refresh_at - time.monotonic(), 1.0))
+            if time.monotonic() >= self._next_refresh_at:
+                await asyncio.shield(self._refresh_in_background())
+    
+    async def _refresh(self):
+        """Revalidate against the remote source, falling back to local copies if nothing is loaded."""
         try:
             instruction = await self._fetch_remote_instruction()
-            if instruction:
-                self._system_instruction = instruction
-                self._last_fetch_time = current_time
-                logger.info("Successfully fetched system instruction from remote")
-                return self._system_instruction
         except Exception as e:
             logger.error(f"Failed to fetch system instruction from remote: {e}")
+            metrics.inc("system_instruction.refresh_failures")
+            self._next_refresh_at = time.monotonic() + self._retry_interval
+            if self._system_instruction is None:
+                self._load_local_fallback()
+            return
         
-        # If we get here, remote fetch failed - try local fallback
-        if not self._system_instruction:
-            try:
-                with open(self._local_fallback_path, 'r') as f:
-                    self._system_instruction = f.read().strip()
-                    logger.info("Using local fallback system instruction")
-            except Exception as e:
-                logger.error(f"Failed to read local system instruction: {e}")
-                # Last resort hardcoded fallback
-                self._system_instruction = (
-                    "Your name is Raven. You are a helpful AI assistant. "
-                    "You're built by Victor Osunji. You have a sense of humor and can relate very well with people."
-                )
-                logger.warning("Using hardcoded fallback system instruction")
-        
-        return self._system_instruction
+        self._last_validated_at = time.monotonic()
+        self._next_refresh_at = self._last_validated_at + self._refresh_interval
+        if instruction is None:
+            metrics.inc("system_instruction.not_modified")
+            logger.debug("System instruction unchanged on remote")
+        else:
+            self._set_instruction(instruction)
+            metrics.inc("system_instruction.updates")
+            logger.info(f"Successfully fetched system instruction from remote version={self._version}")
+    
+    def _load_local_fallback(self):
+        try:
+            with open(self._local_fallback_path, 'r') as f:
+                self._set_instruction(f.read().strip())
+                logger.info("Using local fallback system instruction")
+        except Exception as e:
+            logger.error(f"Failed to read local system instruction: {e}")
+            # Last resort hardcoded fallback
+            self._set_instruction(
+                "Your name is Raven. You are a helpful AI assistant. "
+                "You're built by Victor Osunji. You have a sense of humor and can relate very well with people."
+            )
+            logger.warning("Using hardcoded fallback system instruction")
     
     async def _fetch_remote_instruction(self):
-        """Fetch the system instruction from remote URL."""
+        """Fetch the system instruction from remote URL.
+        
+        Returns:
+            str or None: The new text, or None if the remote copy is unchanged
+        
+        Raises:
+            Exception: If the remote source could not be read
+        """
         if self._instruction_url.startswith("gs://"):
             return await self._fetch_from_gcs(self._instruction_url)
         
@@ -89,45 +180,46 @@ class SystemInstructionService:
         return await self._fetch_from_http(self._instruction_url)
     
     async def _fetch_from_http(self, url):
-        """Fetch instruction from HTTP URL."""
+        """Fetch instruction from HTTP URL, conditional on the ETag we hold."""
         clean_url = convert_storage_path(url, 'public_url')
         logger.debug(f"Fetching system instruction from HTTP: {clean_url}")
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(clean_url) as response:
-                if response.status == 200:
-                    return await response.text()
-                else:
-                    logger.error(f"HTTP error {response.status} fetching system instruction")
+        headers = {"If-None-Match": self._etag} if self._etag and self._system_instruction else {}
+        timeout = aiohttp.ClientTimeout(total=10)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(clean_url, headers=headers) as response:
+                if response.status == 304:
                     return None
+                if response.status != 200:
+                    raise RuntimeError(f"HTTP error {response.status} fetching system instruction")
+                text = await response.text()
+                self._etag = response.headers.get("ETag")
+                return text
     
     async def _fetch_from_gcs(self, gs_uri):
-        """Fetch instruction from GCS URI."""
+        """Fetch instruction from GCS URI (in a worker thread)."""
         logger.debug(f"Fetching system instruction from GCS: {gs_uri}")
-        try:
-            # Parse bucket and blob from gs:// URI
-            if not gs_uri.startswith("gs://"):
-                gs_uri = convert_storage_path(gs_uri, 'gs_uri')
-                
-            parts = gs_uri.replace("gs://", "").split("/", 1)
-            if len(parts) != 2:
-                logger.error(f"Invalid GCS URI format: {gs_uri}")
-                return None
-                
-            bucket_name, blob_name = parts
+        # Parse bucket and blob from gs:// URI
+        if not gs_uri.startswith("gs://"):
+            gs_uri = convert_storage_path(gs_uri, 'gs_uri')
             
-            # Use GCS client to download
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(bucket_name)
-            blob = bucket.blob(blob_name)
+        parts = gs_uri.replace("gs://", "").split("/", 1)
+        if len(parts) != 2:
+            raise ValueError(f"Invalid GCS URI format: {gs_uri}")
             
-            # Download as string
-            content = blob.download_as_text()
-            return content
-            
-        except Exception as e:
-            logger.error(f"Error fetching from GCS: {e}")
+        bucket_name, blob_name = parts
+        return await asyncio.to_thread(self._download_from_gcs, bucket_name, blob_name)
+    
+    def _download_from_gcs(self, bucket_name, blob_name):
+        blob = self.storage_client.bucket(bucket_name).blob(blob_name)
+        # Only download when the object changed since the generation we hold
+        generation = self._generation if self._system_instruction else None
+        try:
+            content = blob.download_as_text(if_generation_not_match=generation)
+        except NotModified:
             return None
+        self._generation = blob.generation
+        return content
     
     def personalize_for_user(self, system_instruction, user_info):
         """Personalize the system instruction for a specific user.
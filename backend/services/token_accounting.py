@@ -0,0 +1,199 @@
+# backend/services/token_accounting.py
+"""
+Write-behind token accounting.
+
+Messages are persisted with token_count = NULL ("pending") so /chat can start
+streaming straight away. A background worker counts tokens for queued
+messages and backfills raven_messages.token_count in batches; a periodic sweep
+picks up rows left pending by a restart. Until a row is backfilled, queries
+use PENDING_TOKEN_COUNT_SQL to estimate it.
+"""
+
+import asyncio
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import asyncpg
+
+from ..pymodels import ChatMessagePart, FormattedChatMessage
+from .token_service import TokenService
+
+logger = logging.getLogger(__name__)
+
+# Estimated token count for a raven_messages row from its content length or media type
+PENDING_TOKEN_ESTIMATE_SQL = """CASE
+        WHEN media_url IS NOT NULL AND COALESCE(content, '') = '' THEN
+            CASE split_part(media_type, '/', 1)
+                WHEN 'image' THEN 258 WHEN 'video' THEN 2630 WHEN 'audio' THEN 960
+                WHEN 'application' THEN 1000 ELSE 100 END
+        ELSE GREATEST(1, LENGTH(content) / 4) END"""
+
+# Token count for a raven_messages row, estimating pending (NULL) counts.
+# Use in place of token_count in SELECT/SUM.
+PENDING_TOKEN_COUNT_SQL = f"COALESCE(token_count, {PENDING_TOKEN_ESTIMATE_SQL})"
+
+# Rows still pending after $1 seconds (served by ix_raven_messages_pending_tokens); $2 limit
+PENDING_SWEEP_SQL = """
+    SELECT id, chat_id, role, content, media_type, media_url
+    FROM raven_messages
+    WHERE token_count IS NULL
+      AND timestamp < NOW() - $1::int * INTERVAL '1 second'
+    LIMIT $2
+"""
+
+# Stores backfilled counts and moves the chat counters on raven_chats from the
+# estimate (added at insert time) to the real count, in one statement.
+BACKFILL_TOKEN_COUNTS_SQL = f"""
+    WITH updated AS (
+        UPDATE raven_messages m
+        SET token_count = u.token_count
+        FROM unnest($1::text[], $2::text[], $3::int[]) AS u(chat_id, id, token_count)
+        WHERE m.chat_id = u.chat_id AND m.id = u.id AND m.token_count IS NULL
+        RETURNING m.chat_id, m.timestamp,
+                  m.token_count - {PENDING_TOKEN_ESTIMATE_SQL} AS delta
+    ),
+    per_chat AS (
+        SELECT updated.chat_id,
+               SUM(delta) AS delta,
+               SUM(delta) FILTER (
+                   WHERE updated.timestamp > COALESCE(
+                       (SELECT MAX(end_message_timestamp) FROM chat_summaries s WHERE s.chat_id = updated.chat_id),
+                       '-infinity'::timestamp
+                   )
+               ) AS delta_since_summary
+        FROM updated
+        GROUP BY updated.chat_id
+    )
+    UPDATE raven_chats c
+    SET total_tokens = c.total_tokens + per_chat.delta,
+        tokens_since_last_summary = c.tokens_since_last_summary + COALESCE(per_chat.delta_since_summary, 0)
+    FROM per_chat
+    WHERE c.id = per_chat.chat_id
+"""
+
+
+class TokenAccountingConfig:
+    """Configuration for the token backfill pipeline."""
+
+    def __init__(self):
+        self.batch_size = int(os.getenv("TOKEN_BACKFILL_BATCH_SIZE", "100"))
+        self.sweep_interval_seconds = float(os.getenv("TOKEN_BACKFILL_SWEEP_SECONDS", "60"))
+        # Rows younger than this are assumed to still be in an in-process queue
+        self.sweep_min_age_seconds = int(os.getenv("TOKEN_BACKFILL_MIN_AGE_SECONDS", "30"))
+        self.shutdown_drain_seconds = float(os.getenv("TOKEN_BACKFILL_DRAIN_SECONDS", "5"))
+
+
+class TokenAccountingService:
+    """Backfills pending token counts off the request path."""
+
+    def __init__(self, config: Optional[TokenAccountingConfig] = None):
+        self.config = config or TokenAccountingConfig()
+        self._token_service: Optional[TokenService] = None
+        self._pool: Optional[asyncpg.Pool] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def token_service(self) -> TokenService:
+        if self._token_service is None:
+            self._token_service = TokenService()
+        return self._token_service
+
+    def start(self, pool: asyncpg.Pool) -> None:
+        """Start the queue worker and the pending-row sweeper."""
+        self._pool = pool
+        self._queue = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._worker()),
+            asyncio.create_task(self._sweeper()),
+        ]
+        logger.info("Token accounting pipeline started")
+
+    async def stop(self) -> None:
+        """Drain queued work (bounded) and stop the background tasks."""
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=self.config.shutdown_drain_seconds)
+            except asyncio.TimeoutError:
+                logger.warning(f"Token accounting stopped with {self._queue.qsize()} queued messages; the sweeper will pick them up")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def enqueue(self, message_id: str, message: FormattedChatMessage, chat_id: str) -> None:
+        """Queue a persisted message for token counting. Never blocks."""
+        if self._queue is None:
+            logger.debug(f"Token accounting not started; message {message_id} left for the sweeper")
+            return
+        self._queue.put_nowait((message_id, message, chat_id))
+
+    async def _worker(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.config.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._apply(batch)
+            except Exception as e:
+                logger.error(f"Token backfill failed for batch of {len(batch)}: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _apply(self, batch: List[Tuple[str, FormattedChatMessage, str]]) -> None:
+        # Import here to avoid circular imports
+        from .message_service import context_cache
+
+        counts = [int(count) for count in await self.token_service.count_messages_tokens([message for _, message, _ in batch])]
+        message_ids = [message_id for message_id, _, _ in batch]
+        # chat_id is part of the key of the (partitioned) messages table
+        chat_ids = [chat_id for _, _, chat_id in batch]
+        async with self._pool.acquire() as db:
+            await db.execute(BACKFILL_TOKEN_COUNTS_SQL, chat_ids, message_ids, counts)
+        logger.debug(f"Backfilled token counts for messages={len(message_ids)}")
+
+        # Swap the estimates in cached chat windows for the real counts
+        counts_by_chat = {}
+        for (message_id, _, chat_id), count in zip(batch, counts):
+            counts_by_chat.setdefault(chat_id, {})[message_id] = count
+        for chat_id, chat_counts in counts_by_chat.items():
+            context_cache.apply_token_counts(chat_id, chat_counts)
+
+    async def _sweeper(self) -> None:
+        while True:
+            try:
+                backfilled = await self.backfill_pending()
+                if backfilled:
+                    logger.info(f"Swept pending token counts for messages={backfilled}")
+            except Exception as e:
+                logger.error(f"Pending token sweep failed: {e}")
+            await asyncio.sleep(self.config.sweep_interval_seconds)
+
+    async def backfill_pending(self) -> int:
+        """Count and store tokens for rows left pending (e.g. across a restart)."""
+        async with self._pool.acquire() as db:
+            rows = await db.fetch(
+                PENDING_SWEEP_SQL,
+                self.config.sweep_min_age_seconds,
+                self.config.batch_size,
+            )
+        if not rows:
+            return 0
+        batch = [(row['id'], self._row_to_message(row), row['chat_id']) for row in rows]
+        await self._apply(batch)
+        return len(batch)
+
+    @staticmethod
+    def _row_to_message(row) -> FormattedChatMessage:
+        parts = []
+        if row['content'] and row['content'].strip():
+            parts.append(ChatMessagePart(text=row['content'], type="text", mimeType=None))
+        elif row['media_type'] and row['media_url']:
+            parts.append(ChatMessagePart(text=row['media_url'], type=row['media_type'].split('/')[0], mimeType=row['media_type']))
+        return FormattedChatMessage(role=row['role'], parts=parts)
+
+
+# Singleton instance
+token_accounting = TokenAccountingService()
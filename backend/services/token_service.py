@@ -1,25 +1,142 @@
 # backend/services/token_service.py
+import asyncio
+import hashlib
+import logging
 import os
+import random
+import re
 from typing import List, Optional
-from google import genai
+from cachetools import LRUCache
 from google.genai import types
 from ..pymodels import FormattedChatMessage, ChatMessagePart
+from .model_backend import ModelBackend, get_model_backend
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCountConfig:
+    """Configuration for local token counting and remote verification."""
+
+    def __init__(self):
+        # "local" counts with the calibrated local tokenizer, "remote" calls count_tokens every time
+        self.mode = os.getenv("TOKEN_COUNT_MODE", "local")
+        self.cache_size = int(os.getenv("TOKEN_CACHE_SIZE", "20000"))
+
+        # Sampled verification against the model's own count_tokens
+        self.verify_sample_rate = float(os.getenv("TOKEN_VERIFY_SAMPLE_RATE", "0.02"))
+        self.verify_min_chars = int(os.getenv("TOKEN_VERIFY_MIN_CHARS", "200"))
+        self.initial_calibration = float(os.getenv("TOKEN_CALIBRATION", "1.0"))
+        self.calibration_alpha = float(os.getenv("TOKEN_CALIBRATION_ALPHA", "0.1"))
+
+
+class LocalTokenCounter:
+    """
+    Approximates the model tokenizer locally.
+
+    Text is split into pieces the way SentencePiece-style tokenizers tend to:
+    short ASCII words are one token, long words split every 8 letters, digits,
+    punctuation and non-ASCII characters count individually. The raw piece
+    count is scaled by a calibration factor learned from sampled remote counts.
+    Raw counts are cached in an LRU keyed by a hash of the text.
+    """
+
+    PIECE_PATTERN = re.compile(r"[A-Za-z]+|\d|\n+|[^\s]")
+
+    def __init__(self, config: Optional[TokenCountConfig] = None):
+        self.config = config or TokenCountConfig()
+        self.calibration = self.config.initial_calibration
+        self._cache: LRUCache = LRUCache(maxsize=self.config.cache_size)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def _tokenize_count(self, text: str) -> int:
+        count = 0
+        for piece in self.PIECE_PATTERN.findall(text):
+            if piece[0].isascii() and piece[0].isalpha():
+                count += 1 + (len(piece) - 1) // 8
+            else:
+                count += 1
+        return count
+
+    def raw_count(self, text: str) -> int:
+        """Uncalibrated piece count for text, served from the cache when possible."""
+        if not text:
+            return 0
+        key = self._key(text)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        count = self._tokenize_count(text)
+        self._cache[key] = count
+        return count
+
+    def count(self, text: str) -> int:
+        """Calibrated token count for text."""
+        raw = self.raw_count(text)
+        if raw == 0:
+            return 0
+        return max(1, round(raw * self.calibration))
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        """Calibrated token counts for many texts at once."""
+        return [self.count(text) for text in texts]
+
+    def calibrate(self, raw: int, remote: int) -> None:
+        """Move the calibration factor towards an observed remote/local ratio."""
+        if raw <= 0 or remote <= 0:
+            return
+        ratio = remote / raw
+        self.calibration += self.config.calibration_alpha * (ratio - self.calibration)
+        logger.debug(f"Token calibration raw={raw} remote={remote} factor={self.calibration:.3f}")
+
+
+# Shared across TokenService instances so the cache and calibration are process-wide
+local_token_counter = LocalTokenCounter()
 
 
 class TokenService:
     """Service for counting and managing tokens in messages."""
     
-    def __init__(self):
-        # Use the same client configuration as chat_service
-        project_ID = os.getenv("PROJECT_ID", "careful-aleph-452520-k9")
-        location = os.getenv("LOCATION", "us-central1")
-        self.client = genai.Client(vertexai=True, project=project_ID, location=location)
+    def __init__(self, backend: Optional[ModelBackend] = None, counter: Optional[LocalTokenCounter] = None):
+        # Share the process-wide model backend with chat_service
+        self.backend = backend or get_model_backend()
         self.model_name = os.getenv("RAVEN_MODEL", "gemini-2.5-flash")
+        self.counter = counter or local_token_counter
+        self._verification_tasks: set = set()
         
         # Token budgets from environment
         self.max_context_tokens = int(os.getenv("MAX_CONTEXT_TOKENS", "8000"))
         self.target_window_tokens = int(os.getenv("TARGET_WINDOW_TOKENS", "6000"))  # Leave room for response
     
+    def _maybe_verify(self, text: str) -> None:
+        """In a sampled fraction of calls, check the local count against the model in the background."""
+        config = self.counter.config
+        if len(text) < config.verify_min_chars or random.random() >= config.verify_sample_rate:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(self._verify(text))
+        except RuntimeError:
+            return  # No running loop; skip verification
+        self._verification_tasks.add(task)
+        task.add_done_callback(self._verification_tasks.discard)
+
+    async def _verify(self, text: str) -> None:
+        try:
+            remote = await self.backend.count_tokens(model=self.model_name, contents=[text])
+            self.counter.calibrate(self.counter.raw_count(text), remote)
+        except Exception as e:
+            logger.debug(f"Token count verification failed: {e}")
+
+    def _count_text_local(self, text: str) -> int:
+        self._maybe_verify(text)
+        return self.counter.count(text)
+
     async def count_message_tokens(self, message: FormattedChatMessage) -> int:
         """
         Count tokens for a single message including text and media.
@@ -48,14 +165,16 @@ class TokenService:
             
             if not content_parts:
                 return 0
+
+            if self.counter.config.mode != "remote":
+                return sum(self._count_text_local(part.text) for part in content_parts)
                 
-            # Count tokens using Google API
-            token_response = self.client.models.count_tokens(
+            # Count tokens using the model backend
+            total_tokens = await self.backend.count_tokens(
                 model=self.model_name,
                 contents=content_parts
             )
-            
-            total_tokens = int(token_response.total_tokens)
+
             print(f"DEBUG: Counted {total_tokens} tokens for message")
             return total_tokens
             
@@ -95,18 +214,14 @@ class TokenService:
     
     def _estimate_text_tokens(self, message: FormattedChatMessage) -> int:
         """
-        Fallback method to estimate tokens from text length.
-        Rough approximation: ~4 characters per token for English.
+        Fallback method to estimate tokens with the local counter.
         """
-        total_chars = 0
-        for part in message.parts:
-            if part.type == "text" and part.text:
-                total_chars += len(part.text)
-        
-        # Rough estimate: 4 characters ≈ 1 token
-        estimated_tokens = max(1, total_chars // 4)
-        print(f"DEBUG: Estimated {estimated_tokens} tokens from {total_chars} characters")
-        return estimated_tokens
+        estimated_tokens = sum(
+            self.counter.count(part.text)
+            for part in message.parts
+            if part.type == "text" and part.text
+        )
+        return max(1, estimated_tokens)
     
     def calculate_token_budget(self, messages: List[dict]) -> tuple[List[dict], int]:
         """
@@ -149,11 +264,35 @@ class TokenService:
         Returns:
             Total token count for the entire conversation
         """
-        total_tokens = 0
-        for message in messages:
-            tokens = await self.count_message_tokens(message)
-            total_tokens += tokens
-        return total_tokens
+        return sum(await self.count_messages_tokens(messages))
+
+    async def count_messages_tokens(self, messages: List[FormattedChatMessage]) -> List[int]:
+        """
+        Count tokens for many messages at once.
+        
+        Args:
+            messages: List of FormattedChatMessage objects
+            
+        Returns:
+            Token count per message, in the same order
+        """
+        return [await self.count_message_tokens(message) for message in messages]
+
+    async def count_texts_tokens(self, texts: List[str]) -> List[int]:
+        """
+        Count tokens for many plain texts at once.
+        
+        Args:
+            texts: Plain text strings
+            
+        Returns:
+            Token count per text, in the same order
+        """
+        if self.counter.config.mode == "remote":
+            return [await self.count_text_tokens(text) for text in texts]
+        for text in texts:
+            self._maybe_verify(text)
+        return self.counter.count_batch(texts)
     
     async def count_text_tokens(self, text: str) -> int:
         """
@@ -165,20 +304,20 @@ class TokenService:
         Returns:
             Token count for the text
         """
+        if self.counter.config.mode != "remote":
+            return self._count_text_local(text)
+
         try:
-            # Count tokens using Google API
-            token_response = self.client.models.count_tokens(
+            # Count tokens using the model backend
+            total_tokens = await self.backend.count_tokens(
                 model=self.model_name,
                 contents=[text]
             )
-            
-            total_tokens = int(token_response.total_tokens)
+
             print(f"DEBUG: Counted {total_tokens} tokens for text")
             return total_tokens
             
         except Exception as e:
             print(f"Error counting text tokens: {e}")
-            # Fallback: estimate based on text length
-            estimated_tokens = max(1, len(text) // 4)
-            print(f"DEBUG: Estimated {estimated_tokens} tokens from {len(text)} characters")
-            return estimated_tokens
+            # Fallback: estimate with the local counter
+            return max(1, self.counter.count(text))
@@ -0,0 +1,89 @@
+# backend/services/user_service.py
+"""
+Per-user profile and personalized system instruction cache.
+
+/chat needs the user's name only to personalize the system instruction, so the
+profile (including "no profile yet") and the finished instruction string are
+cached per user. Clerk user.created/user.updated webhooks invalidate the entry
+on this instance; the TTL bounds staleness on other instances. Personalized
+strings are tagged with the system instruction version they were built from
+and rebuilt once after the base instruction changes.
+"""
+
+import logging
+import os
+from typing import Optional, Tuple
+
+import asyncpg
+from cachetools import TTLCache
+
+from ..metrics import metrics
+from .system_service import system_service
+
+logger = logging.getLogger(__name__)
+
+PROFILE_QUERY = "SELECT email, first_name, last_name FROM users_raven WHERE id = $1"
+
+
+class UserProfileConfig:
+    """Configuration for the user profile cache."""
+
+    def __init__(self):
+        self.enabled = os.getenv("USER_PROFILE_CACHE_ENABLED", "true").lower() == "true"
+        self.max_users = int(os.getenv("USER_PROFILE_CACHE_SIZE", "10000"))
+        self.ttl_seconds = float(os.getenv("USER_PROFILE_CACHE_TTL_SECONDS", "900"))
+
+
+class CachedUserProfile:
+    """A user's profile row (None if missing) and the instruction built from it."""
+
+    def __init__(self, profile: Optional[dict]):
+        self.profile = profile
+        # (system instruction version, personalized instruction)
+        self.instruction: Optional[Tuple[int, str]] = None
+
+
+class UserProfileService:
+    """Cached users_raven lookups and personalized system instructions."""
+
+    def __init__(self, config: Optional[UserProfileConfig] = None):
+        self.config = config or UserProfileConfig()
+        self._entries: TTLCache = TTLCache(maxsize=self.config.max_users, ttl=self.config.ttl_seconds)
+        metrics.register_gauge("user_profile_cache.size", lambda: len(self._entries))
+
+    async def _entry(self, db: asyncpg.Connection, user_id: str) -> CachedUserProfile:
+        entry = self._entries.get(user_id) if self.config.enabled else None
+        if entry is not None:
+            metrics.inc("user_profile_cache.hits")
+            return entry
+
+        metrics.inc("user_profile_cache.misses")
+        row = await db.fetchrow(PROFILE_QUERY, user_id)
+        entry = CachedUserProfile(dict(row) if row else None)
+        if self.config.enabled:
+            self._entries[user_id] = entry
+        return entry
+
+    async def get_profile(self, db: asyncpg.Connection, user_id: str) -> Optional[dict]:
+        """The user's email/first_name/last_name, or None if the user has no profile row."""
+        return (await self._entry(db, user_id)).profile
+
+    async def get_personalized_instruction(self, db: asyncpg.Connection, user_id: str) -> str:
+        """The system instruction personalized for the user, rebuilt only when the profile or base changes."""
+        base_instruction = await system_service.get_system_instruction()
+        version = system_service.version
+        entry = await self._entry(db, user_id)
+        if entry.instruction is not None and entry.instruction[0] == version:
+            return entry.instruction[1]
+
+        personalized = system_service.personalize_for_user(base_instruction, entry.profile)
+        entry.instruction = (version, personalized)
+        return personalized
+
+    def invalidate(self, user_id: str) -> None:
+        """Forget the user's cached profile (e.g. after a Clerk user.updated webhook)."""
+        self._entries.pop(user_id, None)
+
+
+# Singleton instance
+user_profiles = UserProfileService()
@@ -0,0 +1,29 @@
+# backend/tests/conftest.py
+"""
+Shared test setup.
+
+Run from the repository root:
+    python -m pytest backend/tests
+
+Unit tests use FakeConnection and need no services. Tests marked with the
+`database` fixture run against the Postgres at DATABASE_URL (migrated to head)
+and are skipped when it is not set.
+"""
+
+import os
+
+import pytest
+
+# The backend reads these at import time; the unit tests never connect anywhere
+TEST_DATABASE_URL = os.getenv("DATABASE_URL")
+os.environ.setdefault("DATABASE_URL", "postgresql://postgres@localhost/raven_test")
+os.environ.setdefault("CLERK_WEBHOOK_SECRET", "whsec_dGVzdA==")
+os.environ.setdefault("MODEL_BACKEND", "stub")
+
+
+@pytest.fixture
+def database_url() -> str:
+    """DATABASE_URL of a migrated Postgres; skips the test when none is configured."""
+    if not TEST_DATABASE_URL:
+        pytest.skip("DATABASE_URL not set")
+    return TEST_DATABASE_URL
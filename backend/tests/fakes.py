@@ -0,0 +1,52 @@
+# backend/tests/fakes.py
+"""In-memory stand-ins for asyncpg used by the unit tests."""
+
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class _Transaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class FakeConnection:
+    """
+    Stands in for asyncpg.Connection and records every round trip.
+
+    `handler(method, query, args)` returns the result of each call (rows for
+    fetch, a row for fetchrow, a value for fetchval, a status for execute).
+    """
+
+    def __init__(self, handler: Optional[Callable[[str, str, tuple], Any]] = None):
+        self.handler = handler or (lambda method, query, args: None)
+        self.calls: List[Tuple[str, str, tuple]] = []
+
+    async def _call(self, method: str, query: str, args: tuple) -> Any:
+        self.calls.append((method, query, args))
+        return self.handler(method, query, args)
+
+    async def fetch(self, query: str, *args) -> Any:
+        return await self._call("fetch", query, args) or []
+
+    async def fetchrow(self, query: str, *args) -> Any:
+        return await self._call("fetchrow", query, args)
+
+    async def fetchval(self, query: str, *args) -> Any:
+        return await self._call("fetchval", query, args)
+
+    async def execute(self, query: str, *args) -> Any:
+        return await self._call("execute", query, args)
+
+    def transaction(self) -> _Transaction:
+        return _Transaction()
+
+    @property
+    def round_trips(self) -> int:
+        return len(self.calls)
+
+    @property
+    def queries(self) -> List[str]:
+        return [query for _, query, _ in self.calls]
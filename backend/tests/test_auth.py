@@ -0,0 +1,82 @@
+# backend/tests/test_auth.py
+"""Local session token verification against the fake Clerk issuer."""
+
+import asyncio
+
+import httpx
+import pytest
+
+from ..auth import AuthConfig, SessionVerifier, TokenVerificationError
+from .fake_issuer import FakeClerkIssuer
+
+
+def _verifier(issuer: FakeClerkIssuer):
+    """SessionVerifier fetching the issuer's JWKS, and the list of JWKS requests it makes."""
+    config = AuthConfig()
+    config.jwt_key = None
+    verifier = SessionVerifier(config)
+    requests = []
+    transport = issuer.transport()
+
+    def handler(request):
+        requests.append(request)
+        return transport.handle_request(request)
+
+    verifier.jwks.transport = httpx.MockTransport(handler)
+    return verifier, requests
+
+
+def test_verifies_token_and_caches_it():
+    issuer = FakeClerkIssuer()
+    verifier, requests = _verifier(issuer)
+    token = issuer.issue("user_1")
+
+    async def main():
+        return await verifier.verify(token), await verifier.verify(token)
+
+    assert asyncio.run(main()) == ("user_1", "user_1")
+    assert len(requests) == 1
+
+
+@pytest.mark.parametrize("claims", [{"ttl": -60}, {"azp": "https://evil.example"}], ids=["expired", "foreign_azp"])
+def test_rejects_invalid_tokens(claims):
+    issuer = FakeClerkIssuer()
+    verifier, _ = _verifier(issuer)
+    token = issuer.issue("user_1", **claims)
+
+    with pytest.raises(TokenVerificationError):
+        asyncio.run(verifier.verify(token))
+
+
+def test_rotated_key_triggers_one_refresh():
+    issuer = FakeClerkIssuer()
+    verifier, requests = _verifier(issuer)
+    verifier.config.min_refresh_interval_seconds = 0
+
+    async def main():
+        await verifier.verify(issuer.issue("user_1"))
+        issuer.rotate()
+        return await verifier.verify(issuer.issue("user_2"))
+
+    assert asyncio.run(main()) == "user_2"
+    assert len(requests) == 2
+
+
+def test_failed_refresh_is_rate_limited():
+    issuer = FakeClerkIssuer()
+    verifier, _ = _verifier(issuer)
+    attempts = []
+
+    def unavailable(request):
+        attempts.append(request)
+        return httpx.Response(503)
+
+    verifier.jwks.transport = httpx.MockTransport(unavailable)
+
+    async def main():
+        for _ in range(3):
+            with pytest.raises(TokenVerificationError):
+                await verifier.verify(issuer.issue("user_1"))
+
+    asyncio.run(main())
+    assert len(attempts) == 1
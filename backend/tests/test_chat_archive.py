@@ -0,0 +1,48 @@
+# backend/tests/test_chat_archive.py
+"""Archive eligibility: only outstanding summary jobs hold a chat back."""
+
+import asyncio
+import uuid
+
+import asyncpg
+import pytest
+
+from ..services.chat_archive import ARCHIVE_CANDIDATES_SQL, LOCK_CHAT_SQL
+
+USER_ID = "test-archive-user"
+
+
+async def _idle_chat_with_job(db: asyncpg.Connection, status: str) -> str:
+    chat_id = f"test-{uuid.uuid4()}"
+    await db.execute("INSERT INTO users (id) VALUES ($1) ON CONFLICT DO NOTHING", USER_ID)
+    await db.execute(
+        "INSERT INTO raven_chats (id, user_id, title, created_at, last_message_at) "
+        "VALUES ($1, $2, 'test', '1970-01-01', '1970-01-01')",
+        chat_id, USER_ID,
+    )
+    await db.execute(
+        "INSERT INTO summary_jobs (chat_id, user_id, status) VALUES ($1, $2, $3)", chat_id, USER_ID, status
+    )
+    return chat_id
+
+
+@pytest.mark.parametrize("status,archivable", [("failed", True), ("pending", False), ("running", False)])
+def test_only_outstanding_jobs_block_archival(database_url, status, archivable):
+    async def main():
+        db = await asyncpg.connect(database_url)
+        # Rolled back: nothing is left behind
+        transaction = db.transaction()
+        await transaction.start()
+        try:
+            chat_id = await _idle_chat_with_job(db, status)
+            candidates = await db.fetch(ARCHIVE_CANDIDATES_SQL, 1.0, 1000)
+            locked = await db.fetchval(LOCK_CHAT_SQL, chat_id)
+            return chat_id in {row['id'] for row in candidates}, locked is not None
+        finally:
+            await transaction.rollback()
+            await db.close()
+
+    candidate, lockable = asyncio.run(main())
+
+    assert candidate == archivable
+    assert lockable == archivable
@@ -0,0 +1,100 @@
+# backend/tests/test_chat_flights.py
+"""Idempotent /chat retries: a retry after a failed generation doesn't store the turn again."""
+
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import asyncpg
+
+from ..pymodels import ChatMessagePart, ChatRequest, FormattedChatMessage
+from ..routers import raven
+from ..services import chat_service
+from ..services.chat_flights import ChatFlightRegistry
+from ..services.model_backend import StubBackend, StubBackendConfig
+
+USER_ID = "test-flights-user"
+
+
+def test_retry_after_failed_generation_reuses_stored_turn(monkeypatch):
+    started = []
+    generated = []
+
+    async def start_chat_turn(chat_request, user_id, pool):
+        started.append(chat_request.chatId)
+        return chat_request.chatId
+
+    async def generate_stream(pool, chat_request, request, chat_id, user_id):
+        generated.append(chat_id)
+        if len(generated) == 1:
+            raise RuntimeError("model unavailable")
+        yield '{"text": "hi"}\n'
+
+    monkeypatch.setattr(raven, "chat_flights", ChatFlightRegistry())
+    monkeypatch.setattr(raven, "_start_chat_turn", start_chat_turn)
+    monkeypatch.setattr(raven, "generate_stream", generate_stream)
+    chat_request = ChatRequest(chatId="chat-1", idempotencyKey="send-1", messages=[
+        FormattedChatMessage(role="user", parts=[ChatMessagePart(text="hello", type="text")])
+    ])
+
+    async def send():
+        response = await raven.chat_endpoint(chat_request, SimpleNamespace(headers={}), "user-1", None)
+        return [chunk async for chunk in response.body_iterator]
+
+    async def main():
+        return await send(), await send()
+
+    first, retry = asyncio.run(main())
+
+    assert '"error"' in first[-1]
+    assert retry == ['{"text": "hi"}\n']
+    assert started == ["chat-1"]
+    assert generated == ["chat-1", "chat-1"]
+
+
+def test_retry_after_mid_stream_failure_stores_one_reply(database_url, monkeypatch):
+    config = StubBackendConfig()
+    config.time_to_first_token_ms = 0
+    config.tokens_per_second = 0
+    config.failure_rate = 1
+    config.failure_mode = "mid"
+    monkeypatch.setattr(chat_service, "model_backend", StubBackend(config))
+    monkeypatch.setattr(raven, "chat_flights", ChatFlightRegistry())
+    chat_id = f"test-{uuid.uuid4()}"
+    chat_request = ChatRequest(chatId=chat_id, idempotencyKey="send-1", messages=[
+        FormattedChatMessage(role="user", parts=[ChatMessagePart(text="hello", type="text")])
+    ])
+
+    async def main():
+        db = await asyncpg.connect(database_url)
+        pool = await asyncpg.create_pool(database_url, min_size=1, max_size=2)
+        try:
+            await db.execute("INSERT INTO users (id) VALUES ($1) ON CONFLICT DO NOTHING", USER_ID)
+            await db.execute(
+                "INSERT INTO raven_chats (id, user_id, title, created_at) VALUES ($1, $2, 'test', NOW())",
+                chat_id, USER_ID,
+            )
+
+            async def send():
+                response = await raven.chat_endpoint(chat_request, SimpleNamespace(headers={}), USER_ID, pool)
+                return [chunk async for chunk in response.body_iterator]
+
+            first = await send()
+            config.failure_rate = 0
+            retry = await send()
+            rows = await db.fetch(
+                "SELECT role FROM raven_messages WHERE chat_id = $1 ORDER BY timestamp, id", chat_id
+            )
+            return first, retry, [row['role'] for row in rows]
+        finally:
+            await pool.close()
+            await db.execute("DELETE FROM raven_messages WHERE chat_id = $1", chat_id)
+            await db.execute("DELETE FROM summary_jobs WHERE chat_id = $1", chat_id)
+            await db.execute("DELETE FROM raven_chats WHERE id = $1", chat_id)
+            await db.close()
+
+    first, retry, roles = asyncio.run(main())
+
+    assert '"error"' in first[-1]
+    assert not any('"error"' in chunk for chunk in retry)
+    assert roles == ["user", "assistant"]
@@ -0,0 +1,121 @@
+# backend/tests/test_chat_lifecycle.py
+"""Turns on deleted chats and the purge's final delete, against a real database."""
+
+import asyncio
+import uuid
+from datetime import datetime
+
+import asyncpg
+import pytest
+from fastapi import HTTPException
+
+from ..pymodels import ChatMessagePart, ChatRequest, FormattedChatMessage
+from ..routers.raven import _start_chat_turn
+from ..services.chat_purge import DELETE_CHAT_SQL
+from ..services.chat_service import add_messages_bulk
+from ..services.summary_service import SummaryService
+
+USER_ID = "test-lifecycle-user"
+OTHER_USER_ID = "test-lifecycle-other"
+
+
+async def _setup(db: asyncpg.Connection, user_id: str = USER_ID, deleted: bool = False) -> str:
+    chat_id = f"test-{uuid.uuid4()}"
+    await db.execute(
+        "INSERT INTO users (id) VALUES ($1), ($2) ON CONFLICT DO NOTHING", USER_ID, OTHER_USER_ID
+    )
+    await db.execute(
+        "INSERT INTO raven_chats (id, user_id, title, created_at, deleted_at) "
+        "VALUES ($1, $2, 'test', NOW(), CASE WHEN $3 THEN NOW() END)",
+        chat_id, user_id, deleted,
+    )
+    return chat_id
+
+
+async def _cleanup(db: asyncpg.Connection, chat_id: str) -> None:
+    await db.execute("DELETE FROM raven_messages WHERE chat_id = $1", chat_id)
+    await db.execute("DELETE FROM chat_summaries WHERE chat_id = $1", chat_id)
+    await db.execute("DELETE FROM summary_jobs WHERE chat_id = $1", chat_id)
+    await db.execute("DELETE FROM raven_chats WHERE id = $1", chat_id)
+
+
+def _run(database_url: str, scenario):
+    async def main():
+        db = await asyncpg.connect(database_url)
+        chat_ids = []
+        try:
+            return await scenario(db, chat_ids)
+        finally:
+            for chat_id in chat_ids:
+                await _cleanup(db, chat_id)
+            await db.close()
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("owner,deleted", [(USER_ID, True), (OTHER_USER_ID, False)], ids=["deleted", "foreign"])
+def test_insert_into_unwritable_chat_stores_nothing(database_url, owner, deleted):
+    async def scenario(db, chat_ids):
+        chat_id = await _setup(db, owner, deleted)
+        chat_ids.append(chat_id)
+
+        ids = await add_messages_bulk(db, chat_id, USER_ID, [{'role': 'user', 'content': 'hello'}])
+
+        assert ids == []
+        assert await db.fetchval("SELECT COUNT(*) FROM raven_messages WHERE chat_id = $1", chat_id) == 0
+        assert await db.fetchval("SELECT message_count FROM raven_chats WHERE id = $1", chat_id) == 0
+    _run(database_url, scenario)
+
+
+def test_turn_on_deleted_chat_is_404(database_url):
+    async def scenario(db, chat_ids):
+        chat_id = await _setup(db, deleted=True)
+        chat_ids.append(chat_id)
+        request = ChatRequest(chatId=chat_id, messages=[
+            FormattedChatMessage(role="user", parts=[ChatMessagePart(text="hello", type="text")])
+        ])
+        pool = await asyncpg.create_pool(database_url, min_size=1, max_size=1)
+        try:
+            with pytest.raises(HTTPException) as raised:
+                await _start_chat_turn(request, USER_ID, pool)
+        finally:
+            await pool.close()
+
+        assert raised.value.status_code == 404
+        assert await db.fetchval("SELECT COUNT(*) FROM raven_messages WHERE chat_id = $1", chat_id) == 0
+    _run(database_url, scenario)
+
+
+def test_purge_keeps_summaries_until_messages_are_gone(database_url):
+    async def scenario(db, chat_ids):
+        chat_id = await _setup(db)
+        chat_ids.append(chat_id)
+        await add_messages_bulk(db, chat_id, USER_ID, [{'role': 'user', 'content': 'hello', 'token_count': 1}])
+        await db.execute(
+            "INSERT INTO chat_summaries (chat_id, user_id, summary_text, version) VALUES ($1, $2, 's', 1)",
+            chat_id, USER_ID,
+        )
+        await db.execute("UPDATE raven_chats SET deleted_at = NOW() WHERE id = $1", chat_id)
+
+        # A message is still there: nothing may go yet
+        assert await db.execute(DELETE_CHAT_SQL, chat_id) == "DELETE 0"
+        assert await db.fetchval("SELECT COUNT(*) FROM chat_summaries WHERE chat_id = $1", chat_id) == 1
+
+        await db.execute("DELETE FROM raven_messages WHERE chat_id = $1", chat_id)
+        assert await db.execute(DELETE_CHAT_SQL, chat_id) == "DELETE 1"
+        assert await db.fetchval("SELECT COUNT(*) FROM chat_summaries WHERE chat_id = $1", chat_id) == 0
+    _run(database_url, scenario)
+
+
+@pytest.mark.parametrize("deleted", [False, True], ids=["live", "deleted"])
+def test_summary_saved_only_for_live_chat(database_url, deleted):
+    async def scenario(db, chat_ids):
+        chat_id = await _setup(db, deleted=deleted)
+        chat_ids.append(chat_id)
+
+        summary_id = await SummaryService().save_summary(
+            db, chat_id, USER_ID, "summary", datetime.now(), datetime.now(), 1
+        )
+
+        assert (summary_id is None) == deleted
+        assert await db.fetchval("SELECT COUNT(*) FROM chat_summaries WHERE chat_id = $1", chat_id) == (0 if deleted else 1)
+    _run(database_url, scenario)
@@ -0,0 +1,76 @@
+# backend/tests/test_context_queries.py
+"""Round trips of the pre-generation context fetch (cold and cached)."""
+
+import asyncio
+import json
+
+from ..services.message_service import MessageHistoryService, context_cache
+from .fakes import FakeConnection
+
+WINDOW_ROWS = [
+    {'id': 'm1', 'role': 'user', 'content': 'hello', 'media_type': None, 'media_url': None,
+     'token_count': 3, 'timestamp': 1700000000.0},
+    {'id': 'm2', 'role': 'model', 'content': 'hi there', 'media_type': None, 'media_url': None,
+     'token_count': 4, 'timestamp': 1700000001.0},
+]
+
+
+def _chat_handler(message_count: int = 2):
+    def handler(method, query, args):
+        if query == MessageHistoryService.CONTEXT_QUERY:
+            return {
+                'owned': True,
+                'archived': False,
+                'summary': None,
+                'message_count': message_count,
+                'total_tokens': 7,
+                'tokens_since_summary': 7,
+                'window_rows': json.dumps(WINDOW_ROWS),
+            }
+        if query == MessageHistoryService.CHAT_STATE_QUERY:
+            return {
+                'message_count': message_count,
+                'total_tokens': 7,
+                'tokens_since_last_summary': 7,
+                'summary_version': None,
+            }
+        raise AssertionError(f"unexpected {method}: {query}")
+    return handler
+
+
+def _context(db, chat_id):
+    return asyncio.run(MessageHistoryService.get_conversation_context(db, chat_id, "user-1", max_tokens=6000))
+
+
+def test_cold_context_fetch_is_one_round_trip():
+    context_cache.invalidate("chat-cold")
+    db = FakeConnection(_chat_handler())
+
+    messages, tokens = _context(db, "chat-cold")
+
+    assert db.queries == [MessageHistoryService.CONTEXT_QUERY]
+    assert [m.role for m in messages] == ["user", "model"]
+    assert tokens == 7
+
+
+def test_cache_hit_only_checks_chat_state():
+    context_cache.invalidate("chat-warm")
+    _context(FakeConnection(_chat_handler()), "chat-warm")
+
+    db = FakeConnection(_chat_handler())
+    messages, tokens = _context(db, "chat-warm")
+
+    assert db.queries == [MessageHistoryService.CHAT_STATE_QUERY]
+    assert [m.role for m in messages] == ["user", "model"]
+    assert tokens == 7
+
+
+def test_stale_cache_entry_refetches_once():
+    context_cache.invalidate("chat-stale")
+    _context(FakeConnection(_chat_handler(message_count=2)), "chat-stale")
+
+    # Another instance wrote to the chat: the counters no longer match the cached window
+    db = FakeConnection(_chat_handler(message_count=3))
+    _context(db, "chat-stale")
+
+    assert db.queries == [MessageHistoryService.CHAT_STATE_QUERY, MessageHistoryService.CONTEXT_QUERY]
@@ -0,0 +1,65 @@
+# backend/tests/test_model_backend.py
+"""VertexBackend maps a cache miss to CachedContentExpiredError, however the SDK surfaces it."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from google.genai import errors
+
+from ..services.model_backend import CachedContentExpiredError, VertexBackend
+
+
+def _not_found() -> errors.ClientError:
+    return errors.ClientError(404, SimpleNamespace(body_segments=[{"error": {
+        "code": 404, "message": "Cached content not found", "status": "NOT_FOUND",
+    }}]))
+
+
+class _FailingStream:
+    """Async iterator that yields `texts`, then raises a 404 (as the lazy SDK stream does)."""
+
+    def __init__(self, texts):
+        self.texts = list(texts)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.texts:
+            return SimpleNamespace(text=self.texts.pop(0))
+        raise _not_found()
+
+
+def _backend(texts) -> VertexBackend:
+    async def generate_content_stream(**kwargs):
+        return _FailingStream(texts)
+
+    backend = VertexBackend.__new__(VertexBackend)
+    backend.client = SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(
+        generate_content_stream=generate_content_stream,
+    )))
+    return backend
+
+
+async def _collect(backend: VertexBackend, cached_content=None) -> list:
+    stream = backend.stream(model="gemini", contents=[], cached_content=cached_content)
+    return [text async for text in stream]
+
+
+def test_cache_miss_on_first_chunk_raises_cache_expired():
+    with pytest.raises(CachedContentExpiredError):
+        asyncio.run(_collect(_backend([]), cached_content="cachedContents/expired"))
+
+
+def test_not_found_without_cache_is_not_mapped():
+    with pytest.raises(errors.ClientError) as raised:
+        asyncio.run(_collect(_backend([])))
+    assert not isinstance(raised.value, CachedContentExpiredError)
+
+
+def test_error_after_first_chunk_is_not_mapped():
+    # Part of the reply has already streamed; resending without the cache would duplicate it
+    with pytest.raises(errors.ClientError) as raised:
+        asyncio.run(_collect(_backend(["Hello"]), cached_content="cachedContents/expired"))
+    assert not isinstance(raised.value, CachedContentExpiredError)
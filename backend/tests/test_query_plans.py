@@ -0,0 +1,102 @@
+# backend/tests/test_query_plans.py
+"""
+Hot queries are served by their indexes.
+
+Runs EXPLAIN against the database at DATABASE_URL (migrated to head). Test
+databases are usually too small for the planner to prefer an index on its own,
+so sequential and bitmap scans are disabled for the session. Every scan of a
+listed table must then be an Index Scan / Index Only Scan of one of the
+expected indexes: with the intended index missing or no longer matching the
+query, the planner falls back to a full scan of some other index instead.
+"""
+
+import asyncio
+import json
+from datetime import datetime
+
+import asyncpg
+import pytest
+
+from ..routers.raven import (
+    CHAT_PAGE_AFTER_CURSOR_SQL,
+    CHAT_PAGE_SQL,
+    MESSAGE_PAGE_AFTER_CURSOR_SQL,
+    MESSAGE_PAGE_SQL,
+)
+from ..services.chat_purge import MESSAGE_BATCH_SQL, PURGE_CANDIDATES_SQL, SHARED_MEDIA_SQL
+from ..services.message_service import MessageHistoryService
+from ..services.token_accounting import PENDING_SWEEP_SQL
+
+CURSOR = datetime(2026, 1, 1)
+
+CHAT_BY_ID = {"raven_chats_pkey", "ix_raven_chats_id"}
+LATEST_SUMMARY = {"ix_chat_summaries_chat_user_version"}
+MESSAGES_BY_CHAT = {"ix_raven_messages_chat_timestamp"}
+
+# (name, query, args, {table: indexes any scan of it may use})
+QUERIES = [
+    ("context", MessageHistoryService.CONTEXT_QUERY, ("chat-1", "user-1", 6000, 500),
+     {"raven_messages": MESSAGES_BY_CHAT, "raven_chats": CHAT_BY_ID, "chat_summaries": LATEST_SUMMARY}),
+    ("chat_state", MessageHistoryService.CHAT_STATE_QUERY, ("chat-1", "user-1"),
+     {"raven_chats": CHAT_BY_ID, "chat_summaries": LATEST_SUMMARY}),
+    ("chat_page", CHAT_PAGE_SQL, ("user-1", 51),
+     {"raven_chats": {"ix_raven_chats_user_created"}}),
+    ("chat_page_cursor", CHAT_PAGE_AFTER_CURSOR_SQL, ("user-1", CURSOR, "chat-1", 51),
+     {"raven_chats": {"ix_raven_chats_user_created"}}),
+    ("message_page", MESSAGE_PAGE_SQL, ("chat-1", 101),
+     {"raven_messages": MESSAGES_BY_CHAT}),
+    ("message_page_cursor", MESSAGE_PAGE_AFTER_CURSOR_SQL, ("chat-1", CURSOR, "m-1", 101),
+     {"raven_messages": MESSAGES_BY_CHAT}),
+    ("pending_tokens", PENDING_SWEEP_SQL, (30, 100),
+     {"raven_messages": {"ix_raven_messages_pending_tokens"}}),
+    ("purge_candidates", PURGE_CANDIDATES_SQL, (300.0, 10),
+     {"raven_chats": {"ix_raven_chats_deleted"}}),
+    ("purge_batch", MESSAGE_BATCH_SQL, ("chat-1", 500),
+     {"raven_messages": MESSAGES_BY_CHAT | {"raven_messages_pkey"}}),
+    ("purge_shared_media", SHARED_MEDIA_SQL, (["gs://bucket/uploads/a.png"], "chat-1"),
+     {"raven_messages": {"ix_raven_messages_media_url"}}),
+]
+
+# Partition indexes (raven_messages_p3_timestamp_idx, ...) -> the partitioned index they belong to
+PARENT_INDEX_SQL = """
+    SELECT child.relname AS index_name, parent.relname AS parent_name
+    FROM pg_inherits i
+    JOIN pg_class child ON child.oid = i.inhrelid
+    JOIN pg_class parent ON parent.oid = i.inhparent
+    WHERE child.relkind = 'i'
+"""
+
+
+def _scans(plan: dict):
+    """(table, plan node) for every scan in a plan; partitions map to their parent table."""
+    if "Relation Name" in plan:
+        relation = plan["Relation Name"]
+        if relation.startswith("raven_messages_p"):
+            relation = "raven_messages"
+        yield relation, plan
+    for child in plan.get("Plans", []):
+        yield from _scans(child)
+
+
+async def _explain(database_url: str, query: str, args: tuple):
+    db = await asyncpg.connect(database_url, statement_cache_size=0)
+    try:
+        parents = {row['index_name']: row['parent_name'] for row in await db.fetch(PARENT_INDEX_SQL)}
+        await db.execute("SET enable_seqscan = off")
+        await db.execute("SET enable_bitmapscan = off")
+        plan = await db.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *args)
+    finally:
+        await db.close()
+    return list(_scans(json.loads(plan)[0]["Plan"])), parents
+
+
+@pytest.mark.parametrize("name,query,args,expected", QUERIES, ids=[q[0] for q in QUERIES])
+def test_hot_query_uses_indexes(database_url, name, query, args, expected):
+    scans, parents = asyncio.run(_explain(database_url, query, args))
+
+    checked = [(table, node) for table, node in scans if table in expected]
+    assert checked, f"{name}: no scan of {sorted(expected)} in plan"
+    for table, node in checked:
+        assert node["Node Type"] in ("Index Scan", "Index Only Scan"), f"{name}: {node['Node Type']} on {table}"
+        index = parents.get(node["Index Name"], node["Index Name"])
+        assert index in expected[table], f"{name}: {table} scanned via {index}, expected one of {sorted(expected[table])}"
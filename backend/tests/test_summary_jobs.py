@@ -0,0 +1,108 @@
+# backend/tests/test_summary_jobs.py
+"""Summary jobs: bounded folds, and waiting for more messages instead of completing."""
+
+import asyncio
+import uuid
+
+import asyncpg
+
+from ..services.chat_service import add_messages_bulk
+from ..services.summary_jobs import ENQUEUE_SQL, SummaryJobService
+
+USER_ID = "test-summary-user"
+
+# Claims one specific job the way CLAIM_SQL would, so other queued jobs are left alone
+CLAIM_JOB_SQL = """
+    UPDATE summary_jobs SET status = 'running', attempts = attempts + 1, started_at = NOW()
+    WHERE id = $1
+    RETURNING id, chat_id, user_id, attempts
+"""
+
+
+async def _chat_with_messages(db: asyncpg.Connection, count: int) -> str:
+    chat_id = f"test-{uuid.uuid4()}"
+    await db.execute("INSERT INTO users (id) VALUES ($1) ON CONFLICT DO NOTHING", USER_ID)
+    await db.execute(
+        "INSERT INTO raven_chats (id, user_id, title, created_at) VALUES ($1, $2, 'test', NOW())",
+        chat_id, USER_ID,
+    )
+    await add_messages_bulk(db, chat_id, USER_ID, [
+        {'role': 'user' if i % 2 == 0 else 'model', 'content': f"message {i}", 'token_count': 10}
+        for i in range(count)
+    ])
+    return chat_id
+
+
+def _run_job(database_url: str, message_count: int, **config):
+    """Queue and run one summary job for a fresh chat; returns (job row or None, latest summary or None)."""
+    async def main():
+        pool = await asyncpg.create_pool(database_url, min_size=1, max_size=2)
+        jobs = SummaryJobService()
+        jobs._pool = pool
+        for name, value in config.items():
+            target = jobs.summary_service.config if hasattr(jobs.summary_service.config, name) else jobs.config
+            setattr(target, name, value)
+        async with pool.acquire() as db:
+            chat_id = await _chat_with_messages(db, message_count)
+        try:
+            async with pool.acquire() as db:
+                job_id = await db.fetchval(ENQUEUE_SQL, chat_id, USER_ID)
+                job = await db.fetchrow(CLAIM_JOB_SQL, job_id)
+            await jobs._run(job)
+            async with pool.acquire() as db:
+                job = await db.fetchrow(
+                    "SELECT status, attempts, run_after > NOW() AS waiting FROM summary_jobs WHERE id = $1", job_id
+                )
+                summary = await db.fetchrow(
+                    "SELECT messages_summarized, end_message_timestamp FROM chat_summaries WHERE chat_id = $1", chat_id
+                )
+                last_folded = await db.fetchval(
+                    "SELECT content FROM raven_messages WHERE chat_id = $1 AND timestamp = $2",
+                    chat_id, summary['end_message_timestamp'] if summary else None,
+                )
+            return job, summary, last_folded
+        finally:
+            async with pool.acquire() as db:
+                for table in ("summary_jobs", "chat_summaries", "raven_messages"):
+                    await db.execute(f"DELETE FROM {table} WHERE chat_id = $1", chat_id)
+                await db.execute("DELETE FROM raven_chats WHERE id = $1", chat_id)
+            await pool.close()
+    return asyncio.run(main())
+
+
+def test_first_summary_folds_at_most_a_page(database_url):
+    job, summary, last_folded = _run_job(
+        database_url, 40, min_messages_to_summarize=4, keep_recent_messages=5, max_messages_per_update=6
+    )
+
+    assert job is None
+    assert summary['messages_summarized'] == 6
+    assert last_folded == "message 5"
+
+
+def test_first_summary_keeps_recent_messages_out(database_url):
+    job, summary, last_folded = _run_job(
+        database_url, 12, min_messages_to_summarize=4, keep_recent_messages=5, max_messages_per_update=200
+    )
+
+    assert job is None
+    assert summary['messages_summarized'] == 7
+    assert last_folded == "message 6"
+
+
+def test_job_without_enough_messages_waits(database_url):
+    job, summary, _ = _run_job(database_url, 8, min_messages_to_summarize=10, keep_recent_messages=5)
+
+    assert summary is None
+    assert job['status'] == 'pending'
+    assert job['attempts'] == 0
+    assert job['waiting']
+
+
+def test_job_gives_up_waiting_after_max_defer(database_url):
+    job, summary, _ = _run_job(
+        database_url, 8, min_messages_to_summarize=10, keep_recent_messages=5, max_defer_seconds=0
+    )
+
+    assert summary is None
+    assert job is None
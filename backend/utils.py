@@ -70,3 +70,36 @@ def convert_storage_path(input_path, output_format='gs_uri'):
         result = input_path  # Return original if format not recognized
     
     return result
+
+
+def encode_cursor(timestamp, row_id):
+    """
+    Encode a keyset pagination position (timestamp + id of the last row served)
+    as an opaque, URL-safe cursor string.
+    """
+    import base64
+    import json
+    payload = json.dumps({"t": timestamp.isoformat(), "id": row_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor.
+    
+    Returns:
+        tuple: (timestamp as datetime, id)
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    import base64
+    import binascii
+    import json
+    from datetime import datetime
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["t"]), str(payload["id"])
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
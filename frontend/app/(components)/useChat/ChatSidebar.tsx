@@ -18,11 +18,14 @@ interface SidebarProps {
   deleteChat: (chatId: string, currentChatId: string | null) => void;
   renameChat: (chatId: string, newTitle: string) => void;
   fetchChats?: ()  => Promise<void>;
+  loadMoreChats?: () => Promise<void>;
+  hasMoreChats?: boolean;
+  isMoreChatsLoading?: boolean;
   selectedChatId: string | null;
   disableNewChatButton: boolean;
 }
 
-export function ChatSidebar({ chats, createNewChat, deleteChat, renameChat, selectedChatId, disableNewChatButton }: SidebarProps) {
+export function ChatSidebar({ chats, createNewChat, deleteChat, renameChat, selectedChatId, disableNewChatButton, loadMoreChats, hasMoreChats, isMoreChatsLoading }: SidebarProps) {
   const [open, setOpen] = React.useState(false);
   const { user } = useUser();
   const [editingChatId, setEditingChatId] = useState<string | null>(null);
@@ -163,6 +166,17 @@ export function ChatSidebar({ chats, createNewChat, deleteChat, renameChat, sele
                 {/* Edit and Delete Buttons */}
               </div>
             ))}
+
+            {/* Older chats (the list is paginated) */}
+            {hasMoreChats && loadMoreChats && (
+              <button
+                onClick={loadMoreChats}
+                disabled={isMoreChatsLoading}
+                className="p-2 rounded-md text-sm text-neutral-500 hover:bg-gray-200 transition disabled:opacity-50"
+              >
+                {isMoreChatsLoading ? 'Loading…' : 'Load more chats'}
+              </button>
+            )}
           </div>
         </div>
 
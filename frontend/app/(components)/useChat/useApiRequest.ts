@@ -10,6 +10,7 @@ interface ApiRequestOptions {
   body?: any;
   shouldAuthorize?: boolean;
   contentType?: string;
+  onResponse?: (response: Response) => void; // e.g. to read pagination headers
 }
 
 export const useApiRequest = () => {
@@ -18,7 +19,7 @@ export const useApiRequest = () => {
     const [error, setError] = useState<string | null>(null);
     const [abortController, setAbortController] = useState<AbortController | null>(null);
 
-    const makeRequest = useCallback(async <T>({ method, path, body, shouldAuthorize = true, contentType }: ApiRequestOptions): Promise<T | null> => {
+    const makeRequest = useCallback(async <T>({ method, path, body, shouldAuthorize = true, contentType, onResponse }: ApiRequestOptions): Promise<T | null> => {
         setLoading(true);
         setError(null);
 
@@ -58,6 +59,8 @@ export const useApiRequest = () => {
                 throw new Error(errorData.detail || response.statusText);
             }
 
+            onResponse?.(response);
+
             if (response.status === 204) { // No Content
                 return null;
             }
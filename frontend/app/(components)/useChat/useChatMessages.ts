@@ -9,6 +9,25 @@ import { useChatState } from './useChatState';
 import { useMediaUpload } from './useMediaUpload';
 import { BASE_URL } from './constants';
 
+// History rows from GET /api/chats/{chat_id} as chat messages (chronological)
+const formatMessages = (data: any[]): FormattedChatMessage[] =>
+  data.map((message: any) => {
+      const parts: ChatMessagePart[] = [];
+      if (message.content && message.content.trim() !== "") {
+          parts.push({ text: message.content.replace(/\\n/g, '\n'), type: 'text' });
+      }
+      // Use media_type to determine the type
+      if (message.media_url && message.media_type) {
+          const [mediaCategory] = message.media_type.split('/');
+          parts.push({ type: mediaCategory as ChatMessagePart["type"], text: message.media_url });
+      }
+      return {
+          role: message.role,
+          parts: parts,
+          id: message.messageId,
+      };
+  });
+
 export const useChatMessages = () => {
   const { makeRequest, loading: isMessagesLoading, error: messagesError, abortController } = useApiRequest();
   const [messages, setMessages] = useState<FormattedChatMessage[]>([]);
@@ -25,30 +44,25 @@ export const useChatMessages = () => {
       }
   }, []);
 
+  // Older pages of the current chat, newest first; X-Next-Cursor of the last page loaded
+  const { makeRequest: makePageRequest, loading: isOlderMessagesLoading } = useApiRequest();
+  const [olderMessagesCursor, setOlderMessagesCursor] = useState<string | null>(null);
+  const loadedChatId = useRef<string | null>(null);
+
   const loadChatMessages = useCallback(async (chatId: string) => {
       setMessages([]);
-      console.log(isMessagesLoading);
-      const data = await makeRequest<any[]>({ method: 'GET', path: `/api/chats/${chatId}` });
-      console.log(isMessagesLoading);
+      setOlderMessagesCursor(null);
+      loadedChatId.current = chatId;
+      let nextCursor: string | null = null;
+      const data = await makeRequest<any[]>({
+          method: 'GET',
+          path: `/api/chats/${chatId}`,
+          onResponse: (response) => { nextCursor = response.headers.get('X-Next-Cursor'); },
+      });
       if (data) {
-          const formattedMessages: FormattedChatMessage[] = data.map((message: any) => {
-              const parts: ChatMessagePart[] = [];
-              if (message.content && message.content.trim() !== "") {
-                  parts.push({ text: message.content.replace(/\\n/g, '\n'), type: 'text' });
-              }
-              // Use media_type to determine the type
-              if (message.media_url && message.media_type) {
-                  const [mediaCategory] = message.media_type.split('/');
-                  parts.push({ type: mediaCategory as ChatMessagePart["type"], text: message.media_url });
-              }
-              return {
-                  role: message.role,
-                  parts: parts,
-                  id: message.messageId,
-              };
-          });
           if (isMounted.current) {
-              setMessages(formattedMessages);
+              setMessages(formatMessages(data));
+              setOlderMessagesCursor(nextCursor);
           }
       } else {
           if (isMounted.current) {
@@ -57,6 +71,22 @@ export const useChatMessages = () => {
       }
   }, [router]);
 
+  const loadOlderMessages = useCallback(async () => {
+      const chatId = loadedChatId.current;
+      if (!chatId || !olderMessagesCursor || isOlderMessagesLoading) return;
+      let nextCursor: string | null = null;
+      const data = await makePageRequest<any[]>({
+          method: 'GET',
+          path: `/api/chats/${chatId}?cursor=${encodeURIComponent(olderMessagesCursor)}`,
+          onResponse: (response) => { nextCursor = response.headers.get('X-Next-Cursor'); },
+      });
+      // Ignore a page that arrives after switching to another chat
+      if (data && isMounted.current && loadedChatId.current === chatId) {
+          setMessages(prevMessages => [...formatMessages(data), ...prevMessages]);
+          setOlderMessagesCursor(nextCursor);
+      }
+  }, [olderMessagesCursor, isOlderMessagesLoading, makePageRequest]);
+
   const submitMessage = useCallback(
       async (text: string, mediaFiles: File[]) => {
         const newUserMessage: FormattedChatMessage = {
@@ -213,5 +243,8 @@ export const useChatMessages = () => {
 
   }, [messages, abortController, uploadMedia, getToken, selectedChatId]);
 
-  return { messages, setMessages, loadChatMessages, submitMessage, isMessagesLoading, messagesError };
+  return {
+    messages, setMessages, loadChatMessages, submitMessage, isMessagesLoading, messagesError,
+    loadOlderMessages, hasOlderMessages: olderMessagesCursor !== null, isOlderMessagesLoading,
+  };
 };
\ No newline at end of file
@@ -20,15 +20,39 @@ export const useChats = () => {
   const router = useRouter();
   const { setInput } = useChatState();
   const { setMessages } = useChatMessages();
+  // Older chats are loaded page by page; X-Next-Cursor of the last page loaded
+  const { makeRequest: makePageRequest, loading: isMoreChatsLoading } = useApiRequest();
+  const [chatsCursor, setChatsCursor] = useState<string | null>(null);
 
 
   const fetchChats = useCallback(async () => {
-      const data = await makeRequest<Chat[]>({ method: 'GET', path: '/api/chats' });
+      let nextCursor: string | null = null;
+      const data = await makeRequest<Chat[]>({
+          method: 'GET',
+          path: '/api/chats',
+          onResponse: (response) => { nextCursor = response.headers.get('X-Next-Cursor'); },
+      });
       if (data) {
           setChats(data);
+          setChatsCursor(nextCursor);
       }
   }, [makeRequest]);
 
+  const loadMoreChats = useCallback(async () => {
+      if (!chatsCursor || isMoreChatsLoading) return;
+      let nextCursor: string | null = null;
+      const data = await makePageRequest<Chat[]>({
+          method: 'GET',
+          path: `/api/chats?cursor=${encodeURIComponent(chatsCursor)}`,
+          onResponse: (response) => { nextCursor = response.headers.get('X-Next-Cursor'); },
+      });
+      if (data) {
+          // Skip chats already listed (e.g. created locally since the first page)
+          setChats(prevChats => [...prevChats, ...data.filter(chat => !prevChats.some(c => c.chatId === chat.chatId))]);
+          setChatsCursor(nextCursor);
+      }
+  }, [chatsCursor, isMoreChatsLoading, makePageRequest]);
+
   const createNewChat = useCallback(async () => {
       setMessages([]); // Clear messages when creating a new chat
       setInput('');
@@ -73,5 +97,8 @@ export const useChats = () => {
       }
   }, [setChats, makeRequest]);
 
-  return { chats, setChats, fetchChats, createNewChat, deleteChat, renameChat, isChatsLoading, chatsError };
+  return {
+    chats, setChats, fetchChats, createNewChat, deleteChat, renameChat, isChatsLoading, chatsError,
+    loadMoreChats, hasMoreChats: chatsCursor !== null, isMoreChatsLoading,
+  };
 };
\ No newline at end of file
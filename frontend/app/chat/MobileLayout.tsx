@@ -12,6 +12,9 @@ interface MobileLayoutProps {
     deleteChat: (chatId: string, currentChatId: string | null) => void;
     renameChat: (chatId: string, newName: string) => void;
     fetchChats: ()  => Promise<void>;
+    loadMoreChats: () => Promise<void>;
+    hasMoreChats: boolean;
+    isMoreChatsLoading: boolean;
     selectedChatId: string | null;
     disableNewChatButton: boolean;
 }
@@ -23,6 +26,9 @@ const MobileLayout: React.FC<MobileLayoutProps> = ({
     deleteChat,
     renameChat,
     fetchChats,
+    loadMoreChats,
+    hasMoreChats,
+    isMoreChatsLoading,
     selectedChatId,
     disableNewChatButton,
 }) => {
@@ -36,6 +42,9 @@ const MobileLayout: React.FC<MobileLayoutProps> = ({
                     deleteChat={deleteChat}
                     renameChat={renameChat}
                     fetchChats={fetchChats}
+                    loadMoreChats={loadMoreChats}
+                    hasMoreChats={hasMoreChats}
+                    isMoreChatsLoading={isMoreChatsLoading}
                     selectedChatId={selectedChatId}
                     disableNewChatButton={disableNewChatButton}
                 />
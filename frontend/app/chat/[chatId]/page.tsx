@@ -23,7 +23,9 @@ export default function ChatPage() {
   const { user } = useUser();
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const { input, setInput, isLoading, isGenerating, setIsGenerating, error, selectedChatId, setSelectedChatId } = useChatState();
-  const { messages, loadChatMessages, submitMessage, isMessagesLoading } = useChatMessages();
+  const { messages, loadChatMessages, submitMessage, isMessagesLoading, loadOlderMessages, hasOlderMessages, isOlderMessagesLoading } = useChatMessages();
+  // Follow the newest message (new turns and streaming chunks), not pages of older history
+  const lastMessage = messages[messages.length - 1];
 
   const handleFormSubmit = async (event: React.FormEvent, mediaFiles: File[]) => {
     event.preventDefault();
@@ -35,12 +37,12 @@ export default function ChatPage() {
   };
 
   useEffect(() => {
-    if (!isMessagesLoading && messages.length > 0 && messagesEndRef.current) {
+    if (!isMessagesLoading && lastMessage && messagesEndRef.current) {
         requestAnimationFrame(() => {
             messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
         });
     }
-  }, [messages, isMessagesLoading]);
+  }, [lastMessage, isMessagesLoading]);
 
   useEffect(() => {
     setSelectedChatId(chatId);
@@ -108,6 +110,18 @@ export default function ChatPage() {
 
       <div className="w-full sm:max-w-3xl mx-auto flex-grow relative">
         <div className={`flex flex-col absolute top-0 left-0 right-1 bottom-[1rem] overflow-y-auto ${showTitle ? 'hidden' : ''}`}>
+        {/* History is paginated newest first: older pages load on demand */}
+        {hasOlderMessages && (
+          <div className="flex justify-center my-2">
+            <button
+              onClick={loadOlderMessages}
+              disabled={isOlderMessagesLoading}
+              className="px-3 py-1 rounded-md text-sm text-neutral-400 hover:bg-neutral-800 transition disabled:opacity-50"
+            >
+              {isOlderMessagesLoading ? 'Loading…' : 'Load older messages'}
+            </button>
+          </div>
+        )}
         {messages.map((message) => {
             const mediaParts = message.parts.filter((part) => part.type !== 'text' && part.type !== undefined);
             const textContent = message.parts
@@ -21,7 +21,7 @@ export default function RavenLayout({ children }: LayoutProps) {
     const { isLoaded, isSignedIn } = useUser();
     const [isMobile, setIsMobile] = useState(false);
     const { selectedChatId } = useChatState();
-    const { chats, createNewChat, deleteChat, renameChat, fetchChats } = useChats();
+    const { chats, createNewChat, deleteChat, renameChat, fetchChats, loadMoreChats, hasMoreChats, isMoreChatsLoading } = useChats();
     const { messages, loadChatMessages } = useChatMessages();
 
     // --- COMBINED INITIAL LOAD AND CHAT LOADING ---
@@ -75,6 +75,9 @@ export default function RavenLayout({ children }: LayoutProps) {
                 deleteChat={deleteChat}
                 renameChat={renameChat}
                 fetchChats={fetchChats}
+                loadMoreChats={loadMoreChats}
+                hasMoreChats={hasMoreChats}
+                isMoreChatsLoading={isMoreChatsLoading}
                 selectedChatId={selectedChatId}
                 disableNewChatButton={disableNewChatButton}
             >
@@ -86,7 +89,7 @@ export default function RavenLayout({ children }: LayoutProps) {
 
     return (
             <div className="z-10 flex h-screen bg-[#09090b] text-black">
-            <ChatSidebar disableNewChatButton={disableNewChatButton} chats={chats} createNewChat={createNewChat} deleteChat={deleteChat} renameChat={renameChat} selectedChatId={selectedChatId} />
+            <ChatSidebar disableNewChatButton={disableNewChatButton} chats={chats} createNewChat={createNewChat} deleteChat={deleteChat} renameChat={renameChat} selectedChatId={selectedChatId} loadMoreChats={loadMoreChats} hasMoreChats={hasMoreChats} isMoreChatsLoading={isMoreChatsLoading} />
             <div className="flex flex-col flex-grow">
                 <Navbar title="Raven" />
                 <main className="flex-grow bg-[#09090b]">